@@ -0,0 +1,127 @@
+import math
+import threading
+import time
+
+# 过载降级档位：(名称, 推理后端, 相对耗时系数)，按代价从高到低排列
+# 推理后端为 None 表示使用配置的默认后端（VSR_BACKEND）；耗时系数为经验值（可根据实际测试数据调整）
+# 注：减小 max_seq_len 只降低显存峰值，逐帧耗时基本不变，因此不作为降低延迟的档位
+DEGRADE_TIERS = [
+    ('full', None, 1.0),
+    ('half', 'mmagic_fp16', 0.6),          # 已加载的模型改用 fp16 autocast 推理，仅 GPU 可用
+    ('fast', 'bicubic_sharpen', 0.02),     # 双三次 ×4 + 锐化
+]
+OVERLOAD_POLICIES = ('degrade', 'reject')
+
+
+class Overloaded(Exception):
+    """任务无法在截止时间内完成且不允许降级"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def get_tier(name):
+    for tier in DEGRADE_TIERS:
+        if tier[0] == name:
+            return tier
+    raise ValueError(f"未知档位: {name}")
+
+
+class AdmissionController:
+    """
+    准入控制：根据排队/执行中任务的剩余预估耗时和新任务自身的预估耗时，预测新任务的完成时间
+    - 能在截止时间内完成：按完整档位接收
+    - 不能完成且策略为 degrade：依次尝试更便宜的档位，选第一个能满足截止时间的（都不满足时用最便宜的）
+    - 不能完成且策略为 reject：抛出 Overloaded，附带建议的 Retry-After 秒数
+    """
+
+    def __init__(self, workers=1, tier_available=None):
+        """
+        Args:
+            workers (int): 并行处理任务的 worker 数
+            tier_available (callable): tier_available(tier_name) -> bool，判断档位在当前部署是否可用
+        """
+        self.workers = max(1, workers)
+        self.tier_available = tier_available or (lambda name: True)
+        self.lock = threading.Lock()
+        self.jobs = {}  # task_id: {"estimate": 预估耗时(s), "started": 开始时间或 None}
+
+    def backlog_seconds(self):
+        """排队和执行中任务的剩余预估耗时（按 worker 数均摊）"""
+        now = time.time()
+        with self.lock:
+            remaining = 0.0
+            for job in self.jobs.values():
+                elapsed = now - job["started"] if job["started"] else 0.0
+                remaining += max(0.0, job["estimate"] - elapsed)
+        return remaining / self.workers
+
+    def queue_depth(self):
+        """排队等待（尚未开始）的任务数"""
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job["started"] is None)
+
+    def active_jobs(self):
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job["started"] is not None)
+
+    def admit(self, task_id, base_estimate, deadline=None, policy='degrade'):
+        """
+        Args:
+            task_id (str): 任务 ID
+            base_estimate (float): 完整档位下的预估耗时（秒），来自 estimate_sr_time
+            deadline (float): 从现在起的截止时间（秒），None 表示不限
+            policy (str): 'degrade' 或 'reject'
+        Returns:
+            tuple: (档位名称, 推理后端, 该档位预估耗时, 预测完成时间(秒))
+        Raises:
+            Overloaded: 策略为 reject 且完整档位无法按时完成
+        """
+        backlog = self.backlog_seconds()
+        tiers = [tier for tier in DEGRADE_TIERS if tier[0] == 'full' or self.tier_available(tier[0])]
+        if policy == 'reject':
+            tiers = tiers[:1]
+
+        chosen = None
+        for name, backend, factor in tiers:
+            estimate = base_estimate * factor
+            chosen = (name, backend, estimate, backlog + estimate)
+            if deadline is None or backlog + estimate <= deadline:
+                break
+        else:
+            if policy == 'reject':
+                raise Overloaded(max(1, int(math.ceil(backlog + base_estimate - deadline))))
+
+        with self.lock:
+            self.jobs[task_id] = {"estimate": chosen[2], "started": None}
+        return chosen
+
+    def start(self, task_id):
+        with self.lock:
+            if task_id in self.jobs:
+                self.jobs[task_id]["started"] = time.time()
+
+    def finish(self, task_id):
+        with self.lock:
+            self.jobs.pop(task_id, None)
+
+
+def parse_admission_params(params):
+    """
+    从请求参数中解析准入控制参数
+    Args:
+        params: request.form / request.json 等类字典对象
+    Returns:
+        tuple: (deadline, policy)，deadline 为从现在起的截止时间（秒），未提供时为 None
+    Raises:
+        ValueError: 参数非法
+    """
+    deadline = params.get('deadline')
+    deadline = float(deadline) if deadline not in (None, '') else None
+    if deadline is not None and deadline <= 0:
+        raise ValueError("deadline must be positive")
+    policy = params.get('overload') or 'degrade'
+    if policy not in OVERLOAD_POLICIES:
+        raise ValueError(f"overload must be one of {', '.join(OVERLOAD_POLICIES)}")
+    return deadline, policy
@@ -0,0 +1,107 @@
+# benchmarks/bench_cpu_fast.py
+# 对比两个推理后端（默认 mmagic 与 cpu_fast）在同一段视频上的推理帧率和画质差异：
+# - fps：按任务的实际推理路径（SRBackend.infer_clip：流式推理与窗口间延续的状态，或逐窗口推理）计时，
+#   不含解码和写帧，取多次运行的中位数
+# - PSNR(候选 vs 基准)：两者输出之间的 PSNR，衡量 bf16/channels_last 等优化带来的数值偏差
+# - 给出 GT 时另外计算两者相对 GT 的 PSNR 及其差值
+#
+# 用法:
+#   python benchmarks/bench_cpu_fast.py --video lr.mp4 --gt gt.mp4
+#   VSR_CPU_THREADS=8 VSR_CPU_AFFINITY=0-7 python benchmarks/bench_cpu_fast.py --frames 30 --output cpu_fast.json
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from psnr_calculator import read_video_frames, compute_psnr
+from sr_backends import BACKENDS, PROPAGATION, CARRY_STATE, get_backend
+from bench_pipeline import RESOLUTIONS, WORK_DIR, make_synthetic_video
+
+
+def run_backend(backend, frames, max_seq_len, repeat):
+    """按窗口推理整段片段，返回 (fps 中位数, 输出帧)；第一个窗口先跑一遍预热（torch.compile 等的首次开销不计入）"""
+    frames = np.stack(frames)
+    backend.infer_clip(frames[:max_seq_len], max_seq_len)
+    times = []
+    outputs = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = backend.infer_clip(frames, max_seq_len)
+        times.append(time.perf_counter() - start)
+    return len(frames) / statistics.median(times), list(outputs)
+
+
+def mean_psnr(refs, targets):
+    return float(np.mean([compute_psnr(ref, target) for ref, target in zip(refs, targets)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare inference fps and PSNR of two backends')
+    parser.add_argument('--video', type=str, default='', help='LR clip (default: synthetic 270p clip)')
+    parser.add_argument('--gt', type=str, default='', help='Optional GT (x4) clip for absolute PSNR')
+    parser.add_argument('--baseline', type=str, default='mmagic', choices=list(BACKENDS))
+    parser.add_argument('--candidate', type=str, default='cpu_fast', choices=list(BACKENDS))
+    parser.add_argument('--frames', type=int, default=20, help='Number of frames to run')
+    parser.add_argument('--max_seq_len', type=int, default=10, help='Inference window length')
+    parser.add_argument('--repeat', type=int, default=3, help='Measured runs (median is reported)')
+    parser.add_argument('--output', type=str, default='', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    video, gt = args.video, args.gt
+    if not video:
+        WORK_DIR.mkdir(parents=True, exist_ok=True)
+        width, height = RESOLUTIONS['270p']
+        gt_path, lr_path = make_synthetic_video(WORK_DIR, f"270p_{args.frames}f", width, height, args.frames)
+        video, gt = str(lr_path), gt or str(gt_path)
+    frames = read_video_frames(video)[:args.frames]
+    if len(frames) == 0:
+        raise ValueError(f"无法读取视频帧: {video}")
+    gt_frames = read_video_frames(gt)[:len(frames)] if gt else None
+
+    results = {}
+    outputs = {}
+    for name in (args.baseline, args.candidate):
+        print(f"🔧 {name} ...")
+        fps, outputs[name] = run_backend(get_backend(name), frames, args.max_seq_len, args.repeat)
+        results[name] = {"fps": fps}
+        if gt_frames:
+            results[name]["psnr_gt"] = mean_psnr(gt_frames, outputs[name])
+
+    report = {
+        "video": video,
+        "frames": len(frames),
+        "resolution": f"{frames[0].shape[1]}x{frames[0].shape[0]}",
+        "max_seq_len": args.max_seq_len,
+        "propagation": PROPAGATION,
+        "carry_state": CARRY_STATE,
+        "threads": os.environ.get('VSR_CPU_THREADS', ''),
+        "affinity": os.environ.get('VSR_CPU_AFFINITY', ''),
+        "backends": results,
+        "speedup": results[args.candidate]["fps"] / results[args.baseline]["fps"],
+        "psnr_candidate_vs_baseline": mean_psnr(outputs[args.baseline], outputs[args.candidate]),
+    }
+    if gt_frames:
+        report["psnr_gt_delta"] = results[args.candidate]["psnr_gt"] - results[args.baseline]["psnr_gt"]
+
+    for name, r in results.items():
+        gt_text = f", PSNR(vs GT)={r['psnr_gt']:.2f} dB" if 'psnr_gt' in r else ''
+        print(f"   {name:<16} {r['fps']:8.2f} fps{gt_text}")
+    print(f"   加速比 {report['speedup']:.2f}x，PSNR({args.candidate} vs {args.baseline}) = "
+          f"{report['psnr_candidate_vs_baseline']:.2f} dB"
+          + (f"，相对 GT 的 PSNR 变化 {report['psnr_gt_delta']:+.3f} dB" if gt_frames else ''))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# benchmarks/bench_pipeline.py
+# 分阶段流水线基准测试：合成不同分辨率/长度的测试视频，分别计时
+# probe / decode / inference / frame_write / encode / psnr 各阶段，结果写成 JSON，便于不同提交之间对比
+#
+# 用法:
+#   python benchmarks/bench_pipeline.py --backend bicubic --resolutions 270p 540p --lengths 30 90
+#   python benchmarks/compare_bench.py <基准.json> <当前.json>
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import statistics
+import datetime
+from pathlib import Path
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from video_io import frames_to_video, get_video_info
+from psnr_calculator import read_video_frames, calculate_psnr
+from sr_backends import BACKEND, BACKENDS, LOOKAHEAD, CAUSAL_STEP, get_backend, write_frames
+
+RESOLUTIONS = {'270p': (480, 270), '540p': (960, 540), '720p': (1280, 720)}  # LR 输入分辨率
+DEFAULT_LENGTHS = (30, 90)  # 帧数
+FPS = 25
+SCALE = 4
+STAGES = ('probe', 'decode', 'inference', 'frame_write', 'encode', 'psnr')
+# 另外整体计时一次 backend.process_video（解码/推理/写帧三级流水线重叠执行），与 decode+inference+frame_write 对比
+PIPELINED_STAGE = 'pipelined_sr'
+WORK_DIR = ROOT_DIR / 'benchmarks' / 'work'
+RESULT_DIR = ROOT_DIR / 'benchmarks' / 'results'
+
+
+def _ffmpeg(args):
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error'] + args
+    proc = subprocess.run(cmd)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg 执行失败: {' '.join(cmd)}")
+
+
+def make_synthetic_video(out_dir, name, width, height, frames):
+    """
+    合成测试视频：先生成 ×4 的 GT（testsrc2 运动图案），再双三次 ×4 降采样得到 LR
+    （降采样方式与 tools_270p/compress_x4LR.py 相同）；已存在时直接复用
+    Returns:
+        tuple: (gt_path, lr_path)
+    """
+    gt_path = out_dir / f"{name}_gt.mp4"
+    lr_path = out_dir / f"{name}_lr.mp4"
+    if not gt_path.exists():
+        _ffmpeg(['-f', 'lavfi', '-i', f"testsrc2=size={width * SCALE}x{height * SCALE}:rate={FPS}",
+                 '-frames:v', str(frames), '-c:v', 'libx264', '-crf', '18', '-preset', 'ultrafast',
+                 '-pix_fmt', 'yuv420p', str(gt_path)])
+    if not lr_path.exists():
+        _ffmpeg(['-i', str(gt_path), '-vf', f"scale={width}:{height}:flags=bicubic",
+                 '-c:v', 'libx264', '-crf', '18', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', str(lr_path)])
+    return gt_path, lr_path
+
+
+def run_once(backend, gt_path, lr_path, work_dir, max_seq_len):
+    """跑一遍完整流水线，返回 ({阶段: 耗时(s)}, sr_psnr)"""
+    stages = {}
+    sr_dir = work_dir / 'sr_frames'
+    shutil.rmtree(sr_dir, ignore_errors=True)
+    sr_dir.mkdir(parents=True)
+
+    t0 = time.perf_counter()
+    get_video_info(str(lr_path))
+    stages['probe'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    frames = read_video_frames(str(lr_path))
+    stages['decode'] = time.perf_counter() - t0
+
+    # 与 process_video 相同的推理路径（流式推理/窗口间延续状态，或逐窗口 infer_tiled）
+    t0 = time.perf_counter()
+    sr_frames = backend.infer_clip(np.stack(frames), max_seq_len)
+    stages['inference'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    write_frames(sr_frames, str(sr_dir))
+    stages['frame_write'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    frames_to_video(str(sr_dir), str(work_dir / 'sr.mp4'), fps=FPS)
+    stages['encode'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    psnr = calculate_psnr(str(gt_path), str(sr_dir))
+    stages['psnr'] = time.perf_counter() - t0
+
+    pipelined_dir = work_dir / 'sr_pipelined'
+    shutil.rmtree(pipelined_dir, ignore_errors=True)
+    t0 = time.perf_counter()
+    backend.process_video(str(lr_path), str(pipelined_dir), max_seq_len=max_seq_len)
+    stages[PIPELINED_STAGE] = time.perf_counter() - t0
+    return stages, float(psnr)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage pipeline benchmark')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=list(BACKENDS), help='Inference backend')
+    parser.add_argument('--resolutions', type=str, nargs='+', default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument('--lengths', type=int, nargs='+', default=list(DEFAULT_LENGTHS), help='Clip lengths (frames)')
+    parser.add_argument('--max_seq_len', type=int, default=10, help='Inference window length')
+    parser.add_argument('--repeat', type=int, default=3, help='Measured runs per case (median is reported)')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured warm-up runs per case')
+    parser.add_argument('--output', type=str, default='', help='Output JSON path')
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    output = Path(args.output) if args.output else RESULT_DIR / f"pipeline_{commit}_{args.backend}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+
+    backend = get_backend(args.backend)
+    report = {
+        "meta": {
+            "commit": commit,
+            "backend": args.backend,
+            "device": getattr(backend, 'device', 'cpu'),
+            "max_seq_len": args.max_seq_len,
+            "propagation": backend.propagation,
+            "carry_state": backend.carry_state,
+            "lookahead": LOOKAHEAD,
+            "causal_step": CAUSAL_STEP,
+            "tile_size": backend.tile_size,
+            "repeat": args.repeat,
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+        },
+        "results": [],
+    }
+
+    for res_name in args.resolutions:
+        width, height = RESOLUTIONS[res_name]
+        for length in args.lengths:
+            case = f"{res_name}_{length}f"
+            print(f"🔧 {case} ({width}x{height}, {length} 帧)")
+            gt_path, lr_path = make_synthetic_video(WORK_DIR, case, width, height, length)
+            runs = []
+            psnr = None
+            for i in range(args.warmup + args.repeat):
+                stages, psnr = run_once(backend, gt_path, lr_path, WORK_DIR / case, args.max_seq_len)
+                if i >= args.warmup:
+                    runs.append(stages)
+            median = {stage: statistics.median(run[stage] for run in runs) for stage in STAGES}
+            total = sum(median.values())
+            report["results"].append({
+                "case": case,
+                "resolution": f"{width}x{height}",
+                "frames": length,
+                "stages": median,
+                "total": total,
+                PIPELINED_STAGE: statistics.median(run[PIPELINED_STAGE] for run in runs),
+                "fps": length / total if total > 0 else None,
+                "psnr": psnr,
+                "runs": runs,
+            })
+            print("   " + "  ".join(f"{stage}={median[stage]:.3f}s" for stage in STAGES) + f"  PSNR={psnr:.2f}dB")
+            serial = median['decode'] + median['inference'] + median['frame_write']
+            print(f"   {PIPELINED_STAGE}={report['results'][-1][PIPELINED_STAGE]:.3f}s"
+                  f"（串行 decode+inference+frame_write={serial:.3f}s）")
+            shutil.rmtree(WORK_DIR / case, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# benchmarks/causal_latency.py
+# 低延迟（causal）传播的延迟/画质权衡：对同一片段分别用
+#   - bidirectional：每 W 帧一个独立窗口的完整双向传播（当前默认行为）
+#   - causal：每步输出 step 帧、反向传播只看其后 lookahead 帧、正向状态在步之间延续
+# 推理并记录每一步的耗时，再按片段帧率模拟实时到达的输入：第 j 帧在 j/fps 秒到达，一步在其所需的最后一帧到达
+# 且上一步完成后开始，帧的延迟 = 输出它的那一步完成的时刻 - 该帧到达的时刻；同时计算相对 GT 的 PSNR，
+# 以及相对整段一次性双向传播（离线最佳）输出的 PSNR；causal 配置另外记录 SPyNet 光流的计算/复用次数（FlowCache，lookahead 为 0 时不缓存）
+#
+# 用法（需要 mmagic 系列后端）:
+#   python benchmarks/causal_latency.py --backend mmagic --lookaheads 0 1 2 4 8 --steps 1 4 --windows 10 40
+#   python benchmarks/causal_latency.py --lr lr.mp4 --gt gt.mp4 --fps 25
+import sys
+import json
+import time
+import argparse
+import datetime
+from pathlib import Path
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from video_io import probe_video
+from psnr_calculator import read_video_frames
+from sr_backends import BACKEND, BACKENDS, get_backend
+from bench_pipeline import RESOLUTIONS, WORK_DIR, RESULT_DIR, make_synthetic_video, _git_commit
+from sweep import mean_psnr
+
+DEFAULT_LOOKAHEADS = (0, 1, 2, 4, 8)
+DEFAULT_STEPS = (1, 4)
+DEFAULT_WINDOWS = (10, 40)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    outputs = fn(*args)
+    return outputs, time.perf_counter() - start
+
+
+def run_bidirectional(backend, frames, window):
+    """返回 (输出帧, [(所需的最后一帧下标, 输出帧数, 耗时), ...])"""
+    outputs, steps = [], []
+    for i in range(0, len(frames), window):
+        sr, seconds = _timed(backend.infer_tiled, frames[i:i + window])
+        outputs.append(sr)
+        steps.append((min(i + window, len(frames)) - 1, len(sr), seconds))
+    return np.concatenate(outputs), steps
+
+
+def run_causal(backend, frames, step, lookahead):
+    """逐帧推入流式推理，返回 (输出帧, 各步, 光流缓存统计)"""
+    stream = backend.open_stream(step=step, lookahead=lookahead)
+    outputs, steps = [], []
+    for j in range(len(frames)):
+        emitted, seconds = _timed(stream.push, frames[j:j + 1])
+        if emitted:
+            outputs += emitted
+            steps.append((j, sum(len(sr) for sr in emitted), seconds))
+    emitted, seconds = _timed(stream.flush)  # 最后几帧没有足够的前瞻帧，在输入结束后输出
+    if emitted:
+        outputs += emitted
+        steps.append((len(frames) - 1, sum(len(sr) for sr in emitted), seconds))
+    flows = {"flows_computed": stream.flows_computed, "flows_reused": stream.flows_reused}
+    return np.concatenate(outputs), steps, flows
+
+
+def simulate_latency(steps, fps):
+    """按实时到达模拟每帧的延迟（秒）"""
+    latencies = []
+    finish = 0.0
+    index = 0
+    for needed, count, seconds in steps:
+        finish = max(needed / fps, finish) + seconds
+        latencies += [finish - (index + k) / fps for k in range(count)]
+        index += count
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency / quality trade-off of causal vs bidirectional propagation')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=list(BACKENDS))
+    parser.add_argument('--lr', type=str, default='', help='LR clip (default: synthetic 270p clip)')
+    parser.add_argument('--gt', type=str, default='', help='GT clip for --lr')
+    parser.add_argument('--frames', type=int, default=40, help='Frames to use')
+    parser.add_argument('--fps', type=float, default=0, help='Arrival frame rate (default: clip frame rate)')
+    parser.add_argument('--lookaheads', type=int, nargs='+', default=list(DEFAULT_LOOKAHEADS))
+    parser.add_argument('--steps', type=int, nargs='+', default=list(DEFAULT_STEPS), help='Frames emitted per causal step')
+    parser.add_argument('--windows', type=int, nargs='+', default=list(DEFAULT_WINDOWS), help='Bidirectional window lengths')
+    parser.add_argument('--output', type=str, default='', help='Result JSON (default: benchmarks/results/causal_<commit>_<backend>.json)')
+    args = parser.parse_args()
+
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    RESULT_DIR.mkdir(parents=True, exist_ok=True)
+    if args.lr:
+        if not args.gt:
+            parser.error("--gt is required with --lr")
+        gt_path, lr_path = args.gt, args.lr
+    else:
+        width, height = RESOLUTIONS['270p']
+        gt_path, lr_path = (str(p) for p in make_synthetic_video(WORK_DIR, f"270p_{args.frames}f", width, height, args.frames))
+    frames = np.stack(read_video_frames(lr_path)[:args.frames])
+    gt_frames = read_video_frames(gt_path)[:len(frames)]
+    fps = args.fps or probe_video(lr_path).fps
+
+    backend = get_backend(args.backend)
+    if backend.open_stream() is None:
+        print(f"❌ {args.backend} 后端没有循环传播，不支持 causal 模式（请使用 mmagic / mmagic_fp16 / cpu_fast）")
+        return 1
+    backend.infer_tiled(frames[:min(len(frames), 5)])  # 预热
+    offline, _ = run_bidirectional(backend, frames, len(frames))
+
+    configs = [("bidirectional", {"window": w}) for w in args.windows]
+    configs += [("causal", {"step": s, "lookahead": la}) for s in args.steps for la in args.lookaheads]
+    results = []
+    for mode, params in configs:
+        print(f"🔧 {mode} {params} ...")
+        flows = {}
+        if mode == 'bidirectional':
+            outputs, steps = run_bidirectional(backend, frames, params["window"])
+            delay = params["window"] - 1
+        else:
+            outputs, steps, flows = run_causal(backend, frames, params["step"], params["lookahead"])
+            delay = params["step"] + params["lookahead"] - 1
+        latencies = simulate_latency(steps, fps)
+        compute = sum(seconds for _, _, seconds in steps)
+        results.append(dict(
+            params, **flows, mode=mode,
+            delay_frames=delay,  # 算法延迟：一帧到达后还需等待的帧数
+            latency_mean=float(latencies.mean()), latency_p95=float(np.percentile(latencies, 95)),
+            latency_max=float(latencies.max()),
+            fps=len(frames) / compute, realtime=len(frames) / compute >= fps,
+            psnr=mean_psnr(gt_frames, outputs), psnr_vs_offline=mean_psnr(offline, outputs),
+        ))
+
+    print(f"\n{'mode':<14}{'params':<24}{'delay':>6}{'lat(s)':>9}{'p95(s)':>9}{'fps':>8}{'PSNR':>8}{'vs off':>8}")
+    for r in results:
+        params = ', '.join(f"{k}={r[k]}" for k in ('window', 'step', 'lookahead') if k in r)
+        print(f"{r['mode']:<14}{params:<24}{r['delay_frames']:>6}{r['latency_mean']:>9.2f}{r['latency_p95']:>9.2f}"
+              f"{r['fps']:>8.2f}{r['psnr']:>8.2f}{r['psnr_vs_offline']:>8.2f}" + ("" if r["realtime"] else "  (慢于实时)"))
+    print(f"延迟按 {fps:g} fps 实时到达模拟；慢于实时的配置延迟会随片段长度持续增长")
+
+    output = args.output or str(RESULT_DIR / f"causal_{_git_commit()}_{args.backend}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            "meta": {
+                "commit": _git_commit(), "backend": args.backend, "device": getattr(backend, 'device', 'cpu'),
+                "time": datetime.datetime.now().isoformat(timespec='seconds'),
+                "clip": lr_path, "frames": len(frames), "fps": fps,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"📄 已保存: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# benchmarks/compare_bench.py
+# 对比两次 bench_pipeline.py 的 JSON 结果，找出各阶段的性能回退
+#
+# 用法:
+#   python benchmarks/compare_bench.py <基准.json> <当前.json> [--threshold 0.1] [--min_delta 0.01]
+# 任一阶段耗时增加超过 threshold（相对）且超过 min_delta 秒（绝对）时判为回退，退出码为 1
+import sys
+import json
+import argparse
+
+# bench_pipeline.py 记录的推理路径配置，不同时 inference 阶段测的不是同一条路径
+PATH_KEYS = ('propagation', 'carry_state', 'lookahead', 'causal_step', 'tile_size')
+
+
+def load_results(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report["meta"], {r["case"]: r for r in report["results"]}
+
+
+def compare(base, current, threshold=0.1, min_delta=0.01):
+    """
+    Returns:
+        list[tuple]: [(case, stage, 基准耗时, 当前耗时, 相对变化, 是否回退), ...]
+    """
+    rows = []
+    for case in sorted(set(base) & set(current)):
+        base_stages = dict(base[case]["stages"], total=base[case]["total"])
+        cur_stages = dict(current[case]["stages"], total=current[case]["total"])
+        for key in ('pipelined_sr',):
+            if key in base[case] and key in current[case]:
+                base_stages[key], cur_stages[key] = base[case][key], current[case][key]
+        for stage in base_stages:
+            if stage not in cur_stages:
+                continue
+            old, new = base_stages[stage], cur_stages[stage]
+            change = (new - old) / old if old > 0 else 0.0
+            regressed = change > threshold and new - old > min_delta
+            rows.append((case, stage, old, new, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two pipeline benchmark results')
+    parser.add_argument('base', type=str, help='Baseline JSON')
+    parser.add_argument('current', type=str, help='Current JSON')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown treated as regression')
+    parser.add_argument('--min_delta', type=float, default=0.01, help='Absolute slowdown (s) below which changes are ignored')
+    args = parser.parse_args()
+
+    base_meta, base = load_results(args.base)
+    cur_meta, current = load_results(args.current)
+    print(f"基准: {base_meta['commit']} ({base_meta['backend']}, {base_meta['device']})")
+    print(f"当前: {cur_meta['commit']} ({cur_meta['backend']}, {cur_meta['device']})")
+    changed = [key for key in PATH_KEYS if base_meta.get(key) != cur_meta.get(key)]
+    if changed:
+        print(f"⚠️ 两次结果的推理路径配置不同（{', '.join(changed)}），inference 阶段的耗时不能直接比较")
+    missing = sorted(set(base) ^ set(current))
+    if missing:
+        print(f"⚠️ 两次结果的测试用例不一致，跳过: {', '.join(missing)}")
+
+    rows = compare(base, current, args.threshold, args.min_delta)
+    print(f"{'case':<14}{'stage':<13}{'base(s)':>10}{'current(s)':>12}{'change':>10}")
+    for case, stage, old, new, change, regressed in rows:
+        flag = '  ❌ 回退' if regressed else ''
+        print(f"{case:<14}{stage:<13}{old:>10.3f}{new:>12.3f}{change:>+10.1%}{flag}")
+
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"❌ 发现 {len(regressions)} 处性能回退")
+        sys.exit(1)
+    print("✅ 未发现性能回退")
+
+
+if __name__ == "__main__":
+    main()
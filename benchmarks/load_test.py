@@ -0,0 +1,221 @@
+# benchmarks/load_test.py
+# 超分 API 压测：按给定到达率（开环）或并发数（闭环）循环提交一组视频到 /api/upload_video，
+# 通过 /api/progress 跟踪每个任务直到结束，统计吞吐量以及排队/完成延迟的 p50/p95/p99
+#
+# 用法:
+#   # 服务端用替身后端启动: VSR_BACKEND=bicubic python video_sr_server.py
+#   python benchmarks/load_test.py --clips a.mp4 b.mp4 --rate 0.5 --requests 40
+#   python benchmarks/load_test.py --clips a.mp4 --concurrency 4 --duration 300 --output load.json
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import concurrent.futures
+import requests
+
+API_URL = "http://localhost:6001"
+FINAL_STATUSES = ('done',)
+
+
+def percentile(values, p):
+    """线性插值百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def _upload(url, clip, form, timeout):
+    with open(clip, 'rb') as f:
+        return requests.post(f"{url}/api/upload_video", files={'file': (os.path.basename(clip), f, 'video/mp4')},
+                             data=form, timeout=timeout)
+
+
+def _get_json(url, timeout):
+    return requests.get(url, timeout=timeout).json()
+
+
+def _queued_seconds(url, task_id, timeout):
+    """从 /api/tasks/<id>/trace 读取服务端记录的排队时长（精确值），失败时返回 None"""
+    try:
+        trace = _get_json(f"{url}/api/tasks/{task_id}/trace", timeout)
+    except (requests.RequestException, ValueError):
+        return None
+    for event in trace.get("traceEvents", []):
+        if event.get("ph") == "X" and event.get("cat") == "stage" and event.get("name") == "queued":
+            return event["dur"] / 1e6
+    return None
+
+
+async def run_task(index, clip, args, t0):
+    """提交一个任务并跟踪到结束，返回该任务的记录"""
+    record = {"index": index, "clip": clip, "submit_at": time.time() - t0}
+    submit = time.time()
+    try:
+        response = await asyncio.to_thread(_upload, args.url, clip, args.form, args.timeout)
+    except requests.RequestException as e:
+        record.update(outcome="http_error", error=str(e))
+        return record
+    record["upload_latency"] = time.time() - submit
+    record["http_status"] = response.status_code
+    if response.status_code == 503:
+        record.update(outcome="rejected", retry_after=response.json().get("retry_after"))
+        return record
+    if response.status_code != 200:
+        record.update(outcome="http_error", error=response.text[:200])
+        return record
+    body = response.json()
+    task_id = body["task_id"]
+    record.update(task_id=task_id, tier=body.get("tier"), estimated_time=body.get("estimated_time"))
+
+    # 轮询进度：第一次看到非 queued 状态的时间作为排队时长的估计（之后用 trace 中的精确值覆盖）
+    started = None
+    while True:
+        await asyncio.sleep(args.poll_interval)
+        try:
+            progress = await asyncio.to_thread(_get_json, f"{args.url}/api/progress/{task_id}", args.timeout)
+        except (requests.RequestException, ValueError):
+            continue
+        status = progress.get("status", "")
+        now = time.time()
+        if started is None and status != "queued":
+            started = now
+        if status in FINAL_STATUSES or status.startswith("error"):
+            break
+        if now - submit > args.task_timeout:
+            status = "timeout"
+            break
+    record["completion_latency"] = now - submit
+    record["queue_latency"] = (started - submit) if started else None
+    record["outcome"] = "done" if status in FINAL_STATUSES else ("timeout" if status == "timeout" else "error")
+    if record["outcome"] == "error":
+        record["error"] = status
+    exact = await asyncio.to_thread(_queued_seconds, args.url, task_id, args.timeout)
+    if exact is not None:
+        record["queue_latency"] = exact
+    return record
+
+
+async def open_loop(args, clips, t0):
+    """开环：按泊松过程（或固定间隔）以 --rate 的到达率提交，不等待之前的任务"""
+    tasks = []
+    index = 0
+    while (args.requests and index < args.requests) or (args.duration and time.time() - t0 < args.duration):
+        tasks.append(asyncio.create_task(run_task(index, clips[index % len(clips)], args, t0)))
+        index += 1
+        interval = random.expovariate(args.rate) if args.arrival == 'poisson' else 1.0 / args.rate
+        await asyncio.sleep(interval)
+    return await asyncio.gather(*tasks)
+
+
+async def closed_loop(args, clips, t0):
+    """闭环：--concurrency 个客户端，每个客户端在上一个任务结束后立即提交下一个"""
+    counter = iter(range(sys.maxsize))
+    records = []
+
+    async def client():
+        while True:
+            index = next(counter)
+            if args.requests and index >= args.requests:
+                return
+            if args.duration and time.time() - t0 >= args.duration:
+                return
+            records.append(await run_task(index, clips[index % len(clips)], args, t0))
+
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    return records
+
+
+def summarize(records, wall_time):
+    def stats(key):
+        values = [r[key] for r in records if r.get("outcome") == "done" and r.get(key) is not None]
+        return {f"p{p}": percentile(values, p) for p in (50, 95, 99)} | {
+            "mean": sum(values) / len(values) if values else None, "max": max(values) if values else None}
+
+    outcomes = {}
+    tiers = {}
+    for r in records:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+        if r.get("outcome") == "done":
+            tiers[r.get("tier")] = tiers.get(r.get("tier"), 0) + 1
+    done = outcomes.get("done", 0)
+    return {
+        "requests": len(records),
+        "outcomes": outcomes,
+        "tiers": tiers,
+        "wall_time": wall_time,
+        "throughput_tasks_per_min": done / wall_time * 60 if wall_time > 0 else None,
+        "upload_latency": stats("upload_latency"),
+        "queue_latency": stats("queue_latency"),
+        "completion_latency": stats("completion_latency"),
+    }
+
+
+def _fmt(value):
+    return f"{value:8.2f}" if value is not None else "       -"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for the SR API')
+    parser.add_argument('--url', type=str, default=API_URL, help='Server base URL')
+    parser.add_argument('--clips', type=str, nargs='+', required=True, help='MP4 clips, submitted round-robin')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--rate', type=float, help='Open loop: arrivals per second')
+    mode.add_argument('--concurrency', type=int, help='Closed loop: number of concurrent clients')
+    parser.add_argument('--arrival', type=str, default='poisson', choices=['poisson', 'fixed'], help='Open-loop arrival process')
+    parser.add_argument('--requests', type=int, default=0, help='Total number of tasks to submit')
+    parser.add_argument('--duration', type=float, default=0, help='Stop submitting after this many seconds')
+    parser.add_argument('--max_seq_len', type=str, default='', help='Forwarded as the max_seq_len form field')
+    parser.add_argument('--deadline', type=str, default='', help='Forwarded as the deadline form field')
+    parser.add_argument('--overload', type=str, default='', choices=['', 'degrade', 'reject'], help='Forwarded as the overload form field')
+    parser.add_argument('--poll_interval', type=float, default=0.5, help='Seconds between /api/progress polls')
+    parser.add_argument('--timeout', type=float, default=60, help='HTTP timeout (s)')
+    parser.add_argument('--task_timeout', type=float, default=3600, help='Give up tracking a task after this many seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for arrival times')
+    parser.add_argument('--output', type=str, default='', help='Write summary and per-task records to this JSON file')
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        parser.error("one of --requests / --duration is required")
+    for clip in args.clips:
+        if not os.path.isfile(clip):
+            parser.error(f"clip not found: {clip}")
+    args.form = {k: getattr(args, k) for k in ('max_seq_len', 'deadline', 'overload') if getattr(args, k)}
+    random.seed(args.seed)
+
+    async def run():
+        # HTTP 请求是阻塞的（requests），放到线程池中执行；线程数要覆盖同时在跟踪的任务数
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=256))
+        t0 = time.time()
+        if args.rate:
+            records = await open_loop(args, args.clips, t0)
+        else:
+            records = await closed_loop(args, args.clips, t0)
+        return records, time.time() - t0
+
+    mode_desc = f"开环 {args.rate}/s ({args.arrival})" if args.rate else f"闭环 并发 {args.concurrency}"
+    print(f"🚀 压测 {args.url}：{mode_desc}，{len(args.clips)} 个视频")
+    records, wall_time = asyncio.run(run())
+    summary = summarize(records, wall_time)
+
+    print(f"✅ 完成，耗时 {wall_time:.1f}s，结果: {summary['outcomes']}，档位: {summary['tiers']}")
+    print(f"   吞吐量: {summary['throughput_tasks_per_min'] or 0:.2f} 任务/分钟")
+    print(f"   {'延迟(s)':<20}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for key in ('upload_latency', 'queue_latency', 'completion_latency'):
+        s = summary[key]
+        print(f"   {key:<20}{_fmt(s['p50'])}{_fmt(s['p95'])}{_fmt(s['p99'])}{_fmt(s['max'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, "summary": summary, "records": records}, f, indent=2)
+        print(f"📄 已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# benchmarks/sweep.py
+# 速度/画质参数扫描：对一组片段，遍历 窗口长度(max_seq_len) × 推理精度 × 空间分块大小 × 窗口间是否延续传播状态 × 编码 preset 的组合，
+# 记录每个组合的耗时（推理 + 合成视频）、推理峰值显存/内存、PSNR（编码后相对 GT）和输出大小，
+# 并给出 Pareto 前沿（耗时、峰值内存越小越好，PSNR 越大越好，没有被其他组合同时在三者上超过的组合），
+# 用于按数据而不是直觉确定生产环境的 max_seq_len（及 VSR_CARRY_SEQ_LEN）、VSR_PRECISION、VSR_TILE_SIZE、VSR_CARRY_STATE 和编码 preset
+#
+# 用法:
+#   python benchmarks/sweep.py --backend mmagic --seq_lens 5 10 20 40 --precisions fp32 fp16 bf16 --tiles 0 256
+#   python benchmarks/sweep.py --backend mmagic --seq_lens 4 8 16 40 --precisions fp16 --carry 0 1 --presets medium
+#   python benchmarks/sweep.py --backend bicubic --lr lr.mp4 --gt gt.mp4 --presets ultrafast medium
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import statistics
+import datetime
+from pathlib import Path
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from video_io import frames_to_video
+from psnr_calculator import read_video_frames, compute_psnr, calculate_psnr, resize_frame
+from sr_backends import BACKEND, BACKENDS, PRECISIONS, get_backend, write_frames
+from memory_model import RssSampler, rss_bytes
+from bench_pipeline import RESOLUTIONS, WORK_DIR, RESULT_DIR, FPS, make_synthetic_video, _git_commit
+
+DEFAULT_SEQ_LENS = (5, 10, 20, 40)
+DEFAULT_PRECISIONS = ('fp32', 'fp16', 'bf16')
+DEFAULT_TILES = (0,)
+DEFAULT_PRESETS = ('ultrafast', 'veryfast', 'medium')
+OBJECTIVES = (('total_time', min), ('peak_memory_mb', min), ('psnr', max))
+
+
+def infer_clip(backend, frames, seq_len, repeat):
+    """
+    按 process_video 的推理路径（backend.infer_clip）推理整段片段，返回 (耗时中位数(s), 峰值内存增量(MB), 输出帧)
+    GPU 上峰值取 max_memory_allocated，CPU 上取采样的 RSS 峰值
+    """
+    device = getattr(backend, 'device', 'cpu')
+    backend.infer_tiled(frames[:seq_len])  # 预热（cudnn 选算法、首次分配等）
+    times = []
+    outputs = None
+    peak = 0
+    for _ in range(repeat):
+        if device.startswith('cuda'):
+            import torch
+            torch.cuda.synchronize(device)
+            torch.cuda.empty_cache()
+            baseline = torch.cuda.memory_allocated(device)
+            torch.cuda.reset_peak_memory_stats(device)
+        else:
+            baseline = rss_bytes()
+        with RssSampler() as sampler:
+            start = time.perf_counter()
+            outputs = backend.infer_clip(frames, seq_len)
+            if device.startswith('cuda'):
+                torch.cuda.synchronize(device)
+            times.append(time.perf_counter() - start)
+        used = torch.cuda.max_memory_allocated(device) - baseline if device.startswith('cuda') else sampler.peak - baseline
+        peak = max(peak, used)
+    return statistics.median(times), peak / 2**20, outputs
+
+
+def mean_psnr(gt_frames, sr_frames):
+    size = (gt_frames[0].shape[1], gt_frames[0].shape[0])
+    return float(np.mean([compute_psnr(gt, sr if sr.shape[:2] == gt.shape[:2] else resize_frame(sr, size))
+                          for gt, sr in zip(gt_frames, sr_frames)]))
+
+
+def pareto_front(results):
+    """返回 Pareto 前沿上的结果下标（失败的组合不参与）"""
+    valid = [i for i, r in enumerate(results) if 'error' not in r]
+
+    def dominates(a, b):
+        better_or_equal = all((a[k] <= b[k]) if best is min else (a[k] >= b[k]) for k, best in OBJECTIVES)
+        strictly = any((a[k] < b[k]) if best is min else (a[k] > b[k]) for k, best in OBJECTIVES)
+        return better_or_equal and strictly
+
+    return [i for i in valid if not any(dominates(results[j], results[i]) for j in valid if j != i)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep window length / precision / tile size / encode preset')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=list(BACKENDS))
+    parser.add_argument('--lr', type=str, nargs='*', default=[], help='LR clips (default: synthetic 270p clip)')
+    parser.add_argument('--gt', type=str, nargs='*', default=[], help='GT clips, same order as --lr')
+    parser.add_argument('--frames', type=int, default=40, help='Frames per clip')
+    parser.add_argument('--seq_lens', type=int, nargs='+', default=list(DEFAULT_SEQ_LENS))
+    parser.add_argument('--precisions', type=str, nargs='+', default=list(DEFAULT_PRECISIONS), choices=PRECISIONS)
+    parser.add_argument('--tiles', type=int, nargs='+', default=list(DEFAULT_TILES), help='Tile sizes in LR pixels, 0 = no tiling')
+    parser.add_argument('--carry', type=int, nargs='+', default=[1], choices=(0, 1),
+                        help='Carry forward propagation state across windows (1) or cold-start every window (0)')
+    parser.add_argument('--presets', type=str, nargs='+', default=list(DEFAULT_PRESETS), help='x264 presets for frames_to_video')
+    parser.add_argument('--repeat', type=int, default=3, help='Inference runs per combination (median is reported)')
+    parser.add_argument('--output', type=str, default='', help='Result JSON (default: benchmarks/results/sweep_<commit>_<backend>.json)')
+    args = parser.parse_args()
+
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    RESULT_DIR.mkdir(parents=True, exist_ok=True)
+    if args.lr:
+        if len(args.gt) != len(args.lr):
+            parser.error("--gt must list one GT clip per --lr clip")
+        clips = list(zip(args.gt, args.lr))
+    else:
+        width, height = RESOLUTIONS['270p']
+        clips = [tuple(str(p) for p in make_synthetic_video(WORK_DIR, f"270p_{args.frames}f", width, height, args.frames))]
+    data = []
+    for gt_path, lr_path in clips:
+        frames = np.stack(read_video_frames(lr_path)[:args.frames])
+        data.append((gt_path, frames, read_video_frames(gt_path)[:len(frames)]))
+
+    backend = get_backend(args.backend)
+    # 没有精度开关的后端（导出图、替身等）只跑一种精度
+    precisions = args.precisions if hasattr(backend, 'precision') else ['-']
+    # 没有循环传播的后端窗口之间本来就独立；causal 传播总是延续状态
+    if backend.open_stream() is None:
+        carries = [0]
+    else:
+        carries = [1] if backend.propagation == 'causal' else args.carry
+    results = []
+    for precision, tile, carry, seq_len in itertools.product(precisions, args.tiles, carries, args.seq_lens):
+        combo = {"precision": precision, "tile": tile, "carry": bool(carry), "max_seq_len": seq_len}
+        print(f"🔧 {combo} ...")
+        if precision != '-':
+            backend.precision = precision
+        backend.tile_size = tile
+        backend.carry_state = bool(carry)
+        try:
+            runs = [infer_clip(backend, frames, seq_len, args.repeat) for _, frames, _ in data]
+        except Exception as e:  # 显存不足、精度不被支持等，记录后继续
+            print(f"   ❌ {e}")
+            results += [dict(combo, preset=preset, error=str(e)[:200]) for preset in args.presets]
+            continue
+        inference_time = sum(r[0] for r in runs)
+        peak_memory = max(r[1] for r in runs)
+        psnr_raw = statistics.fmean(mean_psnr(gt_frames, r[2]) for (_, _, gt_frames), r in zip(data, runs))
+
+        for preset in args.presets:
+            encode_time, psnrs, size = 0.0, [], 0
+            for index, ((gt_path, _, _), run) in enumerate(zip(data, runs)):
+                sr_dir = WORK_DIR / 'sweep_frames'
+                shutil.rmtree(sr_dir, ignore_errors=True)
+                sr_dir.mkdir(parents=True)
+                write_frames(run[2], str(sr_dir))
+                out_path = WORK_DIR / f"sweep_{index}.mp4"
+                start = time.perf_counter()
+                frames_to_video(str(sr_dir), str(out_path), fps=FPS, preset=preset)
+                encode_time += time.perf_counter() - start
+                psnrs.append(calculate_psnr(gt_path, str(out_path)))
+                size += os.path.getsize(out_path)
+            frames_total = sum(len(frames) for _, frames, _ in data)
+            results.append(dict(
+                combo, preset=preset,
+                inference_time=inference_time, encode_time=encode_time, total_time=inference_time + encode_time,
+                fps=frames_total / inference_time, peak_memory_mb=peak_memory,
+                psnr_raw=psnr_raw, psnr=statistics.fmean(psnrs), output_mb=size / 2**20,
+            ))
+
+    front = pareto_front(results)
+    for i, r in enumerate(results):
+        r["pareto"] = i in front
+
+    print(f"\n{'prec':<6}{'tile':>6}{'carry':>6}{'seq':>5} {'preset':<10}{'infer(s)':>10}{'encode(s)':>10}"
+          f"{'peak(MB)':>10}{'PSNR':>8}{'raw':>8}{'MB':>8}")
+    for r in sorted(results, key=lambda r: r.get("total_time", float('inf'))):
+        if 'error' in r:
+            print(f"{r['precision']:<6}{r['tile']:>6}{r['carry']:>6}{r['max_seq_len']:>5} {r['preset']:<10}  error: {r['error'][:60]}")
+            continue
+        print(f"{r['precision']:<6}{r['tile']:>6}{r['carry']:>6}{r['max_seq_len']:>5} {r['preset']:<10}{r['inference_time']:>10.2f}"
+              f"{r['encode_time']:>10.2f}{r['peak_memory_mb']:>10.0f}{r['psnr']:>8.2f}{r['psnr_raw']:>8.2f}"
+              f"{r['output_mb']:>8.2f}" + ("  *" if r["pareto"] else ""))
+    print(f"* Pareto 前沿（耗时、峰值内存、PSNR）：{len(front)} 个组合")
+
+    output = args.output or str(RESULT_DIR / f"sweep_{_git_commit()}_{args.backend}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            "meta": {
+                "commit": _git_commit(), "backend": args.backend, "device": getattr(backend, 'device', 'cpu'),
+                "propagation": getattr(backend, 'propagation', None),
+                "time": datetime.datetime.now().isoformat(timespec='seconds'),
+                "clips": [lr for _, lr in clips],
+                "frames": [len(frames) for _, frames, _ in data],
+            },
+            "results": results,
+            "pareto": [results[i] for i in front],
+        }, f, indent=2)
+    print(f"📄 已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import copy
+import types
+import argparse
+import torch
+import torchvision
+from sr_backends import MMagicBackend, CHECKPOINT_FILE, check_parity, PARITY_MIN_PSNR, exported_graph_name
+
+# 导出的静态图默认目录，每个 (分辨率, 窗口长度) 一个文件，文件名见 exported_graph_name
+EXPORT_DIR = '/workspace/models/export'
+ONNX_OPSET = 19  # DeformConv 算子从 opset 19 开始支持
+
+
+def _deform_align_forward(self, x, extra_feat, flow_1, flow_2):
+    """
+    SecondOrderDeformableAlignment.forward 的等价实现
+    把 mmcv 的 modulated_deform_conv2d 换成 torchvision.ops.deform_conv2d（偏移量布局相同），
+    这样 TorchScript/ONNX 导出时不依赖 mmcv 的自定义 CUDA 算子
+    """
+    extra_feat = torch.cat([extra_feat, flow_1, flow_2], dim=1)
+    out = self.conv_offset(extra_feat)
+    o1, o2, mask = torch.chunk(out, 3, dim=1)
+
+    offset = self.max_residue_magnitude * torch.tanh(torch.cat((o1, o2), dim=1))
+    offset_1, offset_2 = torch.chunk(offset, 2, dim=1)
+    offset_1 = offset_1 + flow_1.flip(1).repeat(1, offset_1.size(1) // 2, 1, 1)
+    offset_2 = offset_2 + flow_2.flip(1).repeat(1, offset_2.size(1) // 2, 1, 1)
+    offset = torch.cat([offset_1, offset_2], dim=1)
+    mask = torch.sigmoid(mask)
+
+    return torchvision.ops.deform_conv2d(x, offset, self.weight, self.bias, stride=self.stride,
+                                         padding=self.padding, dilation=self.dilation, mask=mask)
+
+
+def prepare_generator_for_export(generator):
+    """
+    把 MMagic 的 BasicVSRPlusPlusNet 改成可导出的形式：
+    - 可变形对齐改用 torchvision 实现
+    - 关闭镜像序列检测（依赖数据的 Python 分支）和 CPU 特征缓存
+    """
+    for module in generator.modules():
+        if type(module).__name__ == 'SecondOrderDeformableAlignment':
+            module.forward = types.MethodType(_deform_align_forward, module)
+    generator.check_if_mirror_extended = types.MethodType(lambda self, lqs: None, generator)
+    generator.is_mirror_extended = False
+    generator.cpu_cache_length = 1 << 30
+    return generator.eval()
+
+
+class ExportWrapper(torch.nn.Module):
+    """(1, T, 3, H, W) RGB [0, 1] -> (1, T, 3, 4H, 4W)"""
+
+    def __init__(self, generator):
+        super().__init__()
+        self.generator = generator
+
+    def forward(self, lqs):
+        return self.generator(lqs)
+
+
+def _register_deform_conv_symbolic():
+    """注册 torchvision::deform_conv2d -> ONNX DeformConv 的导出规则"""
+    from torch.onnx import symbolic_helper
+
+    @symbolic_helper.parse_args('v', 'v', 'v', 'v', 'v', 'i', 'i', 'i', 'i', 'i', 'i', 'i', 'i', 'b')
+    def deform_conv2d(g, input, weight, offset, mask, bias, stride_h, stride_w, pad_h, pad_w,
+                      dil_h, dil_w, n_weight_grps, n_offset_grps, use_mask):
+        kernel_h, kernel_w = symbolic_helper._get_tensor_sizes(weight)[-2:]
+        return g.op('DeformConv', input, weight, offset, bias, mask,
+                    dilations_i=[dil_h, dil_w], group_i=n_weight_grps,
+                    kernel_shape_i=[kernel_h, kernel_w], offset_group_i=n_offset_grps,
+                    pads_i=[pad_h, pad_w, pad_h, pad_w], strides_i=[stride_h, stride_w])
+
+    torch.onnx.register_custom_op_symbolic('torchvision::deform_conv2d', deform_conv2d, ONNX_OPSET)
+
+
+def export(wrapper, width, height, seq_len, output_dir, formats, device):
+    """
+    导出一个 (分辨率, 窗口长度) 的静态图
+    Returns:
+        list[str]: 导出的文件路径
+    """
+    example = torch.rand(1, seq_len, 3, height, width, device=device)
+    paths = []
+    with torch.no_grad():
+        if 'torchscript' in formats:
+            path = os.path.join(output_dir, exported_graph_name(width, height, seq_len, 'pt'))
+            traced = torch.jit.trace(wrapper, example, check_trace=False)
+            traced.save(path)
+            paths.append(path)
+        if 'onnx' in formats:
+            path = os.path.join(output_dir, exported_graph_name(width, height, seq_len, 'onnx'))
+            torch.onnx.export(wrapper, example, path, opset_version=ONNX_OPSET,
+                              input_names=['lqs'], output_names=['sr'], dynamo=False)
+            paths.append(path)
+    return paths
+
+
+def _parse_resolution(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export BasicVSR++ to static-shape TorchScript/ONNX graphs')
+    parser.add_argument('--resolution', type=_parse_resolution, nargs='+', default=[(480, 270)],
+                        help='Input (LR) resolutions, e.g. 480x270 320x180')
+    parser.add_argument('--seq_len', type=int, nargs='+', default=[10], help='Window lengths (frames)')
+    parser.add_argument('--format', type=str, nargs='+', default=['torchscript', 'onnx'],
+                        choices=['torchscript', 'onnx'], help='Export formats')
+    parser.add_argument('--output_dir', type=str, default=EXPORT_DIR, help='Directory for exported graphs')
+    parser.add_argument('--checkpoint', type=str, default=CHECKPOINT_FILE, help='BasicVSR++ checkpoint')
+    parser.add_argument('--device', type=str, default='cpu', help='Device used for tracing')
+    parser.add_argument('--parity_video', type=str, default='', help='LR clip used for the parity test against MMagic')
+    parser.add_argument('--min_psnr', type=float, default=PARITY_MIN_PSNR, help='Parity threshold (dB, exported vs MMagic)')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if 'onnx' in args.format:
+        _register_deform_conv_symbolic()
+
+    print("加载 MMagic BasicVSR++ ...")
+    reference = MMagicBackend(device=args.device, checkpoint=args.checkpoint)
+    # 导出用的网络是参考模型的一份拷贝，参考模型保持原样用于一致性测试
+    generator = prepare_generator_for_export(copy.deepcopy(reference.model.generator))
+    wrapper = ExportWrapper(generator).to(args.device).eval()
+
+    exported = []
+    for width, height in args.resolution:
+        for seq_len in args.seq_len:
+            print(f"导出 {width}x{height}, T={seq_len} ...")
+            exported += export(wrapper, width, height, seq_len, args.output_dir, args.format, args.device)
+    for path in exported:
+        print(f"  ✅ {path}")
+
+    if args.parity_video:
+        from sr_backends import TorchScriptBackend, OnnxBackend
+        failed = False
+        for fmt, backend_cls in (('torchscript', TorchScriptBackend), ('onnx', OnnxBackend)):
+            if fmt not in args.format:
+                continue
+            backend = backend_cls(model_path=args.output_dir)
+            psnr = check_parity(backend, reference, args.parity_video, max_seq_len=min(args.seq_len))
+            ok = psnr >= args.min_psnr
+            failed = failed or not ok
+            print(f"一致性测试 [{fmt}] PSNR(导出 vs MMagic) = {psnr:.2f} dB {'✅' if ok else '❌'} (阈值 {args.min_psnr} dB)")
+        if failed:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
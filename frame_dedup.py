@@ -0,0 +1,106 @@
+import os
+import shutil
+import hashlib
+import cv2
+import numpy as np
+from video_io import FFmpegDecoder
+
+# 帧冗余检测参数（可根据实际测试数据调整）
+# 比较时先把灰度帧按 BLOCK_SIZE×BLOCK_SIZE 块求均值，块均值的最大差异不超过阈值即视为重复帧。
+# 块均值能抵消压缩噪声，同时对画面中局部运动（行人、信号灯等）保持敏感。
+# 近似比较是有损的（被跳过的帧直接复用上一保留帧的输出），VSR_DEDUP_THRESHOLD=0 时只跳过完全相同的帧
+DEDUP_THRESHOLD = float(os.environ.get('VSR_DEDUP_THRESHOLD', 2.0))  # 块均值最大差异阈值（0-255）
+BLOCK_SIZE = 8
+
+
+def _block_means(frame):
+    """BGR 帧 -> 灰度块均值图（float32）"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape[:2]
+    size = (max(1, w // BLOCK_SIZE), max(1, h // BLOCK_SIZE))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def find_unique_frames(video_path, threshold=DEDUP_THRESHOLD):
+    """
+    只做检测不写帧：每一帧都与“上一个保留帧”比较（而不是前一帧），缓慢变化会逐渐累积并最终触发保留，不会漂移
+
+    Args:
+        video_path (str): 输入视频路径
+        threshold (float): 块均值最大差异阈值，不大于 0 表示关闭近似比较（只跳过完全相同的帧）
+    Returns:
+        list[int]: index_map，index_map[i] 为原视频第 i 帧对应的保留帧序号
+    """
+    index_map = []
+    last_digest = None
+    last_means = None
+    unique_count = 0
+    # 帧在解码器的环形缓冲中复用，只保留其摘要和块均值
+    with FFmpegDecoder(video_path) as decoder:
+        for frame in decoder:
+            digest = hashlib.md5(frame.tobytes()).digest()
+            if last_digest is not None and digest == last_digest:
+                # 完全相同（如帧率转换插入的重复帧）
+                index_map.append(unique_count - 1)
+                continue
+            means = _block_means(frame) if threshold > 0 else None
+            if (means is not None and last_means is not None and means.shape == last_means.shape
+                    and float(np.max(np.abs(means - last_means))) <= threshold):
+                # 近似静止帧，复用上一个保留帧的超分结果
+                index_map.append(unique_count - 1)
+                continue
+            last_digest = digest
+            last_means = means
+            index_map.append(unique_count)
+            unique_count += 1
+
+    if unique_count == 0:
+        raise ValueError("无法读取视频帧")
+    return index_map
+
+
+def extract_unique_frames(video_path, unique_dir, threshold=DEDUP_THRESHOLD):
+    """
+    读取低清视频帧，去掉重复/近似静止帧，只把需要超分的帧写入 unique_dir
+    先整段检测一遍（不写帧），确实有可跳过的帧时才再解码一遍写出保留帧；没有重复帧时不写任何帧，
+    调用方直接对原视频超分
+
+    Args:
+        video_path (str): 输入视频路径
+        unique_dir (str): 保留帧输出目录，帧按 {:08d}.png 连续编号（与 MMagic 帧序列输入格式一致）
+        threshold (float): 见 find_unique_frames
+    Returns:
+        list[int]: index_map，见 find_unique_frames；index_map[-1] + 1 == len(index_map) 时 unique_dir 不会被创建
+    """
+    index_map = find_unique_frames(video_path, threshold)
+    if index_map[-1] + 1 == len(index_map):
+        return index_map
+    os.makedirs(unique_dir, exist_ok=True)
+    with FFmpegDecoder(video_path) as decoder:
+        previous = -1
+        for frame, j in zip(decoder, index_map):
+            if j != previous:
+                cv2.imwrite(os.path.join(unique_dir, f"{j:08d}.png"), frame)
+                previous = j
+    return index_map
+
+
+def expand_sr_frames(sr_dir, index_map, output_dir):
+    """
+    把保留帧的超分结果展开回原始帧序列，重复帧直接复用（硬链接，失败时复制）
+
+    Args:
+        sr_dir (str): 保留帧的超分结果目录（{:08d}.png）
+        index_map (list[int]): extract_unique_frames 返回的帧映射
+        output_dir (str): 完整帧序列输出目录（{:08d}.png）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for i, j in enumerate(index_map):
+        src = os.path.join(sr_dir, f"{j:08d}.png")
+        dst = os.path.join(output_dir, f"{i:08d}.png")
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
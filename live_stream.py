@@ -0,0 +1,306 @@
+import os
+import time
+import threading
+import subprocess
+import collections
+from urllib.parse import urlsplit
+import numpy as np
+from video_io import FFmpegDecoder, probe_video
+from sr_backends import get_backend, SCALE
+from metrics import LIVE_FRAMES
+
+# 直播流超分：持续读取视频流（RTSP/RTMP/UDP 等，或按实时速度播放的本地文件），按滑动窗口超分后编码为 HLS 发布
+# 延迟（帧被采集到写入 HLS 编码器的时间）超过上限时，按策略降级（改用快速后端）或丢帧（重复上一帧），不会越积越多
+LIVE_WINDOW = int(os.environ.get('VSR_LIVE_WINDOW', 8))  # 每次推理的新帧数（VSR_PROPAGATION=causal 时为每次最多推入的帧数）
+# 窗口前附带的上一窗口末尾帧数，只用于传播预热，不重复输出（有循环传播的后端直接延续传播状态，不需要预热帧）
+LIVE_CONTEXT = int(os.environ.get('VSR_LIVE_CONTEXT', 2))
+LIVE_LATENCY = float(os.environ.get('VSR_LIVE_LATENCY', 10))  # 延迟上限（秒），不含 HLS 分片本身带来的播放延迟
+LIVE_POLICY = os.environ.get('VSR_LIVE_POLICY', 'degrade')  # 跟不上时的策略：degrade | drop
+LIVE_POLICIES = ('degrade', 'drop')
+LIVE_DEGRADE_BACKEND = 'bicubic_sharpen'  # 与过载降级的 fast 档位相同
+LIVE_PRESET = os.environ.get('VSR_LIVE_PRESET', 'veryfast')
+LIVE_SEGMENT_SEC = 2  # HLS 分片时长
+LIVE_PLAYLIST_SIZE = 6  # 播放列表保留的分片数，更早的分片自动删除
+STREAM_PREFIXES = ('rtsp://', 'rtmp://', 'udp://', 'srt://', 'http://', 'https://')
+# 允许拉流的协议与主机（逗号分隔），防止服务端被用来访问内网地址（SSRF）：
+# http(s)/udp 默认不开放；主机列表为空时不接受任何流地址，'*' 为任意主机，'.example.com' 匹配其子域名
+LIVE_ALLOWED_SCHEMES = [s.strip().lower() for s in os.environ.get('VSR_LIVE_ALLOWED_SCHEMES', 'rtsp,rtmp,srt').split(',') if s.strip()]
+LIVE_ALLOWED_HOSTS = [h.strip().lower() for h in os.environ.get('VSR_LIVE_ALLOWED_HOSTS', '').split(',') if h.strip()]
+LATENCY_SAMPLES = 200  # 统计延迟分位数时保留的最近窗口数
+
+
+class LiveSession:
+    """
+    一路直播流的超分会话：读流线程把帧连同采集时间放入待处理队列，推理线程按窗口取帧超分并写入 HLS 编码器
+    - 后端为 causal 传播（VSR_PROPAGATION=causal）时不等凑满窗口，帧一到就推入流式推理（每步 VSR_CAUSAL_STEP 帧、
+      前瞻 VSR_LOOKAHEAD 帧），每次写出已可以输出的帧，延迟只受 step + lookahead 限制
+    - 预计延迟 = 最早一帧已等待的时间 + 按最近推理速度估计的本窗口耗时，超过 latency 时
+      （或推理后端被文件任务占住、在剩余的延迟预算内拿不到锁时）：
+      degrade：本窗口改用快速后端；drop：丢弃本窗口，重复上一输出帧保持时间线
+    - 待处理帧超过 latency 对应的帧数时，读流线程直接丢弃最旧的帧（推理被长任务占住时不会无限堆积）
+    """
+
+    def __init__(self, session_id, source, output_dir, realtime=False, window=LIVE_WINDOW, context=LIVE_CONTEXT,
+                 latency=LIVE_LATENCY, policy=LIVE_POLICY, backend_name=None):
+        """
+        Args:
+            session_id (str): 会话 ID
+            source (str): 流地址或本地视频路径
+            output_dir (str): HLS 输出目录（index.m3u8 与分片）
+            realtime (bool): 本地文件按实时速度读取
+            window (int): 每次推理的新帧数（causal 模式下为每次最多推入的帧数）
+            context (int): 窗口前附带的上一窗口末尾帧数
+            latency (float): 延迟上限（秒）
+            policy (str): 'degrade' 或 'drop'
+            backend_name (str): 推理后端，None 为默认后端
+        """
+        if policy not in LIVE_POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(LIVE_POLICIES)}")
+        self.session_id = session_id
+        self.source = source
+        self.output_dir = output_dir
+        self.window = max(1, window)
+        self.context = max(0, context)
+        self.latency = latency
+        self.policy = policy
+        self.backend = get_backend(backend_name)
+        self.degrade_backend = get_backend(LIVE_DEGRADE_BACKEND)
+        self.causal = self.backend.propagation == 'causal'
+        self.stream = self._open_stream()
+        self.causal = self.causal and self.stream is not None
+
+        self.pending = collections.deque()  # (采集时间, 帧)
+        self.inflight = collections.deque()  # 已取出、尚未输出的帧的采集时间（causal 模式下含流中等待前瞻帧的帧）
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.ended = False
+        self.dropped_pending = 0  # 读流线程丢弃、尚未补帧的帧数
+        self.frame_seconds = None  # 最近的逐帧推理耗时（指数滑动平均）
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {"frames_in": 0, "sr": 0, "degraded": 0, "dropped": 0}
+        self.state = "running"
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None  # 会话结束（ended/stopped/error）的时间，过期后由服务端清理
+        self.last_output = None
+
+        probe = probe_video(source)
+        self.fps = probe.fps or 25.0
+        self.max_pending = int(self.latency * self.fps) + self.window
+        self.decoder = FFmpegDecoder(source, realtime=realtime)
+        self.log = None
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            out_w, out_h = self.decoder.width * SCALE, self.decoder.height * SCALE
+            gop = max(1, int(round(self.fps * LIVE_SEGMENT_SEC)))
+            cmd = [
+                'ffmpeg', '-y', '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{out_w}x{out_h}",
+                '-framerate', str(self.fps), '-i', 'pipe:0',
+                '-c:v', 'libx264', '-preset', LIVE_PRESET, '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+                '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+                '-f', 'hls', '-hls_time', str(LIVE_SEGMENT_SEC), '-hls_list_size', str(LIVE_PLAYLIST_SIZE),
+                '-hls_flags', 'delete_segments+independent_segments',
+                os.path.join(output_dir, 'index.m3u8')
+            ]
+            self.log = open(os.path.join(output_dir, 'ffmpeg.log'), 'wb')
+            self.encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=self.log)
+        except BaseException:
+            # 后续步骤失败时不留下已启动的解码进程
+            self.decoder.close()
+            if self.log is not None:
+                self.log.close()
+            raise
+        self.threads = [threading.Thread(target=self._read, daemon=True),
+                        threading.Thread(target=self._run, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def _read(self):
+        try:
+            while not self.stop_event.is_set():
+                frame = self.decoder.read(np.empty(self.decoder.frame_shape, dtype=np.uint8))
+                if frame is None:
+                    break
+                with self.cond:
+                    self.pending.append((time.time(), frame))
+                    self.stats["frames_in"] += 1
+                    while len(self.pending) > self.max_pending:
+                        self.pending.popleft()
+                        self.dropped_pending += 1
+                    self.cond.notify()
+        except Exception as e:
+            self.error = str(e)  # 流中断、解码失败（已读入的帧照常处理完）
+        finally:
+            with self.cond:
+                self.ended = True
+                self.cond.notify()
+
+    def _open_stream(self):
+        """causal 模式按 VSR_CAUSAL_STEP / VSR_LOOKAHEAD 逐步输出；否则正向传播状态在窗口之间延续，每个窗口推理完即全部输出"""
+        if self.causal:
+            return self.backend.open_stream()
+        return self.backend.open_stream(step=self.window, lookahead=0)
+
+    def _take(self):
+        """等到凑满一个窗口（causal 模式下有帧即可，或流结束/超时）后取出，返回 (帧列表, 需补的丢弃帧数)"""
+        need = 1 if self.causal else self.window
+        with self.cond:
+            deadline = time.time() + self.window / self.fps + 1.0  # 流卡顿时不凑满也先处理已有的帧
+            while len(self.pending) < need and not self.ended and not self.stop_event.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch = [self.pending.popleft() for _ in range(min(self.window, len(self.pending)))]
+            dropped, self.dropped_pending = self.dropped_pending, 0
+            return batch, dropped
+
+    def _write(self, frames):
+        self.encoder.stdin.write(np.ascontiguousarray(frames).tobytes())
+        self.last_output = frames[-1]
+
+    def _repeat_last(self, count):
+        """用上一输出帧补齐丢弃的帧，保持输出时间线与输入一致（还没有输出时只计数）"""
+        if count <= 0:
+            return
+        if self.last_output is not None:
+            self._write(np.repeat(self.last_output[None], count, axis=0))
+        self.stats["dropped"] += count
+        LIVE_FRAMES.inc(count, outcome='dropped')
+
+    def _finish(self, count):
+        """最早的 count 个在途帧已输出，记录其中第一帧的延迟"""
+        if count:
+            self.latencies.append(time.time() - self.inflight[0])
+            for _ in range(count):
+                self.inflight.popleft()
+
+    def _fallback(self, frames):
+        """跟不上时按策略输出：degrade 用快速后端超分，drop 重复上一输出帧"""
+        if self.policy == 'drop' and self.last_output is not None:
+            self._repeat_last(len(frames))
+        else:
+            self._write(self.degrade_backend.infer_frames(frames))
+            self.stats["degraded"] += len(frames)
+            LIVE_FRAMES.inc(len(frames), outcome='degraded')
+        self._finish(len(frames))
+
+    def _reset_stream(self):
+        """
+        跳过了部分帧（降级/丢帧）后，之前的传播状态不再与下一窗口相邻，重新开始；
+        causal 模式下流中还在等待前瞻帧的帧先按策略输出，保持时间线
+        """
+        if self.stream is not None:
+            held = self.stream.pending
+            self.stream = self._open_stream()
+            if held:
+                self._fallback(np.stack(held))
+
+    def _infer(self, frames, context, final):
+        """超分一批新帧（调用方持有后端锁），返回已可以输出的超分帧；causal 模式下可能少于推入的帧，final 时输出流中剩余的帧"""
+        if self.causal:
+            emitted = self.stream.push(frames) if len(frames) else []
+            return emitted + (self.stream.flush() if final else [])
+        if self.stream is not None:
+            return self.stream.push(frames) + self.stream.flush()
+        inputs = frames if context is None else np.concatenate([context, frames])
+        return [self.backend.infer_tiled(inputs)[len(inputs) - len(frames):]]
+
+    def _run(self):
+        context = None
+        try:
+            while True:
+                batch, dropped = self._take()
+                if dropped:
+                    self._reset_stream()
+                    self._repeat_last(dropped)
+                final = not batch and (self.ended or self.stop_event.is_set())
+                if not batch and not (final and self.inflight):  # 流结束时先输出 causal 流中剩余的帧
+                    if final:
+                        break
+                    continue
+                frames = np.stack([frame for _, frame in batch]) if batch else np.empty((0,) + self.decoder.frame_shape, np.uint8)
+                self.inflight.extend(captured for captured, _ in batch)
+                age = time.time() - self.inflight[0]
+                work = len(frames) + (len(context) if context is not None else 0) + (len(self.inflight) if final else 0)
+                expected = (self.frame_seconds or 0.0) * work
+                # 与文件任务共用推理后端（文件任务整段持有锁），最多等到延迟预算用完，拿不到锁就按延迟策略处理本窗口
+                budget = self.latency - age - expected
+                if budget >= 0 and self.backend.lock.acquire(timeout=budget):
+                    start = time.time()
+                    try:
+                        sr = self._infer(frames, context, final)
+                    finally:
+                        self.backend.lock.release()
+                    per_frame = (time.time() - start) / work
+                    self.frame_seconds = per_frame if self.frame_seconds is None else 0.7 * self.frame_seconds + 0.3 * per_frame
+                    for chunk in sr:
+                        self._write(chunk)
+                    count = sum(len(chunk) for chunk in sr)
+                    self.stats["sr"] += count
+                    LIVE_FRAMES.inc(count, outcome='sr')
+                    self._finish(count)
+                else:
+                    self._reset_stream()
+                    if len(frames):
+                        self._fallback(frames)
+                if len(frames):
+                    context = frames[len(frames) - self.context:] if self.context and self.stream is None else None
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.decoder.close()
+            # 先更新状态：编码器异常退出时会话也不会一直停在 running、占用 VSR_LIVE_MAX_SESSIONS
+            self.state = "error" if self.error else ("stopped" if self.stop_event.is_set() else "ended")
+            self.finished_at = time.time()
+            try:
+                self.encoder.stdin.close()  # 编码器写完最后一个分片并在播放列表末尾加 ENDLIST
+            except BrokenPipeError:
+                pass  # 编码器已退出
+            self.encoder.wait()
+            self.log.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.decoder.close()  # 结束读流（网络流可能一直阻塞在读取上）
+        with self.cond:
+            self.cond.notify_all()
+
+    def status(self):
+        latencies = sorted(self.latencies)
+        return {
+            "session_id": self.session_id,
+            "state": self.state,
+            "error": self.error,
+            "source": self.source,
+            "fps": self.fps,
+            "window": self.window,
+            "causal": self.causal,
+            "delay_frames": self.stream.delay if self.causal else None,  # causal 模式的算法延迟（帧）
+            "latency_bound": self.latency,
+            "policy": self.policy,
+            "uptime": round(time.time() - self.started_at, 1),
+            "pending_frames": len(self.pending),
+            "frames": dict(self.stats),
+            "latency_last": round(self.latencies[-1], 3) if latencies else None,
+            "latency_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+        }
+
+
+def is_stream_url(source):
+    return source.lower().startswith(STREAM_PREFIXES)
+
+
+def stream_url_allowed(source):
+    """流地址的协议在 VSR_LIVE_ALLOWED_SCHEMES 中，且主机在 VSR_LIVE_ALLOWED_HOSTS 中"""
+    try:
+        parts = urlsplit(source)
+        host = (parts.hostname or '').lower()
+    except ValueError:
+        return False
+    if parts.scheme.lower() not in LIVE_ALLOWED_SCHEMES:
+        return False
+    if '*' in LIVE_ALLOWED_HOSTS:
+        return True
+    return bool(host) and any(host == allowed or (allowed.startswith('.') and host.endswith(allowed))
+                              for allowed in LIVE_ALLOWED_HOSTS)
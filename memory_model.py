@@ -0,0 +1,202 @@
+import os
+import json
+import threading
+import time
+import numpy as np
+from metrics import reset_cuda_peak
+
+# 显存/内存模型：对每个 (设备, 推理后端, 分辨率) 实测几个窗口长度的峰值占用，
+# 拟合 峰值 = a + b * max_seq_len，再按当前可用内存选出最大的安全窗口长度
+# 按任务实际的推理路径（流式推理、分块、光流缓存）测量，缓存的键包含这些配置，配置变化后重新校准
+MEMORY_MODEL_FILE = os.environ.get('VSR_MEMORY_MODEL', '/workspace/models/memory_model.json')
+MEMORY_FRACTION = float(os.environ.get('VSR_MEMORY_FRACTION', 0.8))  # 可用内存中允许单个任务使用的比例
+CALIBRATION_SEQ_LENS = (2, 4, 8)
+MIN_SEQ_LEN = 2
+MAX_SEQ_LEN = 100  # BasicVSR++ 超过 100 帧会切换到 CPU 特征缓存，线性模型不再适用
+
+
+def _device_of(backend):
+    return getattr(backend, 'device', 'cpu')
+
+
+def _device_key(backend):
+    device = _device_of(backend)
+    if device.startswith('cuda'):
+        import torch
+        device = f"{device}:{torch.cuda.get_device_name(torch.device(device))}"
+    return f"{backend.name}|{device}"
+
+
+def _path_key(backend):
+    """推理路径：传播方式、是否延续状态、分块大小（流式推理的显存占用与 infer_frames 不同）"""
+    stream = 'causal' if backend.propagation == 'causal' else ('carry' if backend.carry_state else 'window')
+    return f"{stream}|tile{backend.tile_size}"
+
+
+def rss_bytes():
+    """当前进程的 RSS（字节）"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def available_memory(device):
+    """当前可供推理使用的内存（字节）：GPU 为空闲显存 + PyTorch 缓存中未使用的部分，CPU 为 MemAvailable"""
+    if device.startswith('cuda'):
+        import torch
+        free, _ = torch.cuda.mem_get_info(torch.device(device))
+        return free + torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("无法读取 /proc/meminfo")
+
+
+class RssSampler:
+    """后台线程采样进程 RSS，记录峰值（CPU 推理没有类似 max_memory_allocated 的统计）"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def _run_windows(backend, frames, seq_len):
+    """按任务的实际推理路径跑一遍：流式推理（分块、光流缓存、窗口间延续的状态）或逐窗口 infer_tiled"""
+    stream = backend.open_video_stream(seq_len)
+    if stream is None:
+        for i in range(0, len(frames), seq_len):
+            backend.infer_tiled(frames[i:i + seq_len])
+        return
+    for i in range(0, len(frames), seq_len):
+        stream.push(frames[i:i + seq_len])
+    stream.flush()
+
+
+def measure_peak_memory(backend, width, height, seq_lens=CALIBRATION_SEQ_LENS):
+    """
+    实测不同窗口长度下推理的峰值内存增量
+    每个窗口长度推理两个窗口（与 process_video 相同的路径），第二个窗口带着第一个窗口留下的传播状态和光流
+    Args:
+        backend (SRBackend): 推理后端
+        width (int): 输入宽度
+        height (int): 输入高度
+        seq_lens (tuple): 测量的窗口长度（从小到大）
+    Returns:
+        list[tuple]: [(max_seq_len, 峰值增量字节数), ...]，显存不足的窗口长度不计入
+    """
+    device = _device_of(backend)
+    rng = np.random.default_rng(0)
+    samples = []
+    if device.startswith('cuda'):
+        import torch
+        torch.cuda.synchronize(device)
+        torch.cuda.empty_cache()
+        baseline = torch.cuda.memory_allocated(device)
+        for seq_len in seq_lens:
+            frames = rng.integers(0, 256, (2 * seq_len, height, width, 3), dtype=np.uint8)
+            reset_cuda_peak(device)  # 保留此前的高水位，不影响 /metrics 与 trace 中的峰值
+            try:
+                _run_windows(backend, frames, seq_len)
+            except torch.cuda.OutOfMemoryError:
+                torch.cuda.empty_cache()
+                break
+            torch.cuda.synchronize(device)
+            samples.append((seq_len, torch.cuda.max_memory_allocated(device) - baseline))
+        torch.cuda.empty_cache()
+    else:
+        # 按窗口长度从小到大测量，统一以测量前的 RSS 为基准（释放的内存可能不会还给系统）
+        baseline = rss_bytes()
+        for seq_len in seq_lens:
+            frames = rng.integers(0, 256, (2 * seq_len, height, width, 3), dtype=np.uint8)
+            with RssSampler() as sampler:
+                _run_windows(backend, frames, seq_len)
+            samples.append((seq_len, sampler.peak - baseline))
+    return samples
+
+
+def fit_memory_model(samples):
+    """最小二乘拟合 峰值 = a + b * max_seq_len，返回 (a, b)"""
+    if len(samples) == 1:
+        seq_len, peak = samples[0]
+        return 0.0, peak / seq_len
+    x = np.array([s[0] for s in samples], dtype=np.float64)
+    y = np.array([s[1] for s in samples], dtype=np.float64)
+    b, a = np.polyfit(x, y, 1)
+    return max(0.0, float(a)), max(0.0, float(b))
+
+
+class MemoryModel:
+    """按 (设备, 推理后端, 分辨率) 缓存的内存模型，校准结果持久化到 MEMORY_MODEL_FILE"""
+
+    def __init__(self, path=MEMORY_MODEL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.models = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.models = json.load(f)
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(self.models, f, indent=2)
+        except OSError as e:
+            print(f"⚠️ 内存模型保存失败: {e}")
+
+    def get(self, backend, width, height):
+        """返回 {"a": 固定开销, "b": 每帧开销, "samples": 实测数据}，首次遇到时现场校准"""
+        key = f"{_device_key(backend)}|{_path_key(backend)}|{width}x{height}"
+        with self.lock:
+            if key not in self.models:
+                start = time.time()
+                with backend.lock:
+                    samples = measure_peak_memory(backend, width, height)
+                if not samples:
+                    raise RuntimeError(f"内存校准失败：{width}x{height} 下最小窗口也无法运行")
+                a, b = fit_memory_model(samples)
+                self.models[key] = {"a": a, "b": b, "samples": samples}
+                self._save()
+                print(f"内存模型校准完成 [{key}]: a={a / 2**20:.1f} MiB, b={b / 2**20:.1f} MiB/帧, 耗时 {time.time() - start:.1f}s")
+            return self.models[key]
+
+    def max_safe_seq_len(self, backend, width, height):
+        """按当前可用内存计算最大安全窗口长度"""
+        model = self.get(backend, width, height)
+        budget = available_memory(_device_of(backend)) * MEMORY_FRACTION
+        if model["b"] <= 0:
+            return MAX_SEQ_LEN
+        seq_len = int((budget - model["a"]) // model["b"])
+        return max(MIN_SEQ_LEN, min(MAX_SEQ_LEN, seq_len))
+
+    def select_seq_len(self, backend, width, height, requested=None):
+        """
+        选择窗口长度
+        Args:
+            requested (int): 客户端指定的 max_seq_len，None 表示自动选择
+        Returns:
+            tuple: (max_seq_len, 是否因内存不足被截断)
+        """
+        safe = self.max_safe_seq_len(backend, width, height)
+        if requested is None:
+            # 窗口之间延续传播状态时，更长的窗口对画质帮助不大，只增加峰值内存
+            cap = backend.auto_seq_len_cap()
+            return (min(safe, cap) if cap else safe), False
+        if requested > safe:
+            return safe, True
+        return requested, False
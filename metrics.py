@@ -0,0 +1,187 @@
+import sys
+import threading
+
+# Prometheus 指标：实现文本暴露格式（version 0.0.4）中用到的 Counter / Gauge / Histogram，
+# 不依赖 prometheus_client，由 HTTP 服务的 /metrics 接口输出
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 各阶段耗时的分桶（秒）：预处理/合成视频通常在秒级，推理可能到几十分钟
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}  # 标签值元组: 数值
+        if not self.labels and self.type != 'histogram':
+            self.values[()] = 0  # 无标签的指标从 0 开始输出
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} 需要标签 {self.labels}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """Returns: list[tuple]: [(指标名, 标签串, 数值), ...]"""
+        with self.lock:
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counter 只能增加")
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        """
+        Args:
+            function (callable): 抓取时调用，返回数值（无标签）或 {标签值元组: 数值}，用于队列长度等现成的状态
+        """
+        super().__init__(name, documentation, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                    result.append((f"{self.name}_bucket", labels, count))
+                result.append((f"{self.name}_sum", _format_labels(self.labels, key), total))
+                result.append((f"{self.name}_count", _format_labels(self.labels, key), counts[-1]))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# reset_cuda_peak 清零 PyTorch 峰值统计之前的高水位（按 GPU 下标），对外报告的峰值不低于它
+_cuda_peak_floor = {}
+
+
+def reset_cuda_peak(device):
+    """
+    清零 device 的 max_memory_allocated 以测量一段推理的峰值，同时记下此前的高水位：
+    vsr_device_memory_peak_bytes 和 trace 中的 cuda_peak_mb 不会因为测量而变小
+    """
+    import torch
+    index = torch.device(device).index
+    index = torch.cuda.current_device() if index is None else index
+    _cuda_peak_floor[index] = cuda_peak_allocated(torch, index)
+    torch.cuda.reset_peak_memory_stats(index)
+
+
+def cuda_peak_allocated(torch, index):
+    """GPU index 自进程启动以来的分配峰值（字节）"""
+    return max(_cuda_peak_floor.get(index, 0), torch.cuda.max_memory_allocated(index))
+
+
+def device_memory_peaks():
+    """
+    各设备的内存峰值（字节）：GPU 为 PyTorch 的 max_memory_allocated（不受 reset_cuda_peak 影响），CPU 为进程 RSS 峰值（VmHWM）
+    只在 torch 已被推理后端加载时才读取 GPU 统计，不会为了抓取指标而导入 torch
+    """
+    peaks = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                peaks[('cpu',)] = int(line.split()[1]) * 1024
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_initialized():
+        for i in range(torch.cuda.device_count()):
+            peaks[(f'cuda:{i}',)] = cuda_peak_allocated(torch, i)
+    return peaks
+
+
+# --- 超分服务的指标 ---
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'vsr_stage_duration_seconds', 'Duration of each processing stage of a task', labels=('stage',)))
+TASKS_TOTAL = REGISTRY.register(Counter(
+    'vsr_tasks_total', 'Finished tasks by tier and outcome', labels=('tier', 'outcome')))
+FRAMES_PROCESSED = REGISTRY.register(Counter(
+    'vsr_frames_processed_total', 'Output frames produced by super-resolution'))
+INFERENCE_FPS = REGISTRY.register(Gauge(
+    'vsr_inference_fps', 'Frames per second of the sr_inference stage of the most recent task'))
+UPLOADED_BYTES = REGISTRY.register(Counter(
+    'vsr_uploaded_bytes_total', 'Bytes of uploaded input videos'))
+SERVED_BYTES = REGISTRY.register(Counter(
+    'vsr_served_bytes_total', 'Bytes of output files served'))
+LIVE_FRAMES = REGISTRY.register(Counter(
+    'vsr_live_frames_total', 'Live stream frames by outcome (sr, degraded, dropped)', labels=('outcome',)))
+DEVICE_MEMORY_PEAK = REGISTRY.register(Gauge(
+    'vsr_device_memory_peak_bytes', 'Memory high-water mark per device', labels=('device',),
+    function=device_memory_peaks))
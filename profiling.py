@@ -0,0 +1,79 @@
+import os
+import io
+import cProfile
+import pstats
+
+# 按任务开启的性能剖析（上传时带 profile=1）：
+# - sr_inference 阶段用 torch.profiler 记录算子耗时，导出 Chrome trace 和算子汇总表（没有安装 torch 时改用 cProfile）
+# - 其余 Python 阶段（预处理、合成视频、PSNR）用 cProfile 记录，导出 .prof 和按累计耗时排序的文本
+# 产物与输出视频放在同一目录，可通过 /uploads/output/<文件名> 下载
+INFERENCE_STAGE = 'sr_inference'
+PYTHON_STAGES = ('preprocessing', 'merging_video', 'calculating_psnr')
+TOP_FUNCTIONS = 50  # 文本汇总中列出的函数/算子数
+
+
+class TaskProfiler:
+    """随任务阶段切换开关的剖析器，由 set_stage 驱动，必须在任务的 worker 线程中调用"""
+
+    def __init__(self, task_id, output_dir):
+        self.task_id = task_id
+        self.output_dir = output_dir
+        self.python = cProfile.Profile()
+        self.python_used = False
+        self.torch = None
+        self.files = {}  # 已保存的产物: {类型: 文件名}，类型如 python.prof / torch.json
+
+    def _path(self, suffix):
+        return os.path.join(self.output_dir, f"{self.task_id}_profile_{suffix}")
+
+    def _saved(self, *suffixes):
+        for suffix in suffixes:
+            self.files[suffix] = os.path.basename(self._path(suffix))
+
+    def _start_torch(self):
+        """
+        Returns:
+            bool: 是否已开启；没有 torch 的后端（bicubic 等）返回 False，由调用方改用 cProfile
+        """
+        try:
+            import torch
+        except ImportError:
+            return False
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.torch = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+        self.torch.start()
+        return True
+
+    def _stop_torch(self):
+        profiler, self.torch = self.torch, None
+        profiler.stop()
+        profiler.export_chrome_trace(self._path('torch.json'))
+        sort_by = 'cuda_time_total' if len(profiler.activities) > 1 else 'cpu_time_total'
+        with open(self._path('torch.txt'), 'w') as f:
+            f.write(profiler.key_averages().table(sort_by=sort_by, row_limit=TOP_FUNCTIONS))
+        self._saved('torch.json', 'torch.txt')
+
+    def _save_python(self):
+        self.python.dump_stats(self._path('python.prof'))
+        text = io.StringIO()
+        pstats.Stats(self.python, stream=text).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        with open(self._path('python.txt'), 'w') as f:
+            f.write(text.getvalue())
+        self._saved('python.prof', 'python.txt')
+
+    def stage(self, name):
+        """
+        切换到新阶段：Python 阶段开启 cProfile，推理阶段开启 torch.profiler
+        name 为 None（任务结束或出错）时停止剖析并保存产物
+        """
+        self.python.disable()
+        if self.torch is not None:
+            self._stop_torch()
+        if name in PYTHON_STAGES or (name == INFERENCE_STAGE and not self._start_torch()):
+            self.python_used = True
+            self.python.enable()
+        elif name is None and self.python_used:
+            self._save_python()
+            self.python_used = False
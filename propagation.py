@@ -0,0 +1,191 @@
+import os
+import collections
+
+# BasicVSR++ 的分窗口传播：直接调用 generator 的子模块（特征提取、SPyNet、二阶可变形对齐、残差块、上采样），
+# 在窗口之间延续正向传播状态，反向传播只覆盖本窗口（及其前瞻帧），用于低延迟的流式推理
+MIN_FLOW_SIZE = 64  # BasicVSR++ 要求光流输入不小于 64x64
+# SPyNet 光流缓存的容量上限（MB），超出时按最久未使用淘汰；帧离开活动窗口后其光流即被释放，通常远用不到上限
+FLOW_CACHE_MB = float(os.environ.get('VSR_FLOW_CACHE_MB', 256))
+MODULES = ('backward_1', 'forward_1', 'backward_2', 'forward_2')  # 传播分支，按计算顺序
+
+
+class PropagationState:
+    """
+    一路视频（或其中一个空间分块）的正向传播状态，由上一窗口留给下一窗口：
+    最近两帧的 LR 图像（计算与下一窗口首帧之间的光流）、二者之间的正向光流、各正向分支在这两帧上的特征
+    """
+
+    def __init__(self):
+        self.lqs = []  # [(1, 3, h, w), ...]，最多两帧，由远到近
+        self.flow = None  # lqs[-2] -> lqs[-1] 的正向光流
+        self.feats = {}  # {分支: [特征, ...]}，与 lqs 一一对应
+
+
+class FlowCache:
+    """
+    SPyNet 光流缓存，键为 (参考帧下标, 支撑帧下标, 分块推理区域)，值为该区域上 spynet(参考帧, 支撑帧) 的光流（把支撑帧对齐到参考帧）
+    前瞻帧在相邻两步中重复出现时，同一对帧的光流只计算一次
+    """
+
+    def __init__(self, max_bytes=FLOW_CACHE_MB * 2**20):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, keys, compute):
+        """
+        取一组光流，缓存中没有的一次性交给 compute 计算后放入缓存
+        Args:
+            keys (list): [(参考帧下标, 支撑帧下标, 分块推理区域), ...]
+            compute (callable): 参数为缺失的键列表，返回对应的光流列表
+        Returns:
+            list: 与 keys 一一对应的光流
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                found[key] = self.entries[key]
+            elif key not in missing:
+                missing.append(key)
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            for key, flow in zip(missing, compute(missing)):
+                found[key] = flow
+                self.put(key, flow)
+        return [found[key] for key in keys]
+
+    def put(self, key, flow):
+        if key in self.entries:
+            return
+        self.entries[key] = flow
+        self.bytes += flow.numel() * flow.element_size()
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= old.numel() * old.element_size()
+
+    def evict_before(self, index):
+        """释放两帧都早于 index（已离开活动窗口）的光流"""
+        for key in [key for key in self.entries if max(key[0], key[1]) < index]:
+            old = self.entries.pop(key)
+            self.bytes -= old.numel() * old.element_size()
+
+
+def _propagate(generator, feats, module, frames, flows, history=(), history_flow=None):
+    """
+    沿 frames 的顺序做一个分支的二阶对齐传播（与 BasicVSRPlusPlusNet.propagate 相同的计算）
+    Args:
+        feats (dict): 已完成分支的特征 {分支: {帧下标: 特征}}，含 'spatial'
+        module (str): 当前分支，如 'forward_1'
+        frames (list): 按传播方向排列的窗口内帧下标
+        flows (list): flows[k] 把 frames[k-1]（k=0 时为 history[-1]）的特征对齐到 frames[k]
+        history (list): 传播方向上位于 frames[0] 之前的已知特征（最多两帧，由远到近）
+        history_flow (Tensor): history[-2] -> history[-1] 的光流
+    Returns:
+        dict: {帧下标: 特征}
+    """
+    import torch
+    from mmagic.models.utils import flow_warp
+
+    others = [m for m in feats if m not in ('spatial', module)]
+    done = list(history)
+    flow_prev = history_flow
+    result = {}
+    for k, idx in enumerate(frames):
+        feat_current = feats['spatial'][idx]
+        if done:
+            feat_prop = done[-1]
+            flow_n1 = flows[k]
+            cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
+            if len(done) > 1:
+                feat_n2 = done[-2]
+                flow_n2 = flow_n1 + flow_warp(flow_prev, flow_n1.permute(0, 2, 3, 1))
+                cond_n2 = flow_warp(feat_n2, flow_n2.permute(0, 2, 3, 1))
+            else:
+                feat_n2 = torch.zeros_like(feat_prop)
+                flow_n2 = torch.zeros_like(flow_n1)
+                cond_n2 = torch.zeros_like(cond_n1)
+            cond = torch.cat([cond_n1, feat_current, cond_n2], dim=1)
+            feat_prop = generator.deform_align[module](torch.cat([feat_prop, feat_n2], dim=1), cond, flow_n1, flow_n2)
+            flow_prev = flow_n1
+        else:
+            n, _, h, w = feat_current.shape
+            feat_prop = feat_current.new_zeros(n, generator.mid_channels, h, w)
+        feat = torch.cat([feat_current] + [feats[m][idx] for m in others] + [feat_prop], dim=1)
+        feat_prop = feat_prop + generator.backbone[module](feat)
+        done.append(feat_prop)
+        result[idx] = feat_prop
+    return result
+
+
+def propagate_window(generator, lqs, emit, state=None, flow_fn=None):
+    """
+    对一个窗口做 BasicVSR++ 的特征提取、光流、四个分支的传播，并上采样前 emit 帧
+    - 反向分支在窗口末尾冷启动，只覆盖本窗口（emit 帧之后的是只参与反向传播的前瞻帧）
+    - 正向分支从 state 中上一窗口最后两帧的特征继续传播，并把本窗口第 emit 帧处的状态写回 state
+    state 为 None 且 emit 等于窗口长度时，结果与 generator(lqs) 相同
+    Args:
+        generator: BasicVSRPlusPlusNet（model.generator）
+        lqs (Tensor): (1, T, 3, h, w)，取值 [0, 1]
+        emit (int): 输出的帧数（窗口前 emit 帧）
+        state (PropagationState): 正向传播状态，None 表示冷启动且不保存状态
+        flow_fn (callable): 提供光流的函数，参数为 [(参考帧, 支撑帧), ...]（窗口内下标，-1 为上一窗口末帧），
+            返回对应的光流列表（各为 (1, 2, h, w)）；None 时直接用 generator.spynet 计算
+    Returns:
+        Tensor: (1, emit, 3, 4h, 4w)
+    """
+    n, t, c, h, w = lqs.shape
+    if h < MIN_FLOW_SIZE or w < MIN_FLOW_SIZE:
+        raise ValueError(f"The height and width of low-res inputs must be at least {MIN_FLOW_SIZE}, but got {h} and {w}.")
+    history = state.lqs if state is not None else []
+
+    spatial = generator.feat_extract(lqs.view(-1, c, h, w))
+    spatial = spatial.view(n, t, -1, *spatial.shape[2:])
+    feats = {'spatial': {i: spatial[:, i] for i in range(t)}}
+
+    # 光流：backward[i] 把第 i+1 帧对齐到第 i 帧，forward[i] 把第 i-1 帧对齐到第 i 帧（forward[0] 来自上一窗口末帧）
+    frames = lqs[0]
+    backward = [None] * t
+    forward = [None] * t
+    if flow_fn is not None:
+        pairs = [(i, i + 1) for i in range(t - 1)] + [(i + 1, i) for i in range(t - 1)] + ([(0, -1)] if history else [])
+        flows = flow_fn(pairs)
+        backward[:t - 1] = flows[:t - 1]
+        forward[1:] = flows[t - 1:2 * (t - 1)]
+        if history:
+            forward[0] = flows[-1]
+    else:
+        if t > 1:
+            backward[:t - 1] = generator.spynet(frames[:-1], frames[1:]).split(1)
+            forward[1:] = generator.spynet(frames[1:], frames[:-1]).split(1)
+        if history:
+            forward[0] = generator.spynet(frames[:1], history[-1])
+
+    emitted = list(range(emit))
+    for module in MODULES:
+        if module.startswith('backward'):
+            order = list(range(t - 1, -1, -1))
+            feats[module] = _propagate(generator, feats, module, order, [None] + [backward[i] for i in order[1:]])
+        else:
+            # forward_1 需覆盖前瞻帧（其上的 backward_2 依赖它），forward_2 只需算输出的帧
+            order = list(range(t)) if module == 'forward_1' else emitted
+            carried = state.feats.get(module, []) if state is not None else []
+            feats[module] = _propagate(generator, feats, module, order, [forward[i] for i in order],
+                                       carried, state.flow if state is not None else None)
+
+    if state is not None:
+        # 保留第 emit 帧及其前一帧的正向状态（emit 为 1 时前一帧来自上一窗口）
+        for module in ('forward_1', 'forward_2'):
+            state.feats[module] = (state.feats.get(module, []) + [feats[module][i] for i in emitted])[-2:]
+        state.flow = forward[emit - 1] if emit > 1 or history else None
+        state.lqs = (history + [frames[i:i + 1] for i in emitted])[-2:]
+
+    generator.cpu_cache = False  # upsample 中按此判断特征是否在 CPU 上
+    return generator.upsample(lqs[:, :emit], {
+        'spatial': [feats['spatial'][i] for i in emitted],
+        **{module: [feats[module][i] for i in emitted] for module in MODULES},
+    })
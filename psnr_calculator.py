@@ -2,6 +2,7 @@ import os
 import cv2
 import numpy as np
 from glob import glob
+from video_io import FFmpegDecoder
 
 def read_video_frames(video_path_or_folder):
     """读取视频帧，如果是文件夹则按顺序读取图片"""
@@ -13,15 +14,18 @@ def read_video_frames(video_path_or_folder):
         )
         frames = [cv2.imread(f) for f in img_files]
     else:
-        # 读取视频
-        cap = cv2.VideoCapture(video_path_or_folder)
+        # 读取视频（ffmpeg rawvideo 解码，每帧直接读入各自的数组）
         frames = []
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frames.append(frame)
-        cap.release()
+        try:
+            decoder = FFmpegDecoder(video_path_or_folder)
+        except RuntimeError:
+            return frames
+        with decoder:
+            while True:
+                frame = decoder.read(np.empty(decoder.frame_shape, dtype=np.uint8))
+                if frame is None:
+                    break
+                frames.append(frame)
     return frames
 
 def resize_frame(frame, target_size):
@@ -67,9 +71,21 @@ def calculate_psnr(gt_path, target_path):
         psnr_val = compute_psnr(gt_frames[i], target_frames[i])
         psnr_list.append(psnr_val)
 
-    avg_psnr = np.mean(psnr_list)
+    avg_psnr = float(np.mean(psnr_list))  # 转为 Python float，便于直接放进 JSON 结果
     return avg_psnr
 
+def iter_frame_psnr(gt_path, target_path):
+    """
+    逐帧计算视频 PSNR（流式解码，不把整段视频读入内存，适合批量评测长视频）
+    目标帧尺寸与 GT 不同时缩放到 GT 尺寸，与 calculate_psnr 的处理一致
+    """
+    with FFmpegDecoder(gt_path) as gt, FFmpegDecoder(target_path) as target:
+        gt_size = (gt.width, gt.height)
+        for gt_frame, target_frame in zip(gt, target):
+            if target_frame.shape[:2] != gt_frame.shape[:2]:
+                target_frame = resize_frame(target_frame, gt_size)
+            yield float(compute_psnr(gt_frame, target_frame))
+
 
 
 # 示例用法
@@ -0,0 +1,947 @@
+import os
+import re
+import glob
+import queue
+import threading
+import cv2
+import numpy as np
+from psnr_calculator import read_video_frames, compute_psnr
+from video_io import FFmpegDecoder
+from propagation import PropagationState, FlowCache, propagate_window
+import tracing
+
+# 推理后端配置（通过环境变量选择，便于按部署环境切换最快的引擎）
+# VSR_BACKEND: mmagic | cpu_fast | torchscript | onnx | bicubic
+# VSR_MODEL_PATH: torchscript / onnx 后端使用的模型文件，或 export_model.py 的导出目录
+BACKEND = os.environ.get('VSR_BACKEND', 'mmagic')
+MODEL_PATH = os.environ.get('VSR_MODEL_PATH', '/workspace/models/export')
+CHECKPOINT_FILE = '/workspace/models/basicvsr_plusplus_c64n7_8x1_600k_reds4_20210217-db622b2f.pth'
+# 预序列化的 MMagic 模型（首次构建后整体 torch.save），之后启动直接反序列化，
+# 跳过 MMagicInferencer 的模型库/配置解析、注册表构建和权重加载；设为空字符串则不使用
+MODEL_ARTIFACT = os.environ.get('VSR_MODEL_ARTIFACT', '/workspace/models/basicvsr_pp_model.pt')
+SCALE = 4
+
+# 导出模型一致性测试：加载 torchscript/onnx 后端时，用该低清片段与 MMagic 输出对比，
+# PSNR 低于阈值则回退到 mmagic 后端（未设置视频时跳过测试）
+PARITY_VIDEO = os.environ.get('VSR_PARITY_VIDEO', '')
+PARITY_MIN_PSNR = float(os.environ.get('VSR_PARITY_MIN_PSNR', 40))  # 导出模型与 MMagic 输出之间的 PSNR 下限（dB）
+PARITY_MAX_FRAMES = 30
+
+# cpu_fast 执行配置（仅 CPU）：channels_last、inference_mode、支持时 bf16 autocast、可选 torch.compile、绑核
+CPU_THREADS = int(os.environ.get('VSR_CPU_THREADS', 0))  # 推理线程数，0 表示可用的物理核数
+CPU_AFFINITY = os.environ.get('VSR_CPU_AFFINITY', '')  # 绑定的 CPU 列表，如 "0-7" 或 "0,2,4,6"，为空不绑核
+CPU_BF16 = os.environ.get('VSR_CPU_BF16', 'auto')  # auto（CPU 支持 bf16 指令时开启）| 1 | 0
+CPU_CHANNELS_LAST = os.environ.get('VSR_CPU_CHANNELS_LAST', '1') == '1'
+# channels_last 的模型单独序列化一份（转换好的权重同样按内存映射加载、在进程间共享），与 VSR_MODEL_ARTIFACT 放在同一目录
+CHANNELS_LAST_ARTIFACT = f"{os.path.splitext(MODEL_ARTIFACT)[0]}_channels_last.pt" if MODEL_ARTIFACT else ''
+CPU_COMPILE = os.environ.get('VSR_CPU_COMPILE', '0') == '1'
+
+# mmagic 后端的推理精度：auto（GPU 上 fp16 autocast，CPU 上 fp32）| fp32 | fp16 | bf16（后两者为 autocast）
+PRECISION = os.environ.get('VSR_PRECISION', 'auto')
+PRECISIONS = ('auto', 'fp32', 'fp16', 'bf16')
+# 空间分块推理：帧宽或高超过 TILE_SIZE（LR 像素）时按块推理再拼接，块四周多带 TILE_PAD 像素避免接缝；0 表示不分块
+# 分块只降低大分辨率下的显存峰值，块边界附近的传播与对齐信息比整帧推理少
+TILE_SIZE = int(os.environ.get('VSR_TILE_SIZE', 0))
+TILE_PAD = 16
+# 逐窗口推理时的传播方式（仅 mmagic 系列后端，其他后端没有循环传播，按窗口独立推理）
+# bidirectional：每个窗口独立做完整的双向传播（mmagic 默认行为），窗口最后一帧到达并推理完后才能输出
+# causal：低延迟模式，每步输出 VSR_CAUSAL_STEP 帧，反向传播只看其后 VSR_LOOKAHEAD 帧，正向传播状态在步之间延续，
+#         每帧在其后 step + lookahead - 1 帧到达后即可输出，代价是反向分支看不到更远的未来帧
+PROPAGATION = os.environ.get('VSR_PROPAGATION', 'bidirectional')
+PROPAGATIONS = ('bidirectional', 'causal')
+LOOKAHEAD = int(os.environ.get('VSR_LOOKAHEAD', 2))
+CAUSAL_STEP = int(os.environ.get('VSR_CAUSAL_STEP', 1))
+# bidirectional 模式下在窗口之间延续正向传播的特征和光流（mmagic 系列后端），窗口不再冷启动；
+# 小窗口即可接近大窗口的画质，自动选择窗口长度时以 VSR_CARRY_SEQ_LEN 为上限，降低峰值显存
+CARRY_STATE = os.environ.get('VSR_CARRY_STATE', '1') == '1'
+CARRY_SEQ_LEN = int(os.environ.get('VSR_CARRY_SEQ_LEN', 16))
+
+# 逐窗口推理流水线：解码线程 -> 推理（调用线程）-> 写帧线程，相邻阶段之间最多 PIPELINE_DEPTH 个在途窗口
+PIPELINE_DEPTH = 2
+# 流式推理中一次送入 SPyNet 的帧对数上限，光流按块分批计算，峰值显存不随窗口长度增长
+FLOW_BATCH = 4
+
+
+def _default_device():
+    import torch
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def frames_to_tensor(frames, device):
+    """(T, H, W, 3) BGR uint8 -> (1, T, 3, H, W) RGB float32 [0, 1]"""
+    import torch
+    # 先把 uint8 原样拷到设备上再翻转通道：输入为锁页内存时主机到显存的拷贝走 DMA，且只拷 1/4 的数据量
+    x = torch.from_numpy(frames).to(device, non_blocking=True).flip(-1)
+    return x.permute(0, 3, 1, 2).unsqueeze(0).float().div_(255.)
+
+
+def tensor_to_frames(tensor):
+    """(1, T, 3, H, W) RGB [0, 1] -> (T, H, W, 3) BGR uint8"""
+    y = tensor[0].float().clamp(0, 1).mul(255.).round().byte()
+    return np.ascontiguousarray(y.permute(0, 2, 3, 1).cpu().numpy()[..., ::-1])
+
+
+def exported_graph_name(width, height, seq_len, ext):
+    """export_model.py 导出的静态图文件名，每个 (分辨率, 窗口长度) 一个"""
+    return f"basicvsr_pp_{width}x{height}_t{seq_len}.{ext}"
+
+
+def write_frames(frames, output_dir, start_index=0):
+    """按 {:08d}.png 写帧（与 MMagic result_out_dir 的输出格式一致）"""
+    for i, frame in enumerate(frames):
+        cv2.imwrite(os.path.join(output_dir, f"{start_index + i:08d}.png"), frame)
+
+
+def tile_boxes(h, w, tile):
+    """
+    空间分块：[((y, y1, x, x1), (py0, py1, px0, px1)), ...]，前者为块本身，后者为四周多带 TILE_PAD 像素的推理区域
+    tile 为 0 或帧不超过块大小时只有整帧一块
+    """
+    if not tile or (h <= tile and w <= tile):
+        return [((0, h, 0, w), (0, h, 0, w))]
+    boxes = []
+    for y in range(0, h, tile):
+        for x in range(0, w, tile):
+            y1, x1 = min(y + tile, h), min(x + tile, w)
+            boxes.append(((y, y1, x, x1),
+                          (max(y - TILE_PAD, 0), min(y1 + TILE_PAD, h), max(x - TILE_PAD, 0), min(x1 + TILE_PAD, w))))
+    return boxes
+
+
+def _alloc_frames(shape, device):
+    """预分配窗口帧缓冲；GPU 推理时用锁页内存"""
+    if device.startswith('cuda'):
+        import torch
+        return torch.empty(shape, dtype=torch.uint8, pin_memory=True).numpy()
+    return np.empty(shape, dtype=np.uint8)
+
+
+class FrameReader:
+    """逐帧读取视频文件或帧序列目录（按文件名排序），read(out) 把下一帧写入 out"""
+
+    def __init__(self, input_path):
+        self.decoder = None
+        self.files = None
+        if os.path.isdir(input_path):
+            self.files = iter(sorted(glob.glob(os.path.join(input_path, '*'))))
+        else:
+            self.decoder = FFmpegDecoder(input_path)
+
+    def read(self, out=None):
+        """
+        Returns:
+            np.ndarray: (H, W, 3) BGR uint8，读完时返回 None；给出 out 时直接写入 out 并返回 out
+        """
+        if self.decoder is not None:
+            # 视频文件：ffmpeg rawvideo 直接读入 out（流水线的预分配窗口缓冲）
+            frame = self.decoder.read(out)
+            return frame.copy() if frame is not None and out is None else frame
+        path = next(self.files, None)
+        if path is None:
+            return None
+        frame = cv2.imread(path)
+        if out is None:
+            return frame
+        out[...] = frame
+        return out
+
+    def close(self):
+        if self.decoder is not None:
+            self.decoder.close()
+
+
+def _queue_put(q, item, stop):
+    """往有界队列放入 item，流水线出错停止时放弃"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _queue_get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _artifact_meta(checkpoint):
+    """模型产物对应的权重文件与 torch 版本，任一变化时产物失效"""
+    import torch
+    stat = os.stat(checkpoint)
+    return {"checkpoint": os.path.abspath(checkpoint), "size": stat.st_size, "mtime": stat.st_mtime,
+            "torch": torch.__version__}
+
+
+def load_model_artifact(checkpoint, device, path=MODEL_ARTIFACT):
+    """
+    加载预序列化的模型
+    mmap=True 时权重直接映射产物文件（只读页，推理不会写权重），不拷贝到进程私有内存：
+    CPU 推理时同一台机器上的多个进程（多个服务实例、批处理脚本）共享页缓存中的同一份 BasicVSR++/SPyNet 权重；
+    GPU 推理时权重照常拷贝到显存
+    Returns:
+        torch.nn.Module: 模型，产物不存在或已失效时返回 None
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    import torch
+    try:
+        saved = torch.load(path, map_location=device, weights_only=False, mmap=True)
+    except Exception as e:
+        print(f"⚠️ 模型产物加载失败，重新构建: {e}")
+        return None
+    if saved.get("meta") != _artifact_meta(checkpoint):
+        print("⚠️ 模型产物与当前权重/torch 版本不一致，重新构建")
+        return None
+    return saved["model"].to(device).eval()
+
+
+def save_model_artifact(model, checkpoint, path=MODEL_ARTIFACT):
+    """
+    Returns:
+        bool: 是否保存成功
+    """
+    if not path:
+        return False
+    import torch
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        torch.save({"meta": _artifact_meta(checkpoint), "model": model}, tmp_path)
+        os.replace(tmp_path, path)
+        print(f"模型产物已保存: {path}")
+        return True
+    except Exception as e:
+        print(f"⚠️ 模型产物保存失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+class SRBackend:
+    """
+    超分推理后端基类
+    子类实现 infer_frames；process_video 按 max_seq_len 切窗逐段推理并写出帧序列
+    """
+    name = 'base'
+
+    def __init__(self):
+        # 同一后端实例在多个任务线程间共享，推理过程串行执行
+        self.lock = threading.Lock()
+        self.tile_size = TILE_SIZE
+        self.propagation = PROPAGATION
+        self.carry_state = CARRY_STATE
+
+    def infer_frames(self, frames):
+        """
+        对一个窗口的帧做超分
+        Args:
+            frames (np.ndarray): (T, H, W, 3) BGR uint8
+        Returns:
+            np.ndarray: (T, 4H, 4W, 3) BGR uint8
+        """
+        raise NotImplementedError
+
+    def infer_tiled(self, frames):
+        """
+        按 tile_size 空间分块推理一个窗口（不分块或帧不超过块大小时等同于 infer_frames）
+        每块四周多带 TILE_PAD 像素一起推理，拼接时只取块内部的输出
+        """
+        tile = self.tile_size
+        _, h, w, _ = frames.shape
+        if not tile or (h <= tile and w <= tile):
+            return self.infer_frames(frames)
+        out = np.empty((frames.shape[0], h * SCALE, w * SCALE, 3), dtype=np.uint8)
+        for (y, y1, x, x1), (py0, py1, px0, px1) in tile_boxes(h, w, tile):
+            sr = self.infer_frames(np.ascontiguousarray(frames[:, py0:py1, px0:px1]))
+            out[:, y * SCALE:y1 * SCALE, x * SCALE:x1 * SCALE] = \
+                sr[:, (y - py0) * SCALE:(y1 - py0) * SCALE, (x - px0) * SCALE:(x1 - px0) * SCALE]
+        return out
+
+    def open_stream(self, step=CAUSAL_STEP, lookahead=LOOKAHEAD):
+        """
+        创建流式推理（正向传播状态在步之间延续），没有循环传播的后端返回 None
+        Returns:
+            PropagationStream: 每个视频/直播流单独创建一个
+        """
+        return None
+
+    def auto_seq_len_cap(self):
+        """自动选择窗口长度时的上限，None 表示只受内存限制"""
+        return None
+
+    def open_video_stream(self, max_seq_len):
+        """
+        process_video 使用的流式推理：causal 模式按 VSR_CAUSAL_STEP / VSR_LOOKAHEAD 逐步输出，
+        窗口之间延续状态时每个窗口一步；返回 None 表示各窗口独立调用 infer_tiled
+        """
+        if self.propagation == 'causal':
+            return self.open_stream()
+        if self.carry_state:
+            return self.open_stream(step=max_seq_len, lookahead=0)
+        return None
+
+    def infer_clip(self, frames, max_seq_len=10):
+        """
+        按 process_video 的推理路径（open_video_stream 的流式推理，或逐窗口 infer_tiled）推理内存中的一段帧，
+        不含解码和写帧，用于基准测试
+        Returns:
+            np.ndarray: (T, 4H, 4W, 3) BGR uint8
+        """
+        stream = self.open_video_stream(max_seq_len)
+        outputs = []
+        for i in range(0, len(frames), max_seq_len):
+            window = np.asarray(frames[i:i + max_seq_len])
+            outputs += [self.infer_tiled(window)] if stream is None else stream.push(window)
+        if stream is not None:
+            outputs += stream.flush()
+        return np.concatenate(outputs)
+
+    def process_video(self, input_path, output_dir, max_seq_len=10):
+        """
+        视频超分
+        Args:
+            input_path (str): 输入视频路径或帧序列目录
+            output_dir (str): 输出帧目录（{:08d}.png）
+            max_seq_len (int): 一次推理的帧数
+        """
+        reader = FrameReader(input_path)
+        first = reader.read()
+        if first is None:
+            reader.close()
+            raise ValueError("无法读取视频帧")
+        os.makedirs(output_dir, exist_ok=True)
+
+        # 三级流水线：解码线程把下一个窗口预取到预分配的缓冲中，调用线程推理当前窗口，写帧线程写出上一个窗口的结果
+        trace = tracing.current()
+        shape = (max_seq_len,) + first.shape
+        free = queue.Queue()  # 空闲的窗口缓冲，推理读完后归还
+        for _ in range(PIPELINE_DEPTH + 1):
+            free.put(_alloc_frames(shape, getattr(self, 'device', 'cpu')))
+        decoded = queue.Queue(maxsize=PIPELINE_DEPTH)
+        results = queue.Queue(maxsize=PIPELINE_DEPTH)
+        stop = threading.Event()
+        errors = []
+
+        def decode():
+            try:
+                with tracing.activate(trace):
+                    start, pending = 0, first
+                    while pending is not None:
+                        buf = _queue_get(free, stop)
+                        if buf is None:
+                            return
+                        with tracing.span('decode', start=start):
+                            buf[0] = pending
+                            n = 1
+                            while n < max_seq_len and reader.read(buf[n]) is not None:
+                                n += 1
+                            pending = reader.read() if n == max_seq_len else None
+                        if not _queue_put(decoded, (start, buf, n), stop):
+                            return
+                        start += n
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                reader.close()
+                _queue_put(decoded, None, stop)
+
+        def encode():
+            try:
+                with tracing.activate(trace):
+                    while True:
+                        item = _queue_get(results, stop)
+                        if item is None:
+                            return
+                        start, sr_frames = item
+                        with tracing.span('write_frames', start=start, frames=len(sr_frames)):
+                            write_frames(sr_frames, output_dir, start_index=start)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        # 有循环传播的后端按流式推理，正向传播状态在窗口之间延续：
+        # causal 模式输出比输入晚 step + lookahead - 1 帧，输入结束后再输出剩余的帧；bidirectional 模式每个窗口推理完即输出
+        stream = self.open_video_stream(max_seq_len)
+        with self.lock:
+            threads = [threading.Thread(target=decode, daemon=True), threading.Thread(target=encode, daemon=True)]
+            for thread in threads:
+                thread.start()
+            try:
+                written = 0
+                while True:
+                    item = _queue_get(decoded, stop)
+                    if item is None:
+                        outputs = stream.flush() if stream is not None else []
+                    else:
+                        start, buf, n = item
+                        with tracing.span('window', cat='inference', start=start, frames=n):
+                            outputs = [self.infer_tiled(buf[:n])] if stream is None else stream.push(buf[:n])
+                        free.put(buf)
+                    if outputs:
+                        sr_frames = np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+                        if not _queue_put(results, (written, sr_frames), stop):
+                            break
+                        written += len(sr_frames)
+                    if item is None:
+                        break
+                _queue_put(results, None, stop)
+            except BaseException:
+                stop.set()
+                raise
+            finally:
+                for thread in threads:
+                    thread.join()
+        if errors:
+            raise errors[0]
+
+
+class PropagationStream:
+    """
+    流式超分：帧按到达顺序推入，每攒够 step + lookahead 帧推理一步，输出前 step 帧，正向传播状态在步之间延续
+    分块推理时每个空间分块各自保存状态；推入的帧会被复制，调用方可以复用输入缓冲
+    有前瞻帧时 SPyNet 光流按空间分块、每批至多 FLOW_BATCH 对计算并缓存（FlowCache），前瞻帧在下一步重复出现时直接复用；
+    没有前瞻帧时相邻两步没有共同的帧对，光流由 infer_window 在窗口内直接计算，不经过缓存
+    """
+
+    def __init__(self, backend, step=CAUSAL_STEP, lookahead=LOOKAHEAD):
+        """
+        Args:
+            backend (MMagicBackend): 提供 infer_window 的推理后端
+            step (int): 每步输出的帧数
+            lookahead (int): 每步在输出帧之后多带的前瞻帧数（只参与反向传播）
+        """
+        self.backend = backend
+        self.step = max(1, step)
+        self.lookahead = max(0, lookahead)
+        self.pending = []
+        self.index = 0  # pending[0] 的帧序号
+        self.previous = None  # 上一步最后输出的帧（计算与本步首帧之间的光流）
+        self.states = {}  # {分块推理区域: PropagationState}
+        self.flow_cache = FlowCache() if self.lookahead else None
+        self.flows_computed = 0  # 已计算的 SPyNet 光流数（各空间分块分别计）
+
+    @property
+    def delay(self):
+        """一帧推入后，最多还需再推入多少帧才能输出"""
+        return self.step + self.lookahead - 1
+
+    def _frame(self, index):
+        return self.previous if index == self.index - 1 else self.pending[index - self.index]
+
+    @property
+    def flows_reused(self):
+        return self.flow_cache.hits if self.flow_cache is not None else 0
+
+    def _flows(self, pairs, box):
+        """propagate_window 的 flow_fn：窗口内下标的帧对 -> 分块推理区域上的光流（按块缓存，每批至多 FLOW_BATCH 对）"""
+        py0, py1, px0, px1 = box
+
+        def crops(indices):
+            return np.ascontiguousarray(np.stack([self._frame(i)[py0:py1, px0:px1] for i in indices]))
+
+        def compute(keys):
+            flows = []
+            for i in range(0, len(keys), FLOW_BATCH):
+                batch = keys[i:i + FLOW_BATCH]
+                flows += self.backend.infer_flows(crops([ref for ref, _, _ in batch]), crops([supp for _, supp, _ in batch])).split(1)
+            self.flows_computed += len(keys)
+            return flows
+
+        return self.flow_cache.fetch([(self.index + ref, self.index + supp, box) for ref, supp in pairs], compute)
+
+    def _run(self, emit, lookahead):
+        frames = np.stack(self.pending[:emit + lookahead])
+        _, h, w, _ = frames.shape
+        out = np.empty((emit, h * SCALE, w * SCALE, 3), dtype=np.uint8)
+        for (y, y1, x, x1), box in tile_boxes(h, w, self.backend.tile_size):
+            py0, py1, px0, px1 = box
+            state = self.states.setdefault(box, PropagationState())
+            if self.flow_cache is not None:
+                flow_fn = lambda pairs, box=box: self._flows(pairs, box)
+            else:
+                flow_fn = None
+                self.flows_computed += 2 * (len(frames) - 1) + bool(state.lqs)  # 窗口内相邻帧的双向光流 + 与上一步末帧的光流
+            sr = self.backend.infer_window(np.ascontiguousarray(frames[:, py0:py1, px0:px1]), emit, state, flow_fn)
+            out[:, y * SCALE:y1 * SCALE, x * SCALE:x1 * SCALE] = \
+                sr[:, (y - py0) * SCALE:(y1 - py0) * SCALE, (x - px0) * SCALE:(x1 - px0) * SCALE]
+        self.previous = self.pending[emit - 1]
+        del self.pending[:emit]
+        self.index += emit
+        if self.flow_cache is not None:
+            self.flow_cache.evict_before(self.index)  # 之后只会用到与本步末帧之后的帧相关的光流
+        return out
+
+    def push(self, frames):
+        """
+        推入若干帧
+        Args:
+            frames (np.ndarray): (T, H, W, 3) BGR uint8
+        Returns:
+            list[np.ndarray]: 已可以输出的超分帧（按顺序的若干段，可能为空）
+        """
+        self.pending.extend(np.array(frames))
+        outputs = []
+        while len(self.pending) >= self.step + self.lookahead:
+            outputs.append(self._run(self.step, self.lookahead))
+        return outputs
+
+    def flush(self):
+        """输入结束：输出剩余的帧（末尾的帧之后没有更多前瞻帧）"""
+        outputs = []
+        while self.pending:
+            emit = min(self.step, len(self.pending))
+            outputs.append(self._run(emit, min(self.lookahead, len(self.pending) - emit)))
+        return outputs
+
+
+class MMagicBackend(SRBackend):
+    """MMagic BasicVSR++ 推理（默认后端）"""
+    name = 'mmagic'
+
+    def __init__(self, device=None, checkpoint=CHECKPOINT_FILE, artifact=MODEL_ARTIFACT):
+        super().__init__()
+        self.device = device or _default_device()
+        self.precision = PRECISION
+        # 优先加载预序列化的模型；此时没有 MMagic 推理器，process_video 走基类的逐窗口流程
+        self.editor = None
+        self.model = load_model_artifact(checkpoint, self.device, artifact)
+        if self.model is None:
+            from mmagic.apis import MMagicInferencer
+            self.editor = MMagicInferencer(
+                model_name='basicvsr_pp',
+                device=self.device,
+                model_ckpt=checkpoint
+            )
+            self.model = self.editor.inferencer.inferencer.model
+            self._convert_model(self.model)
+            if save_model_artifact(self.model, checkpoint, artifact) and self.device == 'cpu':
+                # CPU 上换成映射产物文件的模型，首个进程也与之后启动的进程共享同一份权重
+                model = load_model_artifact(checkpoint, self.device, artifact)
+                if model is not None:
+                    self.model, self.editor = model, None
+
+    def _convert_model(self, model):
+        """新构建的模型在序列化之前的一次性转换（子类覆盖），产物中保存转换后的权重"""
+
+    def _autocast(self):
+        import torch
+        device_type = torch.device(self.device).type  # autocast 只接受设备类型，不带序号（cuda:1 -> cuda）
+        if self.precision == 'fp32':
+            return torch.autocast(device_type=device_type, enabled=False)
+        if self.precision in ('fp16', 'bf16'):
+            return torch.autocast(device_type=device_type, dtype=torch.float16 if self.precision == 'fp16' else torch.bfloat16)
+        return torch.autocast(device_type=device_type, dtype=torch.float16 if device_type == "cuda" else torch.float32)
+
+    def infer_frames(self, frames):
+        import torch
+        with torch.no_grad(), self._autocast():
+            outputs = self.model(inputs=frames_to_tensor(frames, self.device), mode='tensor')
+        return tensor_to_frames(outputs)
+
+    def infer_window(self, frames, emit, state, flow_fn=None):
+        """推理一个窗口并输出前 emit 帧，正向传播从 state 继续（见 propagation.propagate_window）"""
+        import torch
+        with torch.no_grad(), self._autocast():
+            outputs = propagate_window(self.model.generator, frames_to_tensor(frames, self.device), emit, state, flow_fn)
+        return tensor_to_frames(outputs)
+
+    def infer_flows(self, refs, supps):
+        """SPyNet 光流 spynet(refs, supps)：(N, H, W, 3) BGR uint8 x2 -> (N, 2, H, W)，留在推理设备上"""
+        import torch
+        with torch.no_grad(), self._autocast():
+            return self.model.generator.spynet(frames_to_tensor(refs, self.device)[0], frames_to_tensor(supps, self.device)[0])
+
+    def open_stream(self, step=CAUSAL_STEP, lookahead=LOOKAHEAD):
+        return PropagationStream(self, step, lookahead)
+
+    def auto_seq_len_cap(self):
+        return CARRY_SEQ_LEN if self.carry_state and self.propagation == 'bidirectional' else None
+
+    def _trace_windows(self, trace):
+        """
+        MMagic 在 editor.infer 内部逐窗口调用 self.model，用 forward hook 把每个窗口记为一个 span
+        Returns:
+            list: hook 句柄，推理结束后需要 remove
+        """
+        import torch
+        tokens = []
+
+        def pre_hook(module, args, kwargs):
+            frames = kwargs['inputs'].shape[1] if 'inputs' in kwargs else None
+            tokens.append(trace.start('window', cat='inference', frames=frames))
+
+        def post_hook(module, args, kwargs, output):
+            if self.device.startswith('cuda'):
+                torch.cuda.synchronize(self.device)  # 等 GPU 算完，span 才是真实的推理耗时
+            trace.finish(tokens.pop())
+
+        return [self.model.register_forward_pre_hook(pre_hook, with_kwargs=True),
+                self.model.register_forward_hook(post_hook, with_kwargs=True)]
+
+    def process_video(self, input_path, output_dir, max_seq_len=10):
+        if self.editor is None or self.propagation == 'causal' or self.carry_state:
+            return SRBackend.process_video(self, input_path, output_dir, max_seq_len)
+        # 走 MMagic 自己的读帧与写帧流程（各窗口独立推理）
+        import torch
+        with self.lock:
+            self.editor.inferencer.inferencer.extra_parameters['max_seq_len'] = max_seq_len
+            torch.cuda.empty_cache()
+            trace = tracing.current()
+            hooks = self._trace_windows(trace) if trace is not None else []
+            try:
+                # editor.infer 内部依次为：读帧 -> 逐窗口推理（window span）-> 写 PNG
+                with tracing.span('mmagic_infer'), self._autocast():
+                    self.editor.infer(video=input_path, result_out_dir=output_dir)
+            finally:
+                for hook in hooks:
+                    hook.remove()
+            torch.cuda.empty_cache()
+
+
+class MMagicHalfBackend(MMagicBackend):
+    """
+    fp16 推理的 MMagic BasicVSR++（仅 GPU），作为过载时的降级档位
+    与 mmagic 后端共用已加载的模型和推理锁，只把推理精度切换为 fp16 autocast：
+    降级发生在过载时，不能再在共享的 GPU 上加载第二份模型（内存模型也没有计入它）
+    """
+    name = 'mmagic_fp16'
+
+    def __init__(self):
+        SRBackend.__init__(self)
+        base = get_backend(MMagicBackend.name)
+        self.device = base.device
+        self.model = base.model
+        self.editor = None
+        self.lock = base.lock  # 同一份模型，与 mmagic 后端的任务串行推理
+        self.precision = 'fp16'  # editor 为 None，process_video 走基类的逐窗口流程
+
+
+def _parse_cpu_list(value):
+    """"0-3,6" -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in value.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        elif part.strip():
+            cpus.add(int(part))
+    return cpus
+
+
+def _physical_cores(cpus):
+    """cpus 中的物理核数（超线程的兄弟逻辑核只算一个）"""
+    cores = set()
+    for cpu in cpus:
+        try:
+            with open(f'/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list') as f:
+                cores.add(f.read().strip())
+        except OSError:
+            cores.add(str(cpu))
+    return len(cores)
+
+
+def cpu_supports_bf16():
+    """CPU 是否有原生 bf16 指令（AVX512-BF16 / AMX），没有时 bf16 只会更慢"""
+    import torch
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+        return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def _keep_fp32(module):
+    """bf16 autocast 下让该模块以 fp32 运行（mmcv 可变形卷积的 CPU 实现不支持 bf16，SPyNet 光流对精度敏感）"""
+    import torch
+    forward = module.forward
+
+    def forward_fp32(*args, **kwargs):
+        args = [a.float() if torch.is_tensor(a) and a.is_floating_point() else a for a in args]
+        with torch.autocast('cpu', enabled=False):
+            return forward(*args, **kwargs)
+
+    module.forward = forward_fp32
+
+
+# cpu_fast 在 VSR_CPU_COMPILE=1 时编译的 generator 子模块：propagate_window 与 generator.forward 都直接调用它们，
+# 两条路径都用上编译结果；可变形对齐是 mmcv 的自定义算子，不编译
+COMPILED_MODULES = ('feat_extract', 'spynet', 'reconstruction', 'upsample1', 'upsample2', 'conv_hr', 'conv_last')
+
+
+class MMagicCpuFastBackend(MMagicBackend):
+    """
+    面向 CPU 优化的 MMagic BasicVSR++：
+    - 卷积权重转为 channels_last（oneDNN 的原生布局，省去每层的格式转换）
+    - inference_mode 代替 no_grad，去掉版本计数等开销
+    - VSR_PRECISION=auto 时 CPU 支持 bf16 指令则用 bf16 autocast，其余取值与 mmagic 后端相同（可变形对齐和 SPyNet 保持 fp32）
+    - 可选 torch.compile（逐个编译子模块，见 COMPILED_MODULES），显式设置推理线程数并绑核
+    注：channels_last 的模型序列化到单独的产物文件（CHANNELS_LAST_ARTIFACT），加载后不再转换，
+    多个 cpu_fast 进程共享映射的转换后权重；与 mmagic 后端不共享（两份文件各占一份页缓存）
+    """
+    name = 'cpu_fast'
+
+    def __init__(self, device=None, checkpoint=CHECKPOINT_FILE):
+        import torch
+        super().__init__('cpu', checkpoint, CHANNELS_LAST_ARTIFACT if CPU_CHANNELS_LAST else MODEL_ARTIFACT)
+        self.cpus = _parse_cpu_list(CPU_AFFINITY) if CPU_AFFINITY else None
+        if self.cpus:
+            os.sched_setaffinity(0, self.cpus)
+        self.threads = CPU_THREADS or _physical_cores(os.sched_getaffinity(0))
+        torch.set_num_threads(self.threads)
+        self.bf16 = cpu_supports_bf16() if CPU_BF16 == 'auto' else CPU_BF16 == '1'
+
+        generator = self.model.generator
+        # 精度可能在运行时改变（如 benchmarks/sweep.py），不论当前精度都让这两类模块以 fp32 运行
+        for module in generator.modules():
+            if type(module).__name__ in ('SecondOrderDeformableAlignment', 'SPyNet'):
+                _keep_fp32(module)
+        if CPU_COMPILE:
+            for name in COMPILED_MODULES:
+                setattr(generator, name, torch.compile(getattr(generator, name)))
+            for name in generator.backbone:
+                generator.backbone[name] = torch.compile(generator.backbone[name])
+        print(f"cpu_fast: threads={self.threads}, affinity={CPU_AFFINITY or '-'}, bf16={self.bf16}, "
+              f"precision={self.precision}, channels_last={CPU_CHANNELS_LAST}, compile={CPU_COMPILE}")
+
+    def _convert_model(self, model):
+        import torch
+        if CPU_CHANNELS_LAST:
+            model.generator.to(memory_format=torch.channels_last)
+
+    def _autocast(self):
+        import torch
+        import contextlib
+        if self.precision == 'auto':
+            return torch.autocast('cpu', dtype=torch.bfloat16) if self.bf16 else contextlib.nullcontext()
+        return super()._autocast()
+
+    def _bind(self):
+        """亲和性按线程生效，推理可能在另一个 worker 线程中执行"""
+        if self.cpus:
+            os.sched_setaffinity(0, self.cpus)
+
+    def infer_frames(self, frames):
+        import torch
+        self._bind()
+        with torch.inference_mode(), self._autocast():
+            outputs = self.model(inputs=frames_to_tensor(frames, 'cpu'), mode='tensor')
+        return tensor_to_frames(outputs)
+
+    def infer_window(self, frames, emit, state, flow_fn=None):
+        import torch
+        self._bind()
+        with torch.inference_mode(), self._autocast():
+            outputs = propagate_window(self.model.generator, frames_to_tensor(frames, 'cpu'), emit, state, flow_fn)
+        return tensor_to_frames(outputs)
+
+    def infer_flows(self, refs, supps):
+        import torch
+        self._bind()
+        with torch.inference_mode(), self._autocast():
+            return self.model.generator.spynet(frames_to_tensor(refs, 'cpu')[0], frames_to_tensor(supps, 'cpu')[0])
+
+    process_video = SRBackend.process_video
+
+
+class ExportedGraphBackend(SRBackend):
+    """
+    导出模型后端基类
+    model_path 为单个模型文件（动态形状），或 export_model.py 的导出目录（每个 (分辨率, 窗口长度) 一个静态图）。
+    静态图按输入分辨率选择窗口长度不小于当前窗口的图，末尾不足的帧重复最后一帧补齐。
+    """
+    extension = ''
+
+    def __init__(self, model_path=MODEL_PATH):
+        super().__init__()
+        self.model_path = model_path
+        self.graph_paths = {}  # (width, height, seq_len) -> path；动态形状模型的 key 为 None
+        if os.path.isdir(model_path):
+            pattern = re.compile(r'^basicvsr_pp_(\d+)x(\d+)_t(\d+)\.' + self.extension + '$')
+            for name in os.listdir(model_path):
+                m = pattern.match(name)
+                if m:
+                    self.graph_paths[tuple(int(v) for v in m.groups())] = os.path.join(model_path, name)
+        elif os.path.isfile(model_path):
+            self.graph_paths[None] = model_path
+        if not self.graph_paths:
+            raise FileNotFoundError(f"{self.name} 模型不存在: {model_path}")
+        self.graphs = {}
+
+    def _load(self, path):
+        raise NotImplementedError
+
+    def _run(self, graph, frames):
+        raise NotImplementedError
+
+    def _graph(self, key):
+        if key not in self.graphs:
+            self.graphs[key] = self._load(self.graph_paths[key])
+        return self.graphs[key]
+
+    def _select_seq_len(self, width, height, seq_len):
+        lengths = sorted(k[2] for k in self.graph_paths if k is not None and k[:2] == (width, height))
+        if not lengths:
+            raise ValueError(f"没有 {width}x{height} 的导出模型，请先运行 export_model.py --resolution {width}x{height}")
+        for length in lengths:
+            if length >= seq_len:
+                return length
+        return lengths[-1]
+
+    def infer_frames(self, frames):
+        if None in self.graph_paths:
+            return self._run(self._graph(None), frames)
+        t, h, w = frames.shape[:3]
+        seq_len = self._select_seq_len(w, h, t)
+        graph = self._graph((w, h, seq_len))
+        outputs = []
+        for i in range(0, t, seq_len):
+            window = frames[i:i + seq_len]
+            n = len(window)
+            if n < seq_len:
+                window = np.concatenate([window, np.repeat(window[-1:], seq_len - n, axis=0)])
+            outputs.append(self._run(graph, window)[:n])
+        return np.concatenate(outputs)
+
+
+class TorchScriptBackend(ExportedGraphBackend):
+    """TorchScript 导出的 BasicVSR++（输入 (1, T, 3, H, W) RGB [0, 1]）"""
+    name = 'torchscript'
+    extension = 'pt'
+
+    def __init__(self, model_path=MODEL_PATH, device=None):
+        super().__init__(model_path)
+        self.device = device or _default_device()
+
+    def _load(self, path):
+        import torch
+        import torchvision  # 注册导出图中用到的 torchvision::deform_conv2d 算子
+        return torch.jit.load(path, map_location=self.device).eval()
+
+    def _run(self, graph, frames):
+        import torch
+        with torch.inference_mode():
+            outputs = graph(frames_to_tensor(frames, self.device))
+        return tensor_to_frames(outputs)
+
+
+class OnnxBackend(ExportedGraphBackend):
+    """ONNX Runtime 推理（CPU Execution Provider）"""
+    name = 'onnx'
+    extension = 'onnx'
+
+    def _load(self, path):
+        import onnxruntime as ort
+        try:
+            return ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        except Exception as e:
+            if 'DeformConv' in str(e):
+                raise RuntimeError(f"onnxruntime {ort.__version__} 的 CPU EP 不支持 DeformConv（opset 19），"
+                                   f"请升级 onnxruntime 或改用 torchscript 后端: {e}") from e
+            raise
+
+    def _run(self, graph, frames):
+        x = frames[..., ::-1].transpose(0, 3, 1, 2)[None].astype(np.float32) / 255.
+        outputs = graph.run(None, {graph.get_inputs()[0].name: x})[0]
+        y = np.clip(outputs[0], 0, 1) * 255.
+        return np.ascontiguousarray(np.round(y).astype(np.uint8).transpose(0, 2, 3, 1)[..., ::-1])
+
+
+class BicubicBackend(SRBackend):
+    """双三次 ×4 插值替身：确定性、无需 GPU/模型权重，用于 CPU 机器上的全流程测试与压测"""
+    name = 'bicubic'
+
+    def infer_frames(self, frames):
+        h, w = frames.shape[1:3]
+        return np.stack([
+            cv2.resize(f, (w * SCALE, h * SCALE), interpolation=cv2.INTER_CUBIC) for f in frames
+        ])
+
+
+class BicubicSharpenBackend(BicubicBackend):
+    """双三次 ×4 + USM 锐化：过载时的快速降级档位"""
+    name = 'bicubic_sharpen'
+    SHARPEN_AMOUNT = 0.6
+    SHARPEN_SIGMA = 1.5
+
+    def infer_frames(self, frames):
+        upscaled = super().infer_frames(frames)
+        return np.stack([
+            cv2.addWeighted(f, 1 + self.SHARPEN_AMOUNT,
+                            cv2.GaussianBlur(f, (0, 0), self.SHARPEN_SIGMA), -self.SHARPEN_AMOUNT, 0)
+            for f in upscaled
+        ])
+
+
+BACKENDS = {
+    MMagicBackend.name: MMagicBackend,
+    MMagicHalfBackend.name: MMagicHalfBackend,
+    MMagicCpuFastBackend.name: MMagicCpuFastBackend,
+    TorchScriptBackend.name: TorchScriptBackend,
+    OnnxBackend.name: OnnxBackend,
+    BicubicBackend.name: BicubicBackend,
+    BicubicSharpenBackend.name: BicubicSharpenBackend,
+}
+
+_backend_cache = {}
+_backend_cache_lock = threading.RLock()
+
+
+def check_parity(backend, reference, video_path, max_seq_len=10, max_frames=PARITY_MAX_FRAMES):
+    """
+    一致性测试：同一段低清视频分别用 backend 和参考后端推理，比较两者的输出
+    Args:
+        backend (SRBackend): 待测后端（如导出的 torchscript/onnx 模型）
+        reference (SRBackend): 参考后端（MMagic）
+        video_path (str): 低清测试片段
+        max_seq_len (int): 窗口长度
+        max_frames (int): 最多测试的帧数
+    Returns:
+        float: 两者输出的平均 PSNR（Y 通道，dB），越高越一致
+    """
+    frames = read_video_frames(video_path)[:max_frames]
+    if len(frames) == 0:
+        raise ValueError("无法读取视频帧")
+    psnr_list = []
+    for i in range(0, len(frames), max_seq_len):
+        window = np.stack(frames[i:i + max_seq_len])
+        outputs = backend.infer_frames(window)
+        ref_outputs = reference.infer_frames(window)
+        psnr_list += [compute_psnr(ref, out) for ref, out in zip(ref_outputs, outputs)]
+    return float(np.mean(psnr_list))
+
+
+def _create_backend(name, **kwargs):
+    backend = BACKENDS[name](**kwargs)
+    if isinstance(backend, ExportedGraphBackend) and PARITY_VIDEO:
+        reference = get_backend(MMagicBackend.name)
+        psnr = check_parity(backend, reference, PARITY_VIDEO)
+        if psnr < PARITY_MIN_PSNR:
+            print(f"⚠️ {name} 后端一致性测试未通过: PSNR(vs MMagic) = {psnr:.2f} dB < {PARITY_MIN_PSNR} dB，回退到 mmagic 后端")
+            return reference
+        print(f"✅ {name} 后端一致性测试通过: PSNR(vs MMagic) = {psnr:.2f} dB")
+    return backend
+
+
+def get_backend(name=None, **kwargs):
+    """
+    获取推理后端实例（同名后端只加载一次模型，后续任务复用）
+    Args:
+        name (str): 后端名称，默认取环境变量 VSR_BACKEND
+    Returns:
+        SRBackend: 推理后端
+    """
+    name = name or BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"未知推理后端: {name}，可选: {', '.join(BACKENDS)}")
+    with _backend_cache_lock:
+        if name not in _backend_cache:
+            _backend_cache[name] = _create_backend(name, **kwargs)
+        return _backend_cache[name]
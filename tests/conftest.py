@@ -0,0 +1,31 @@
+import sys
+from pathlib import Path
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+
+@pytest.fixture
+def generator():
+    """随机初始化的小 BasicVSRPlusPlusNet（需要 mmagic/mmcv），可变形对齐的偏移量分支也随机化，不只是光流"""
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('mmagic')
+    from mmagic.models.editors import BasicVSRPlusPlusNet
+    torch.manual_seed(0)
+    net = BasicVSRPlusPlusNet(mid_channels=16, num_blocks=2)
+    with torch.no_grad():
+        for module in net.deform_align.values():
+            for param in module.conv_offset.parameters():
+                param.normal_(0, 0.01)
+    return net.eval()
+
+
+@pytest.fixture
+def lqs():
+    """(1, 6, 3, 64, 80) 的随机低清输入；取值平滑一些，SPyNet 的光流不至于全是噪声"""
+    torch = pytest.importorskip('torch')
+    import torch.nn.functional as F
+    torch.manual_seed(1)
+    base = F.interpolate(torch.rand(6, 3, 16, 20), size=(64, 80), mode='bilinear', align_corners=False)
+    return base.unsqueeze(0)
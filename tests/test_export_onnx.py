@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('onnxruntime')
+import export_model
+from psnr_calculator import compute_psnr
+from sr_backends import OnnxBackend, PARITY_MIN_PSNR, exported_graph_name, frames_to_tensor, tensor_to_frames
+
+
+def test_onnx_backend_matches_generator(generator, lqs, tmp_path):
+    """导出的 ONNX 图（opset 19 DeformConv）能被 onnxruntime CPU EP 加载，输出与原网络一致"""
+    _, t, _, h, w = lqs.shape
+    frames = tensor_to_frames(lqs)  # 后端的实际输入是 8 位帧
+    with torch.no_grad():
+        expected = tensor_to_frames(generator(frames_to_tensor(frames, 'cpu')))
+
+    export_model._register_deform_conv_symbolic()
+    wrapper = export_model.ExportWrapper(export_model.prepare_generator_for_export(generator))
+    paths = export_model.export(wrapper, w, h, t, str(tmp_path), ['onnx'], 'cpu')
+    assert [p.rsplit('/', 1)[-1] for p in paths] == [exported_graph_name(w, h, t, 'onnx')]
+
+    outputs = OnnxBackend(model_path=str(tmp_path)).infer_frames(frames)
+    assert outputs.shape == expected.shape
+    psnr = np.mean([compute_psnr(ref, out) for ref, out in zip(expected, outputs)])
+    assert psnr >= PARITY_MIN_PSNR
@@ -0,0 +1,64 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+from propagation import PropagationState, propagate_window
+
+
+def _flow_fn(generator, lqs, offset):
+    """按整段片段的帧下标计算光流的 flow_fn（窗口内下标 + offset，-1 即上一窗口末帧）"""
+    frames = lqs[0]
+
+    def flow_fn(pairs):
+        refs = torch.stack([frames[offset + ref] for ref, _ in pairs])
+        supps = torch.stack([frames[offset + supp] for _, supp in pairs])
+        return list(generator.spynet(refs, supps).split(1))
+
+    return flow_fn
+
+
+def _mse(a, b):
+    return float(((a - b) ** 2).mean())
+
+
+def test_full_window_matches_generator(generator, lqs):
+    """没有状态、输出整个窗口时与 generator(lqs) 相同"""
+    with torch.no_grad():
+        expected = generator(lqs)
+        outputs = propagate_window(generator, lqs, emit=lqs.shape[1])
+    torch.testing.assert_close(outputs, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize('use_flow_fn', [False, True])
+def test_carried_state_matches_single_pass(generator, lqs, use_flow_fn):
+    """
+    两个窗口之间延续正向状态，与整段一次推理相同：第一个窗口把其后的帧都作为前瞻帧（反向分支看到的未来帧与整段推理相同，
+    去掉了分窗口传播在反向分支上的固有差异），第二个窗口的正向分支只能从状态中得到前面的帧
+    """
+    t = lqs.shape[1]
+    split = t // 2
+    state = PropagationState()
+    with torch.no_grad():
+        expected = generator(lqs)
+        first = propagate_window(generator, lqs, split, state, _flow_fn(generator, lqs, 0) if use_flow_fn else None)
+        second = propagate_window(generator, lqs[:, split:], t - split, state,
+                                  _flow_fn(generator, lqs, split) if use_flow_fn else None)
+    torch.testing.assert_close(torch.cat([first, second], dim=1), expected, rtol=1e-4, atol=1e-5)
+
+
+def test_carry_without_lookahead_beats_cold_start(generator, lqs):
+    """
+    不带前瞻帧的窗口间状态延续（VSR_CARRY_STATE=1）：反向分支只覆盖本窗口，与整段推理不完全相同，
+    但正向分支接上了前一窗口，比每个窗口冷启动更接近整段推理
+    """
+    t = lqs.shape[1]
+    split = t // 2
+    state = PropagationState()
+    with torch.no_grad():
+        expected = generator(lqs)
+        carried = torch.cat([propagate_window(generator, lqs[:, :split], split, state),
+                             propagate_window(generator, lqs[:, split:], t - split, state)], dim=1)
+        cold = torch.cat([propagate_window(generator, lqs[:, :split], split),
+                          propagate_window(generator, lqs[:, split:], t - split)], dim=1)
+    # 第一个窗口两者相同，差异只在第二个窗口
+    torch.testing.assert_close(carried[:, :split], cold[:, :split])
+    assert _mse(carried[:, split:], expected[:, split:]) < _mse(cold[:, split:], expected[:, split:])
@@ -0,0 +1,211 @@
+# tools/evaluate.py
+# 批量画质评测：在目录树中按相对路径匹配 GT / LR / SR 视频，用进程池并行计算 PSNR（Y 通道，与服务端
+# psnr_calculator 的算法一致），按 (GT 内容哈希, 待评视频内容哈希) 缓存每对视频的结果，重跑时未变化的文件不再计算；
+# 输出逐文件 CSV 和带汇总的 JSON（替代逐个修改 tools_*/psnr.py 中 REF_PATH/DIST_PATH 的手动评测）
+# 完全相同的帧 PSNR 为无穷大，按 PSNR_CAP 计；GT 与待评视频帧数不同的视频对会被标记，不计入汇总
+#
+# 目录约定: 默认 --root 下的 gt/ lr/ sr/，也可分别指定；LR/SR 可给多个目录（如 prepare_dataset.py 的各个 CRF），
+# 文件按去掉扩展名的相对路径匹配，如 gt/a/test9.mp4 <-> x4_crf28/a/test9.mp4
+#
+# 用法:
+#   python tools/evaluate.py --root eval_set --csv eval.csv --json eval.json
+#   python tools/evaluate.py --gt tools_270p/test --lr dataset/x4_crf23 dataset/x4_crf28 --sr sr_out --workers 8
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from psnr_calculator import iter_frame_psnr
+from prepare_dataset import hash_file, VIDEO_EXTENSIONS
+from video_io import probe_video
+
+METRIC_VERSION = "psnr_y_v2"  # 评测算法变化时修改，旧缓存自动失效
+CACHE_VERSION = 1
+PSNR_CAP = 100.0  # 单帧 PSNR 上限（dB），完全相同的帧（MSE 为 0）按此计，避免 inf 写入 JSON 和均值
+CSV_FIELDS = ("name", "kind", "set", "frames", "gt_frames", "target_frames", "mismatch",
+              "psnr_mean", "psnr_min", "psnr_max", "gt", "target", "cached")
+
+
+def discover(directory):
+    """{去掉扩展名的相对路径: 文件路径}"""
+    directory = Path(directory)
+    return {str(p.relative_to(directory).with_suffix('')): p for p in sorted(directory.rglob('*'))
+            if p.suffix.lower() in VIDEO_EXTENSIONS}
+
+
+def score(gt_path, target_path):
+    """
+    在工作进程中执行：逐帧 PSNR 的统计值
+    逐帧比较只覆盖两者都有的帧，gt_frames / target_frames 为两个视频各自的帧数，不同时 mismatch 为 True
+    """
+    values = [min(v, PSNR_CAP) for v in iter_frame_psnr(str(gt_path), str(target_path))]
+    if not values:
+        raise RuntimeError("无法读取视频帧")
+    gt_frames = probe_video(str(gt_path)).frame_count
+    target_frames = probe_video(str(target_path)).frame_count
+    return {"frames": len(values), "gt_frames": gt_frames, "target_frames": target_frames,
+            "mismatch": gt_frames != target_frames, "psnr_mean": statistics.fmean(values),
+            "psnr_min": min(values), "psnr_max": max(values)}
+
+
+def load_cache(path):
+    if path.exists():
+        cache = json.loads(path.read_text())
+        if cache.get("version") == CACHE_VERSION:
+            return cache
+    return {"version": CACHE_VERSION, "hashes": {}, "metrics": {}}
+
+
+def save_cache(path, cache):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(cache, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def content_hashes(paths, cache, pool):
+    """文件内容哈希：大小和修改时间与缓存一致时直接复用，否则在进程池中重新计算"""
+    cached = cache["hashes"]
+    hashes = {}
+    pending = {}
+    for path in paths:
+        key = str(path.resolve())
+        stat = path.stat()
+        entry = cached.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            hashes[path] = entry["sha256"]
+        else:
+            pending[pool.submit(hash_file, path)] = (path, key, stat)
+    for future in as_completed(pending):
+        path, key, stat = pending[future]
+        hashes[path] = future.result()
+        cached[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": hashes[path]}
+    return hashes
+
+
+def summarize(rows):
+    """
+    按 (类型, 目录) 汇总平均 PSNR；同一 GT 同时有 LR 和 SR 时给出 SR 相对 LR 的平均增益
+    帧数不一致的视频对不计入，只给出其数量
+    """
+    mismatched = [row for row in rows if row["mismatch"]]
+    rows = [row for row in rows if not row["mismatch"]]
+    groups = {}
+    for row in rows:
+        groups.setdefault(f"{row['kind']}:{row['set']}", []).append(row["psnr_mean"])
+    summary = {"sets": {key: {"files": len(values), "psnr_mean": statistics.fmean(values)}
+                        for key, values in groups.items()},
+               "mismatched": len(mismatched)}
+    lr = {}
+    for row in rows:
+        if row["kind"] == "lr":
+            lr.setdefault(row["name"], []).append(row["psnr_mean"])
+    gains = [row["psnr_mean"] - statistics.fmean(lr[row["name"]]) for row in rows
+             if row["kind"] == "sr" and row["name"] in lr]
+    if gains:
+        summary["sr_gain_over_lr"] = statistics.fmean(gains)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score GT/LR/SR video triples in parallel with cached metrics')
+    parser.add_argument('--root', type=str, default='', help='Directory containing gt/, lr/ and sr/')
+    parser.add_argument('--gt', type=str, default='', help='GT directory (default: <root>/gt)')
+    parser.add_argument('--lr', type=str, nargs='*', default=None, help='LR directories (default: <root>/lr)')
+    parser.add_argument('--sr', type=str, nargs='*', default=None, help='SR directories (default: <root>/sr)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Parallel scoring processes')
+    parser.add_argument('--cache', type=str, default='', help='Metric cache file (default: <root or cwd>/eval_cache.json)')
+    parser.add_argument('--csv', type=str, default='', help='Write per-file results to this CSV')
+    parser.add_argument('--json', type=str, default='', help='Write per-file results and summary to this JSON')
+    args = parser.parse_args()
+
+    root = Path(args.root) if args.root else None
+    gt_dir = Path(args.gt) if args.gt else (root / 'gt' if root else None)
+    if gt_dir is None or not gt_dir.is_dir():
+        parser.error("GT directory not found (use --root or --gt)")
+    target_dirs = [('lr', Path(d)) for d in (args.lr if args.lr is not None else ([root / 'lr'] if root else []))]
+    target_dirs += [('sr', Path(d)) for d in (args.sr if args.sr is not None else ([root / 'sr'] if root else []))]
+    target_dirs = [(kind, d) for kind, d in target_dirs if d.is_dir()]
+    if not target_dirs:
+        parser.error("no LR/SR directory found")
+    cache_path = Path(args.cache) if args.cache else (root or Path('.')) / 'eval_cache.json'
+
+    gt_files = discover(gt_dir)
+    pairs = []  # (名称, 类型, 目录名, GT 路径, 待评路径)
+    for kind, directory in target_dirs:
+        for name, path in discover(directory).items():
+            if name in gt_files:
+                pairs.append((name, kind, directory.name, gt_files[name], path))
+    if not pairs:
+        print(f"❌ 未找到与 {gt_dir} 匹配的 LR/SR 视频")
+        return 1
+    cache = load_cache(cache_path)
+    start = time.perf_counter()
+
+    rows = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        files = sorted({p for pair in pairs for p in pair[3:]})
+        print(f"🔧 {len(pairs)} 对视频（{len(files)} 个文件），计算内容哈希 …")
+        hashes = content_hashes(files, cache, pool)
+        save_cache(cache_path, cache)
+
+        futures = {}
+        for name, kind, set_name, gt_path, target_path in pairs:
+            key = f"{METRIC_VERSION}:{hashes[gt_path]}:{hashes[target_path]}"
+            row = {"name": name, "kind": kind, "set": set_name, "gt": str(gt_path), "target": str(target_path)}
+            if key in cache["metrics"]:
+                rows.append(dict(row, **cache["metrics"][key], cached=True))
+            else:
+                futures[pool.submit(score, gt_path, target_path)] = (key, row)
+        print(f"   需计算 {len(futures)} 对，命中缓存 {len(rows)} 对（{args.workers} 个进程）")
+
+        for future in as_completed(futures):
+            key, row = futures[future]
+            try:
+                metrics = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {row['kind']}:{row['set']}/{row['name']}: {e}")
+                continue
+            cache["metrics"][key] = metrics
+            save_cache(cache_path, cache)  # 每完成一对就保存，中断后重跑只补剩下的
+            rows.append(dict(row, **metrics, cached=False))
+
+    rows.sort(key=lambda r: (r["name"], r["kind"], r["set"]))
+    summary = summarize(rows)
+    print(f"   {'name':<28}{'set':<20}{'frames':>8}{'PSNR':>10}{'min':>10}")
+    for row in rows:
+        print(f"   {row['name']:<28}{row['kind'] + ':' + row['set']:<20}{row['frames']:>8}"
+              f"{row['psnr_mean']:>10.3f}{row['psnr_min']:>10.3f}"
+              + (f"  ⚠️ 帧数不一致（GT {row['gt_frames']}，待评 {row['target_frames']}）" if row["mismatch"] else ""))
+    for key, s in summary["sets"].items():
+        print(f"📊 {key:<24} {s['files']:>4} 个文件，平均 PSNR {s['psnr_mean']:.3f} dB")
+    if "sr_gain_over_lr" in summary:
+        print(f"📊 SR 相对 LR 平均提升 {summary['sr_gain_over_lr']:+.3f} dB")
+    print(f"✅ 完成，失败 {failed} 对，帧数不一致 {summary['mismatched']} 对（不计入汇总），"
+          f"耗时 {time.perf_counter() - start:.1f}s")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"📄 已保存: {args.csv}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"metric": METRIC_VERSION, "summary": summary, "results": rows}, f, indent=2, allow_nan=False)
+        print(f"📄 已保存: {args.json}")
+    return 1 if failed or summary["mismatched"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
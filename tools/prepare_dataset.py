@@ -0,0 +1,188 @@
+# tools/prepare_dataset.py
+# 测试数据集准备：把一个目录下的 GT 视频批量生成各种 LR 版本（×4 双三次降采样、720p，每种若干个 CRF），
+# 用进程池并行编码；manifest 记录每个输出对应的源文件哈希和编码参数，重新运行时跳过已是最新的输出，
+# 只重做源文件或参数有变化的部分（替代 tools_270p/compress_x4LR.py、tools_720p/compress_to_720p.py 的逐个手动处理）
+#
+# 输出目录结构: <dst>/<变体>_crf<CRF>/<源文件相对路径>，如 dataset/x4_crf28/test9.mp4
+#
+# 用法:
+#   python tools/prepare_dataset.py --src tools_270p/test --dst dataset
+#   python tools/prepare_dataset.py --src gt/ --dst dataset --variants x4 --crf 18 28 --workers 4
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# LR 变体：(缩放滤镜, 音频参数)
+VARIANTS = {
+    'x4': ("scale=iw/4:ih/4:flags=bicubic", ["-c:a", "copy"]),   # ×4 双三次降采样（1080p -> 270p）
+    '720p': ("scale=-2:720:flags=bicubic", ["-an"]),             # 降采样到 720p（1080p 为 ×1.5）
+}
+DEFAULT_CRFS = (18, 23, 28)
+PRESET = "slow"
+PIX_FMT = "yuv420p"
+VIDEO_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.mkv')
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def encode_params(variant, crf, preset):
+    """写入 manifest 的编码参数（任一项变化都会触发重新生成）"""
+    vf, audio = VARIANTS[variant]
+    return {"variant": variant, "vf": vf, "audio": audio, "crf": crf, "preset": preset, "pix_fmt": PIX_FMT}
+
+
+def encode(src, dst, params, threads):
+    """在工作进程中执行：编码到临时文件，成功后再改名，中断时不会留下看似完整的输出"""
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.stem}.tmp{dst.suffix}")
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-i", str(src),
+        "-vf", params["vf"],
+        "-c:v", "libx264",
+        "-crf", str(params["crf"]),
+        "-preset", params["preset"],
+        "-pix_fmt", params["pix_fmt"],
+        "-threads", str(threads),
+        *params["audio"],
+        "-movflags", "+faststart",
+        str(tmp)
+    ]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(proc.stderr.decode(errors='ignore')[-500:])
+    os.replace(tmp, dst)
+    return {"size": dst.stat().st_size, "seconds": round(time.perf_counter() - start, 2)}
+
+
+def load_manifest(path):
+    if path.exists():
+        manifest = json.loads(path.read_text())
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    return {"version": MANIFEST_VERSION, "sources": {}, "outputs": {}}
+
+
+def save_manifest(path, manifest):
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def source_hashes(src_dir, sources, manifest, pool):
+    """
+    源文件哈希：大小和修改时间与 manifest 记录一致时直接复用，否则在进程池中重新计算
+    Returns:
+        dict: {源文件相对路径: sha256}
+    """
+    cached = manifest["sources"]
+    hashes = {}
+    pending = {}
+    for rel in sources:
+        stat = (src_dir / rel).stat()
+        entry = cached.get(rel)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            hashes[rel] = entry["sha256"]
+        else:
+            pending[pool.submit(hash_file, src_dir / rel)] = (rel, stat)
+    for future in as_completed(pending):
+        rel, stat = pending[future]
+        hashes[rel] = future.result()
+        cached[rel] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": hashes[rel]}
+    return hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate LR variants of a GT video directory (parallel, incremental)')
+    parser.add_argument('--src', type=str, required=True, help='Directory of GT videos (searched recursively)')
+    parser.add_argument('--dst', type=str, required=True, help='Output root directory')
+    parser.add_argument('--variants', type=str, nargs='+', default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument('--crf', type=int, nargs='+', default=list(DEFAULT_CRFS), help='CRF values, one output set each')
+    parser.add_argument('--preset', type=str, default=PRESET, help='x264 preset')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Parallel encodes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Regenerate even if outputs are up to date')
+    parser.add_argument('--dry_run', action='store_true', help='Only list what would be generated')
+    args = parser.parse_args()
+
+    src_dir, dst_dir = Path(args.src).resolve(), Path(args.dst).resolve()
+    if not src_dir.is_dir():
+        parser.error(f"not a directory: {src_dir}")
+    sources = sorted(str(p.relative_to(src_dir)) for p in src_dir.rglob('*')
+                     if p.suffix.lower() in VIDEO_EXTENSIONS and dst_dir not in p.parents)
+    if not sources:
+        print(f"❌ 未找到输入视频：{src_dir}")
+        return 1
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = dst_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    # 每个 ffmpeg 分到的编码线程数，总数约等于 CPU 核数
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        print(f"🔧 发现 {len(sources)} 个源文件，计算哈希 …")
+        hashes = source_hashes(src_dir, sources, manifest, pool)
+        save_manifest(manifest_path, manifest)
+
+        jobs = []
+        skipped = 0
+        for rel in sources:
+            for variant in args.variants:
+                for crf in args.crf:
+                    out_rel = str(Path(f"{variant}_crf{crf}") / rel)
+                    params = encode_params(variant, crf, args.preset)
+                    entry = manifest["outputs"].get(out_rel)
+                    out_path = dst_dir / out_rel
+                    up_to_date = (entry is not None and entry["source_sha256"] == hashes[rel]
+                                  and entry["params"] == params and out_path.exists()
+                                  and out_path.stat().st_size == entry["size"])
+                    if up_to_date and not args.force:
+                        skipped += 1
+                    else:
+                        jobs.append((rel, out_rel, params))
+        print(f"   需生成 {len(jobs)} 个，已是最新 {skipped} 个（{args.workers} 个进程，每个 {threads} 线程）")
+        if args.dry_run:
+            for rel, out_rel, _ in jobs:
+                print(f"   {rel}  ->  {out_rel}")
+            return 0
+
+        futures = {pool.submit(encode, src_dir / rel, dst_dir / out_rel, params, threads): (rel, out_rel, params)
+                   for rel, out_rel, params in jobs}
+        failed = 0
+        start = time.perf_counter()
+        for future in as_completed(futures):
+            rel, out_rel, params = futures[future]
+            try:
+                info = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {out_rel}: {e}")
+                continue
+            manifest["outputs"][out_rel] = {"source": rel, "source_sha256": hashes[rel], "params": params,
+                                            "size": info["size"]}
+            save_manifest(manifest_path, manifest)  # 每完成一个就保存，中断后重跑只补剩下的
+            print(f"   ✅ {out_rel}  {info['size'] / 2**20:.2f} MB  {info['seconds']:.1f}s")
+
+    print(f"🎉 完成 {len(jobs) - failed} 个，失败 {failed} 个，跳过 {skipped} 个，耗时 {time.perf_counter() - start:.1f}s")
+    print(f"📄 manifest: {manifest_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import threading
+import contextlib
+from metrics import cuda_peak_allocated
+
+# 任务耗时追踪：记录每个任务各阶段及其内部步骤（解码、逐窗口推理、写帧、ffmpeg、PSNR 等）的时间线，
+# 包含起止时间、CPU 时间和内存，导出为 Chrome trace JSON（chrome://tracing 或 https://ui.perfetto.dev 可直接打开）
+STAGE_TID = 0  # 阶段（status）单独占一行，内部步骤按实际线程显示
+
+_local = threading.local()
+
+
+def _rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _cuda_memory():
+    """torch 已加载且 CUDA 已初始化时返回 (当前分配, 峰值) 字节数，否则 None（不会为此导入 torch）"""
+    torch = sys.modules.get('torch')
+    if torch is None or not torch.cuda.is_initialized():
+        return None
+    return torch.cuda.memory_allocated(), cuda_peak_allocated(torch, torch.cuda.current_device())
+
+
+def _snapshot():
+    times = os.times()
+    return {
+        "wall": time.time(),
+        "cpu": time.process_time(),
+        "children_cpu": times.children_user + times.children_system,
+        "thread_cpu": time.thread_time(),
+        "tid": threading.get_ident(),
+        "rss": _rss_bytes(),
+    }
+
+
+class TaskTrace:
+    """
+    单个任务的时间线
+    - stage(name): 切换阶段（与任务 status 一致），自动结束上一阶段
+    - span(name): 上下文管理器，记录阶段内部的一个步骤，可嵌套
+    """
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = {STAGE_TID: 'stages'}
+        self._stage = None  # (名称, 开始快照)
+
+    def _record(self, name, cat, begin, end, tid, args):
+        args = dict(args)
+        args["cpu_s"] = round(end["cpu"] - begin["cpu"], 6)  # 进程 CPU 时间（包括 PyTorch 等的工作线程）
+        args["children_cpu_s"] = round(end["children_cpu"] - begin["children_cpu"], 6)  # 已结束的子进程（ffmpeg）
+        if begin["tid"] == end["tid"]:
+            args["thread_cpu_s"] = round(end["thread_cpu"] - begin["thread_cpu"], 6)
+        args["rss_start_mb"] = round(begin["rss"] / 2**20, 1)
+        args["rss_end_mb"] = round(end["rss"] / 2**20, 1)
+        cuda = _cuda_memory()
+        if cuda is not None:
+            args["cuda_allocated_mb"] = round(cuda[0] / 2**20, 1)
+            args["cuda_peak_mb"] = round(cuda[1] / 2**20, 1)
+        with self.lock:
+            self.events.append({
+                "name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": tid,
+                "ts": begin["wall"] * 1e6, "dur": (end["wall"] - begin["wall"]) * 1e6, "args": args,
+            })
+            self.events.append({
+                "name": "memory", "ph": "C", "pid": self.pid, "ts": end["wall"] * 1e6,
+                "args": {"rss_mb": args["rss_end_mb"]},
+            })
+
+    def stage(self, name):
+        """结束当前阶段并开始新阶段；name 为 None 时只结束当前阶段"""
+        now = _snapshot()
+        with self.lock:
+            previous, self._stage = self._stage, ((name, now) if name is not None else None)
+        if previous is not None:
+            self._record(previous[0], 'stage', previous[1], now, STAGE_TID, {})
+
+    def start(self, name, cat='step', **args):
+        """开始一个步骤，返回传给 finish 的句柄（用于无法写成 with 语句的场合，如 forward hook）"""
+        thread = threading.current_thread()
+        with self.lock:
+            self.threads.setdefault(thread.ident, thread.name)
+        return name, cat, args, _snapshot()
+
+    def finish(self, token, **args):
+        name, cat, start_args, begin = token
+        end = _snapshot()
+        self._record(name, cat, begin, end, end["tid"], dict(start_args, **args))
+
+    @contextlib.contextmanager
+    def span(self, name, cat='step', **args):
+        token = self.start(name, cat, **args)
+        try:
+            yield
+        finally:
+            self.finish(token)
+
+    def to_chrome(self):
+        """Chrome trace JSON（Trace Event Format）"""
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        events.sort(key=lambda e: e["ts"])
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": f"task {self.task_id}"}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in threads.items()]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms", "otherData": {"task_id": self.task_id}}
+
+
+@contextlib.contextmanager
+def activate(trace):
+    """在当前线程激活任务的 trace，推理后端等内部代码通过 span()/current() 记录步骤"""
+    previous = getattr(_local, 'trace', None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def current():
+    """当前线程激活的 TaskTrace，没有时返回 None"""
+    return getattr(_local, 'trace', None)
+
+
+def span(name, cat='step', **args):
+    """在当前激活的 trace 中记录一个步骤；没有激活的 trace 时不做任何事"""
+    trace = current()
+    if trace is None:
+        return contextlib.nullcontext()
+    return trace.span(name, cat, **args)
@@ -0,0 +1,240 @@
+import os
+import glob
+import json
+import threading
+import collections
+import tempfile
+import subprocess
+import numpy as np
+
+# 视频读写工具（HTTP 服务、基准测试等各个入口共用）
+
+# rawvideo 解码输出支持的像素格式及通道数
+PIX_FMT_CHANNELS = {'bgr24': 3, 'rgb24': 3, 'gray': 1}
+DECODER_RING_SIZE = 8  # 环形缓冲的帧数
+DECODER_STDERR_LINES = 20  # 解码失败时报告的 ffmpeg 错误输出行数
+PROBE_CACHE_SIZE = int(os.environ.get('VSR_PROBE_CACHE_SIZE', '256'))  # 缓存的 probe 结果数
+
+_probe_cache = collections.OrderedDict()  # {(绝对路径, 文件大小, mtime): MediaProbe}，LRU
+_probe_lock = threading.Lock()
+
+# --- 保持不改动 ---
+def frames_to_video(frame_folder, output_path, fps=30, codec='libx264', crf=18, preset='medium'):
+    frames = sorted(glob.glob(os.path.join(frame_folder, '*')))
+    if len(frames) == 0:
+        raise ValueError("帧序列为空")
+    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as f:
+        for frame in frames:
+            f.write(f"file '{os.path.abspath(frame)}'\n")
+        list_file = f.name
+    cmd = [
+        'ffmpeg', '-y', '-r', str(fps), '-f', 'concat', '-safe', '0', '-i', list_file,
+        '-c:v', codec, '-crf', str(crf), '-preset', preset, '-pix_fmt', 'yuv420p',
+        output_path
+    ]
+    subprocess.run(cmd, check=True)
+    os.remove(list_file)
+
+
+def _parse_rate(rate):
+    """ffprobe 的帧率字符串（如 '30000/1001'）转为浮点数，无效时返回 0"""
+    num, _, den = str(rate or '0').partition('/')
+    try:
+        return float(num) / float(den or 1) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _ffprobe(video_path, packets=True):
+    """一次 ffprobe 调用：第一路视频流的参数、容器信息，以及（packets=True 时）每个包的时间戳和关键帧标记"""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_streams', '-show_format']
+    if packets:
+        cmd += ['-show_entries', 'packet=pts_time,dts_time,flags']
+    cmd += ['-of', 'json', video_path]
+    completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    data = json.loads(completed.stdout or b'{}') if completed.returncode == 0 else {}
+    if not data.get('streams'):
+        raise RuntimeError(f"无法打开视频: {video_path} {completed.stderr.decode(errors='ignore')[-300:]}")
+    return data
+
+
+class MediaProbe:
+    """
+    视频的 probe 结果（一次 ffprobe 得到），由 probe_video 缓存，供时间预估、窗口选择、合成视频、返回结果等各阶段共用
+    - fps: 实际平均帧率（avg_frame_rate，无效时用 r_frame_rate）
+    - frame_count: 视频包数（不解码，逐包计数，比容器头中的 nb_frames 可靠）
+    - keyframes: 关键帧索引 [(显示顺序帧序号, 时间戳秒)]
+    - first_pts: 显示顺序第一帧的时间戳（秒，容器 start_time 不为 0 时不为 0），没有逐包统计时为 None
+    """
+
+    def __init__(self, video_path, data):
+        stream = data['streams'][0]
+        self.path = video_path
+        self.size = os.path.getsize(video_path) if os.path.isfile(video_path) else 0
+        self.codec = stream.get('codec_name', '')
+        self.width = int(stream.get('width') or 0)
+        self.height = int(stream.get('height') or 0)
+        # 带旋转元数据的视频：ffmpeg 解码时会自动旋转，尺寸以旋转后为准
+        rotation = int(float(stream.get('tags', {}).get('rotate', 0)))
+        for side_data in stream.get('side_data_list', []):
+            rotation = int(float(side_data.get('rotation', rotation)))
+        if rotation % 180:
+            self.width, self.height = self.height, self.width
+        self.fps = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+
+        packets = data.get('packets', [])
+        # 包按解码顺序给出，按显示时间戳排序后得到显示顺序的帧序号
+        times = []
+        for packet in packets:
+            t = packet.get('pts_time', packet.get('dts_time', 'N/A'))
+            times.append((float(t) if t != 'N/A' else float('inf'), 'K' in packet.get('flags', '')))
+        times.sort(key=lambda item: item[0])
+        self.keyframes = [(i, t) for i, (t, key) in enumerate(times) if key]
+        self.first_pts = times[0][0] if times else None
+        self.frame_count = len(packets) or int(stream.get('nb_frames') or 0)
+        duration = stream.get('duration') or data.get('format', {}).get('duration')
+        self.duration = float(duration) if duration not in (None, 'N/A') else (
+            self.frame_count / self.fps if self.fps > 0 else 0.0)
+
+    def info(self):
+        """接口返回的视频信息"""
+        return {
+            "size": self.size,
+            "duration": self.duration,
+            "resolution": f"{self.width}x{self.height}",
+            "fps": self.fps,
+            "frame_count": self.frame_count,
+            "codec": self.codec,
+        }
+
+
+def probe_video(video_path):
+    """
+    probe 视频（带缓存）：本地文件按 (绝对路径, 文件大小, mtime) 缓存，文件被覆盖后自动重新 probe；
+    非本地文件（流地址）不缓存，也不逐包统计
+    Raises:
+        RuntimeError: 无法打开视频
+    """
+    if not os.path.isfile(video_path):
+        return MediaProbe(video_path, _ffprobe(video_path, packets=False))
+    stat = os.stat(video_path)
+    key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns)
+    with _probe_lock:
+        probe = _probe_cache.get(key)
+        if probe is not None:
+            _probe_cache.move_to_end(key)
+            return probe
+    probe = MediaProbe(video_path, _ffprobe(video_path))
+    with _probe_lock:
+        _probe_cache[key] = probe
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    return probe
+
+
+def get_video_info(video_path):
+    return probe_video(video_path).info()
+
+
+class FFmpegDecoder:
+    """
+    ffmpeg rawvideo 解码器：整段视频只启动一个 ffmpeg 进程，解码后的定长帧（H*W*C 字节）从管道直接 readinto
+    预分配的 NumPy 环形缓冲，不为每帧分配新数组；缩放和像素格式转换在 ffmpeg 内完成
+    注意：不传 out 时 read() 返回环形缓冲中的视图，再读 ring_size 帧后会被覆盖，需要保留的帧请传入 out 或 copy
+    """
+
+    def __init__(self, video_path, size=None, pix_fmt='bgr24', ring_size=DECODER_RING_SIZE, start=None, max_frames=None,
+                 realtime=False):
+        """
+        Args:
+            video_path (str): 视频路径
+            size (tuple): 输出尺寸 (width, height)，与源尺寸不同时由 ffmpeg 双三次缩放，默认为源尺寸
+            pix_fmt (str): 输出像素格式，见 PIX_FMT_CHANNELS
+            ring_size (int): 环形缓冲帧数
+            start (float): 起始时间（秒），在输入端定位
+            max_frames (int): 最多解码的帧数
+            realtime (bool): 按原始帧率的实时速度读取（ffmpeg -re），把本地文件当作直播流的替身
+        """
+        probe = probe_video(video_path)
+        source_size = (probe.width, probe.height)
+        self.width, self.height = size or source_size
+        channels = PIX_FMT_CHANNELS[pix_fmt]
+        self.frame_shape = (self.height, self.width) if channels == 1 else (self.height, self.width, channels)
+        self.frame_bytes = self.width * self.height * channels
+        self.ring = np.empty((ring_size,) + self.frame_shape, dtype=np.uint8)
+        self.index = 0
+
+        cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+        if realtime:
+            cmd += ['-re']
+        if start:
+            cmd += ['-ss', str(start)]
+        cmd += ['-i', video_path, '-map', '0:v:0']
+        if max_frames:
+            cmd += ['-frames:v', str(max_frames)]
+        if (self.width, self.height) != source_size:
+            cmd += ['-vf', f"scale={self.width}:{self.height}:flags=bicubic"]
+        cmd += ['-f', 'rawvideo', '-pix_fmt', pix_fmt, '-vsync', '0', 'pipe:1']
+        # bufsize=0：readinto 直接写入目标数组，不经过 Python 的读缓冲
+        self.video_path = video_path
+        self.closed = False
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        # 后台线程持续读走 stderr（管道写满会让 ffmpeg 阻塞），只保留最后几行用于报错
+        self.stderr_tail = collections.deque(maxlen=DECODER_STDERR_LINES)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self):
+        for line in self.proc.stderr:
+            self.stderr_tail.append(line.decode(errors='ignore').rstrip())
+
+    def _check_exit(self):
+        """输出结束时确认 ffmpeg 正常退出，解码出错时抛出异常，而不是当作读完（输出被静默截断）"""
+        if self.closed:
+            return
+        code = self.proc.wait()
+        if code != 0:
+            self._stderr_thread.join(timeout=1)
+            raise RuntimeError(f"ffmpeg 解码失败（退出码 {code}）: {self.video_path} " + ' | '.join(self.stderr_tail))
+
+    def read(self, out=None):
+        """
+        读取下一帧
+        Args:
+            out (np.ndarray): 可选，C 连续的 frame_shape uint8 数组，帧直接写入其中
+        Returns:
+            np.ndarray: 帧（out 或环形缓冲中的一格），读完时返回 None
+        """
+        target = out if out is not None else self.ring[self.index % len(self.ring)]
+        view = memoryview(target).cast('B')
+        got = 0
+        while got < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[got:])
+            if not n:
+                self._check_exit()
+                return None  # 结束（不完整的末帧丢弃）
+            got += n
+        self.index += 1
+        return target
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        self.closed = True  # 主动关闭（可能提前结束 ffmpeg），之后读到的结束不再检查退出码
+        self.proc.stdout.close()
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self._stderr_thread.join()
+        self.proc.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,89 @@
+import os
+import subprocess
+from video_io import probe_video
+
+# 截取片段两侧额外保留的时间上下文（秒），保证 BasicVSR++ 双向传播在片段边界处的质量
+RANGE_CONTEXT_SEC = 1.0
+
+
+def parse_time_range(params):
+    """
+    从请求参数中解析 start/end（单位秒）
+
+    Args:
+        params: request.form / request.json 等类字典对象
+    Returns:
+        tuple: (start, end)，都未提供时返回 (None, None)
+    Raises:
+        ValueError: 参数非法
+    """
+    start = params.get('start')
+    end = params.get('end')
+    if start in (None, '') and end in (None, ''):
+        return None, None
+    start = float(start) if start not in (None, '') else 0.0
+    if end in (None, ''):
+        raise ValueError("end is required when start is set")
+    end = float(end)
+    if start < 0 or end <= start:
+        raise ValueError("invalid time range, require 0 <= start < end")
+    return start, end
+
+
+def cut_video_range(input_path, output_path, start, end, context=RANGE_CONTEXT_SEC):
+    """
+    截取 [start, end] 片段（两侧各多保留 context 秒），只对该片段做超分
+
+    -ss 放在 -i 之前：ffmpeg 先跳到目标位置之前最近的关键帧，再精确解码到起点，
+    耗时只与片段长度有关，与整段录像长度无关。片段以无损 H.264 重编码，不引入额外画质损失。
+
+    Args:
+        input_path (str): 原视频路径
+        output_path (str): 片段输出路径（.mp4）
+        start (float): 起始时间（秒）
+        end (float): 结束时间（秒）
+        context (float): 两侧额外保留的时间（秒）
+    Returns:
+        tuple: (head_frames, keep_frames)，片段开头需丢弃的上下文帧数、需保留的帧数
+    """
+    ctx_start = max(0.0, start - context)
+    ctx_end = end + context
+    cmd = [
+        'ffmpeg', '-y', '-ss', f"{ctx_start:.3f}", '-i', input_path,
+        '-t', f"{ctx_end - ctx_start:.3f}",
+        '-map', '0:v:0', '-an',
+        '-c:v', 'libx264', '-qp', '0', '-preset', 'ultrafast',
+        output_path
+    ]
+    completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg cut failed: {completed.stderr.decode(errors='ignore')[-500:]}")
+
+    probe = probe_video(output_path)
+    fps, frame_count = probe.fps, probe.frame_count
+    if frame_count <= 0 or fps <= 0:
+        raise ValueError("time range is beyond the end of the video")
+
+    head_frames = min(int(round((start - ctx_start) * fps)), frame_count)
+    keep_frames = min(int(round((end - start) * fps)), frame_count - head_frames)
+    if keep_frames <= 0:
+        raise ValueError("time range is beyond the end of the video")
+    return head_frames, keep_frames
+
+
+def trim_frames(frame_folder, head_frames, keep_frames):
+    """
+    去掉超分结果中两侧的上下文帧，剩余帧重新从 00000000.png 连续编号
+
+    Args:
+        frame_folder (str): 超分帧目录（{:08d}.png）
+        head_frames (int): 开头丢弃的帧数
+        keep_frames (int): 保留的帧数
+    """
+    frames = sorted(os.listdir(frame_folder))
+    for i, name in enumerate(frames):
+        path = os.path.join(frame_folder, name)
+        if head_frames <= i < head_frames + keep_frames:
+            os.rename(path, os.path.join(frame_folder, f"{i - head_frames:08d}.png"))
+        else:
+            os.remove(path)
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import tempfile
+from video_io import probe_video
+from video_range import RANGE_CONTEXT_SEC
+
+# 长视频自动分段：超过 SPLIT_THRESHOLD_SEC 的上传在关键帧处切成约 SEGMENT_SEC 秒的段，每段作为子任务超分，
+# 段两侧各多带 SEGMENT_OVERLAP_SEC 秒的重叠帧（保证 BasicVSR++ 双向传播在段边界处的质量），最后用 concat 拼接
+SPLIT_THRESHOLD_SEC = float(os.environ.get('VSR_SPLIT_THRESHOLD_SEC', '120'))  # 0 表示不分段
+SEGMENT_SEC = float(os.environ.get('VSR_SEGMENT_SEC', '60'))
+SEGMENT_OVERLAP_SEC = RANGE_CONTEXT_SEC
+SEEK_EPSILON = 0.001  # 按关键帧时间戳定位时多给的时间（秒），避免小数舍入后落到前一个关键帧
+
+
+def plan_segments(probe, segment_sec=SEGMENT_SEC, overlap_sec=SEGMENT_OVERLAP_SEC, threshold_sec=SPLIT_THRESHOLD_SEC):
+    """
+    按关键帧规划分段（帧序号均为显示顺序）
+
+    每段负责 [start, end) 的输出帧；实际截取的输入为 [cut_start, cut_end)，两端都对齐到关键帧且至少包含
+    overlap_sec 的重叠，因此可以不重编码地截取。超分后丢弃开头 head 帧、保留 keep 帧。
+
+    Args:
+        probe (MediaProbe): probe_video 的结果
+        segment_sec (float): 目标段长（秒）
+        overlap_sec (float): 段两侧的重叠时长（秒）
+        threshold_sec (float): 时长不超过该值（或为 0）时不分段
+    Returns:
+        list[dict]: [{"index", "start", "end", "cut_start", "cut_end", "head", "keep"}]，不分段时为空列表
+    """
+    n = probe.frame_count
+    if threshold_sec <= 0 or probe.duration <= threshold_sec or probe.fps <= 0 or n <= 0:
+        return []
+    keyframes = sorted(i for i, _ in probe.keyframes if i < n)
+    target = max(1, int(round(segment_sec * probe.fps)))
+    overlap = int(round(overlap_sec * probe.fps))
+
+    # 段边界取目标位置之后的第一个关键帧；剩余不足半段时并入最后一段
+    bounds = [0]
+    for k in keyframes:
+        if k - bounds[-1] >= target and n - k >= target // 2:
+            bounds.append(k)
+    bounds.append(n)
+    if len(bounds) <= 2:
+        return []
+
+    segments = []
+    for index, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        cut_start = max([k for k in keyframes if k <= start - overlap] or [0])
+        cut_end = min([k for k in keyframes if k >= end + overlap] or [n])
+        segments.append({
+            "index": index, "start": start, "end": end, "cut_start": cut_start, "cut_end": cut_end,
+            "head": start - cut_start, "keep": end - start,
+        })
+    return segments
+
+
+def cut_segment(input_path, output_path, probe, segment):
+    """
+    不重编码地截取一段（-c copy）：按起点关键帧 probe 到的时间戳定位（-seek_timestamp，不依赖恒定帧率和 start_time 为 0），
+    保留原时间戳（-copyts）输出，截取后核对帧数和第一帧的时间戳，定位到别的关键帧时报错而不是让各段错位
+
+    Args:
+        input_path (str): 原视频路径
+        output_path (str): 段输出路径（.mp4）
+        probe (MediaProbe): 原视频的 probe 结果
+        segment (dict): plan_segments 返回的一段
+    """
+    frames = segment["cut_end"] - segment["cut_start"]
+    start_pts = dict(probe.keyframes).get(segment["cut_start"])
+    cmd = ['ffmpeg', '-y', '-v', 'error']
+    if start_pts is not None:  # 只有第 0 帧可能不是关键帧（此时从头截取，不需要定位）
+        cmd += ['-seek_timestamp', '1', '-ss', f"{start_pts + SEEK_EPSILON:.6f}"]
+    cmd += ['-i', input_path, '-map', '0:v:0', '-an', '-c', 'copy', '-frames:v', str(frames), '-copyts', output_path]
+    completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg segment cut failed: {completed.stderr.decode(errors='ignore')[-500:]}")
+    cut = probe_video(output_path)
+    if cut.frame_count != frames:
+        raise RuntimeError(f"segment {segment['index']} has {cut.frame_count} frames, expected {frames}")
+    expected_pts = start_pts if start_pts is not None else probe.first_pts
+    if expected_pts is not None and cut.first_pts is not None and abs(cut.first_pts - expected_pts) > SEEK_EPSILON:
+        raise RuntimeError(f"segment {segment['index']} starts at {cut.first_pts:.6f}s, expected {expected_pts:.6f}s")
+
+
+def concat_videos(video_paths, output_path):
+    """用 concat demuxer 不重编码地拼接编码参数相同的视频"""
+    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as f:
+        for path in video_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+        list_file = f.name
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_file, '-c', 'copy', output_path]
+    try:
+        completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finally:
+        os.remove(list_file)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {completed.stderr.decode(errors='ignore')[-500:]}")
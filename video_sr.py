@@ -1,39 +1,39 @@
 import os
-import torch
-import cv2
-import numpy as np
+import shutil
 import argparse
-from mmengine import mkdir_or_exist
-from mmagic.apis import MMagicInferencer
+import tempfile
+from sr_backends import BACKEND, BACKENDS, get_backend
+from video_io import frames_to_video, probe_video
 
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi')  # 输出路径为这些扩展名时编码为视频，否则作为帧目录
 
-def SR(video_dir, result_video_dir, device, max_seq_len):
+
+def SR(video_dir, result_video_dir, backend_name, max_seq_len):
     """
     视频超分辨率增强（BasicVSR++）
 
     参数:
         video_dir: 输入视频路径
-        result_video_dir: 输出视频路径
-        device: 'cpu' 或 'cuda'
+        result_video_dir: 输出视频路径（扩展名为 mp4/mkv/mov/avi），或输出帧目录（{:08d}.png）
+        backend_name: 推理后端（mmagic / torchscript / onnx / bicubic）
         max_seq_len: 模型一次处理的帧数（值越大占用GPU越多）
     """
     print("  创建推理器实例...")
-    checkpoint_file = '/workspace/models/basicvsr_plusplus_c64n7_8x1_600k_reds4_20210217-db622b2f.pth'
-    # 创建推理器实例
-    editor = MMagicInferencer(
-        model_name='basicvsr_pp',
-        device=device,
-        model_ckpt=checkpoint_file
-    )
-    # 设置最大序列长度
-    editor.inferencer.inferencer.extra_parameters['max_seq_len'] = max_seq_len
-
-    # 推理前清理显存
-    torch.cuda.empty_cache()
+    backend = get_backend(backend_name)
     print("  执行视频超分辨率推理...")
-    editor.infer(video=video_dir, result_out_dir=result_video_dir)
-    # 推理后清理显存
-    torch.cuda.empty_cache()
+    if not result_video_dir.lower().endswith(VIDEO_EXTENSIONS):
+        backend.process_video(video_dir, result_video_dir, max_seq_len=max_seq_len)
+        print(f"✅ 推理完成，输出保存至: {result_video_dir}")
+        return
+    # 后端输出帧序列，再按输入视频的帧率编码（输入为帧目录时按 30fps）
+    frame_dir = tempfile.mkdtemp(prefix='sr_frames_', dir=os.path.dirname(os.path.abspath(result_video_dir)))
+    try:
+        backend.process_video(video_dir, frame_dir, max_seq_len=max_seq_len)
+        print("  合成视频...")
+        fps = probe_video(video_dir).fps if os.path.isfile(video_dir) else 30
+        frames_to_video(frame_dir, result_video_dir, fps=fps or 30)
+    finally:
+        shutil.rmtree(frame_dir, ignore_errors=True)
     print(f"✅ 推理完成，输出保存至: {result_video_dir}")
 
 
@@ -41,8 +41,9 @@ def SR(video_dir, result_video_dir, device, max_seq_len):
 def main():
     parser = argparse.ArgumentParser(description='Video Super-Resolution with PSNR Calculation')
     parser.add_argument('--input', type=str, required=True, help='Path to input video')
-    parser.add_argument('--output', type=str, required=True, help='Path to output video')
+    parser.add_argument('--output', type=str, required=True, help='Path to output video (.mp4/.mkv/.mov/.avi) or output frame directory')
     parser.add_argument('--max_seq_len', type=int, default=10, help='Max sequence length for BasicVSR++')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=list(BACKENDS), help='Inference backend')
 
     args = parser.parse_args()
 
@@ -50,9 +51,7 @@ def main():
     result_video_dir = args.output
     max_seq_len = args.max_seq_len
 
-    # 自动检测设备
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"使用设备: {device}")
+    print(f"推理后端: {args.backend}")
 
 
     # 检查原始视频是否存在
@@ -61,11 +60,11 @@ def main():
         exit(1)
 
     # 创建输出目录
-    mkdir_or_exist(os.path.dirname(result_video_dir))
+    os.makedirs(os.path.dirname(result_video_dir) or '.', exist_ok=True)
 
     # 超分辨率增强
     print("开始视频超分辨率处理...")
-    SR(video_dir, result_video_dir, device, max_seq_len)
+    SR(video_dir, result_video_dir, args.backend, max_seq_len)
 
     print(f"\n✅处理完成! 增强后的视频保存到: {result_video_dir}")
 
@@ -1,17 +1,25 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response
 from werkzeug.utils import secure_filename
 import os
 import datetime
 import threading
 import time
 import uuid
-import torch
-from mmengine import mkdir_or_exist
-from mmagic.apis import MMagicInferencer
-import cv2
-import numpy as np
-import subprocess, tempfile, glob, shutil
+import queue
+import shutil
 from psnr_calculator import calculate_psnr
+from video_io import frames_to_video, get_video_info, probe_video
+from frame_dedup import extract_unique_frames, expand_sr_frames
+from video_range import parse_time_range, cut_video_range, trim_frames, RANGE_CONTEXT_SEC
+from video_split import plan_segments, cut_segment, concat_videos
+from live_stream import LiveSession, LIVE_POLICIES, is_stream_url, stream_url_allowed
+from sr_backends import get_backend, BACKEND
+from admission import AdmissionController, Overloaded, parse_admission_params, get_tier
+from memory_model import MemoryModel
+import tracing
+from profiling import TaskProfiler
+from metrics import (REGISTRY, CONTENT_TYPE, Gauge, STAGE_SECONDS, TASKS_TOTAL, FRAMES_PROCESSED, INFERENCE_FPS,
+                     UPLOADED_BYTES, SERVED_BYTES)
 
 app = Flask(__name__)
 
@@ -19,63 +27,66 @@ app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 INPUT_DIR = os.path.join(UPLOAD_FOLDER, 'input')
 OUTPUT_DIR = os.path.join(UPLOAD_FOLDER, 'output')
+LIVE_DIR = os.path.join(UPLOAD_FOLDER, 'live')
+# 服务端本地视频目录（/api/process_path 只允许访问该目录下的文件）
+DATA_DIR = '/workspace/data'
 ALLOWED_EXTENSIONS = {'mp4'}
 PORT = 6001
+# 并行处理任务的 worker 线程数（共享一块 GPU 时保持 1）
+WORKER_THREADS = 1
+# 同时运行的直播流会话数上限（与文件任务共用推理后端）
+LIVE_MAX_SESSIONS = int(os.environ.get('VSR_LIVE_MAX_SESSIONS', 1))
+# 已结束的直播会话（及其 HLS 目录）保留的时间（秒），过期后删除
+LIVE_TTL = float(os.environ.get('VSR_LIVE_TTL', 3600))
+LIVE_REAP_INTERVAL = 60  # 检查过期会话的间隔（秒）
 
-for path in [UPLOAD_FOLDER, INPUT_DIR, OUTPUT_DIR]:
-    mkdir_or_exist(path)
+for path in [UPLOAD_FOLDER, INPUT_DIR, OUTPUT_DIR, LIVE_DIR]:
+    os.makedirs(path, exist_ok=True)
 
 # --- 任务进度存储 ---
 task_progress = {}  # task_id: {"progress": 0, "status": "pending", "result": None}
+# 记入 /metrics 阶段耗时直方图的状态（queued 为排队等待时间）
+TIMED_STAGES = ('queued', 'preprocessing', 'sr_inference', 'merging_video', 'calculating_psnr')
+
+def set_stage(task_id, stage):
+    """
+    切换任务状态，并把上一阶段的耗时记入 vsr_stage_duration_seconds
+    Returns:
+        float: 上一阶段的耗时（秒）
+    """
+    task = task_progress[task_id]
+    now = time.time()
+    elapsed = now - task.get("stage_start", now)
+    # 长视频分段的子任务不计入：其耗时已包含在父任务的阶段中
+    if task["status"] in TIMED_STAGES and not task.get("subtask"):
+        STAGE_SECONDS.observe(elapsed, stage=task["status"])
+    task["trace"].stage(stage if stage in TIMED_STAGES else None)
+    if task.get("profiler") is not None:
+        task["profiler"].stage(stage if stage in TIMED_STAGES else None)
+    task["status"] = stage
+    task["stage_start"] = now
+    return elapsed
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# --- 保持不改动 ---
-def frames_to_video(frame_folder, output_path, fps=30, codec='libx264', crf=18, preset='medium'):
-    frames = sorted(glob.glob(os.path.join(frame_folder, '*')))
-    if len(frames) == 0:
-        raise ValueError("帧序列为空")
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as f:
-        for frame in frames:
-            f.write(f"file '{os.path.abspath(frame)}'\n")
-        list_file = f.name
-    cmd = [
-        'ffmpeg', '-y', '-r', str(fps), '-f', 'concat', '-safe', '0', '-i', list_file,
-        '-c:v', codec, '-crf', str(crf), '-preset', preset, '-pix_fmt', 'yuv420p',
-        output_path
-    ]
-    subprocess.run(cmd, check=True)
-    os.remove(list_file)
-
-def video_sr(input_path, output_path, max_seq_len=10):
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    checkpoint_file = '/workspace/models/basicvsr_plusplus_c64n7_8x1_600k_reds4_20210217-db622b2f.pth'
-    editor = MMagicInferencer(
-        model_name='basicvsr_pp',
-        device=device,
-        model_ckpt=checkpoint_file
-    )
-    # editor = MMagicInferencer(model_name='basicvsr_pp',device=device)
-    editor.inferencer.inferencer.extra_parameters['max_seq_len'] = max_seq_len
-    torch.cuda.empty_cache()
-    with torch.autocast(device_type=device, dtype=torch.float16 if device == "cuda" else torch.float32):
-        editor.infer(video=input_path, result_out_dir=output_path)
-    torch.cuda.empty_cache()
-
-def get_video_info(video_path):
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = frame_count / fps
-    cap.release()
-    return {
-        "size": os.path.getsize(video_path),
-        "duration": duration,
-        "resolution": f"{width}x{height}"
-    }
+def parse_max_seq_len(params):
+    # 未指定时返回 None，由服务端按内存模型自动选择
+    value = params.get('max_seq_len')
+    if value in (None, ''):
+        return None
+    value = int(value)
+    if value < 1:
+        raise ValueError("max_seq_len must be >= 1")
+    return value
+
+def parse_profile(params):
+    # profile=1 时对该任务做性能剖析（torch.profiler + cProfile）
+    return str(params.get('profile', '')).lower() in ('1', 'true', 'yes')
+
+def video_sr(input_path, output_path, max_seq_len=10, backend_name=None):
+    # 推理后端由环境变量 VSR_BACKEND 选择（默认 mmagic），过载降级时由档位指定；模型只在首次调用时加载
+    get_backend(backend_name).process_video(input_path, output_path, max_seq_len=max_seq_len)
 
 # --- 预估时间计算函数 ---
 # 经验参数（可根据实际测试数据调整）
@@ -95,34 +106,162 @@ def estimate_sr_time(width, height, frame_count):
     T = T_init + k * pixels * frame_count
     return T
 
+def estimate_task_time(input_path, start=None, end=None):
+    """提交任务时估算完整档位的处理时间（按时间段处理时只计片段及两侧上下文的帧数）"""
+    probe = probe_video(input_path)  # 结果被缓存，任务处理时直接复用
+    fps, width, height, frame_count = probe.fps, probe.width, probe.height, probe.frame_count
+    if end is not None and fps > 0:
+        frame_count = min(frame_count, int((end - start + 2 * RANGE_CONTEXT_SEC) * fps))
+    return estimate_sr_time(width, height, frame_count)
+
+# --- 任务队列与准入控制 ---
+def tier_available(name):
+    # 整网 fp16 档位只在 GPU + mmagic 后端下可用（模型预热完成前不可用，避免在请求线程里导入 torch）
+    if name == 'half':
+        if BACKEND != 'mmagic' or not readiness["ready"]:
+            return False
+        import torch
+        return torch.cuda.is_available()
+    return True
+
+admission = AdmissionController(workers=WORKER_THREADS, tier_available=tier_available)
+memory_model = MemoryModel()
+task_queue = queue.Queue()
+REGISTRY.register(Gauge('vsr_queue_depth', 'Tasks waiting in the queue', function=admission.queue_depth))
+REGISTRY.register(Gauge('vsr_active_jobs', 'Tasks being processed', function=admission.active_jobs))
+live_sessions = {}  # session_id: LiveSession
+live_lock = threading.Lock()
+live_starting = 0  # 已预留名额、正在创建的会话数（创建会话要探测流、启动进程，不在 live_lock 内进行）
+REGISTRY.register(Gauge('vsr_live_sessions', 'Running live stream sessions',
+                        function=lambda: sum(s.state == "running" for s in list(live_sessions.values()))))
+
+def reap_live_sessions():
+    # 定期删除结束超过 LIVE_TTL 的直播会话及其 HLS 目录
+    while True:
+        time.sleep(LIVE_REAP_INTERVAL)
+        now = time.time()
+        with live_lock:
+            expired = [sid for sid, s in live_sessions.items() if s.finished_at is not None and now - s.finished_at > LIVE_TTL]
+            for session_id in expired:
+                shutil.rmtree(live_sessions.pop(session_id).output_dir, ignore_errors=True)
+        for session_id in expired:
+            print(f"🧹 直播会话 {session_id} 已过期，删除 HLS 输出")
+
+threading.Thread(target=reap_live_sessions, daemon=True).start()
+
+def register_task(task_id, tier, subtask=False):
+    # 登记任务的进度和 trace（长视频分段的子任务不经过队列和准入控制，也通过这里登记，subtask=True）
+    trace = tracing.TaskTrace(task_id)
+    trace.stage("queued")
+    task_progress[task_id] = {"progress": 0, "status": "queued", "result": None, "tier": tier, "stage_start": time.time(),
+                              "trace": trace, "subtask": subtask}
+
+def submit_task(task_id, args, kwargs, estimate, deadline=None, policy='degrade'):
+    """
+    准入检查后把任务放入队列
+    Returns:
+        tuple: (档位名称, 预测完成时间(秒))
+    Raises:
+        Overloaded: 无法按时完成且不允许降级
+    """
+    tier, _, _, predicted = admission.admit(task_id, estimate, deadline=deadline, policy=policy)
+    register_task(task_id, tier)
+    kwargs = dict(kwargs, tier=tier)
+    task_queue.put((task_id, args, kwargs))
+    return tier, predicted
+
+def task_worker():
+    while True:
+        task_id, args, kwargs = task_queue.get()
+        admission.start(task_id)
+        try:
+            # 激活任务的 trace，推理后端内部的窗口推理/写帧等步骤也会记录到该任务的时间线
+            with tracing.activate(task_progress[task_id]["trace"]):
+                process_video_task(task_id, *args, **kwargs)
+        finally:
+            admission.finish(task_id)
+            task_queue.task_done()
+
+workers = [threading.Thread(target=task_worker, daemon=True) for _ in range(WORKER_THREADS)]
+for worker in workers:
+    worker.start()
+
+# --- 启动预热 ---
+# HTTP 服务先启动，torch/mmagic 的导入和模型构建放到后台线程，完成前 /readyz 返回 503
+STARTED_AT = time.time()
+readiness = {"ready": False, "status": "loading", "error": None, "load_time": None}
+
+def warmup():
+    try:
+        get_backend()
+        readiness.update(ready=True, status="ready", load_time=round(time.time() - STARTED_AT, 1))
+        print(f"✅ 推理后端 {BACKEND} 加载完成，耗时 {readiness['load_time']}s")
+    except Exception as e:
+        readiness.update(status="error", error=str(e))
+        print(f"❌ 推理后端 {BACKEND} 加载失败: {e}")
+
+threading.Thread(target=warmup, daemon=True).start()
+
+def overloaded_response(e):
+    response = jsonify({"code": 503, "message": "Server overloaded, deadline cannot be met", "retry_after": e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
 # --- 后台任务通用函数 ---
-def process_video_task(task_id, input_path, max_seq_len=10, is_display=False, gt_video_path=None, host="127.0.0.1:"+str(PORT)):
+def process_video_task(task_id, input_path, max_seq_len=None, is_display=False, gt_video_path=None, host="127.0.0.1:"+str(PORT), start=None, end=None, tier='full', profile=False, segment=None):
+    # segment: 长视频分段的子任务参数 {"head", "keep", "fps"}，超分后丢弃开头 head 个重叠帧、保留 keep 帧，按原视频帧率合成
     try:
+        if profile:
+            task_progress[task_id]["profiler"] = TaskProfiler(task_id, OUTPUT_DIR)
         task_progress[task_id]["progress"] = 0
-        task_progress[task_id]["status"] = "uploaded"
+        set_stage(task_id, "uploaded")
 
         # 预处理阶段
         task_progress[task_id]["progress"] = 5
-        task_progress[task_id]["status"] = "preprocessing"
+        set_stage(task_id, "preprocessing")
+        # 长视频：在关键帧处分段，每段作为子任务超分后再拼接（按时间段处理和画质对比任务不分段）
+        if segment is None and end is None and not is_display:
+            with tracing.span('plan_segments'):
+                segments = plan_segments(probe_video(input_path))
+            if segments:
+                process_segmented_task(task_id, input_path, segments, max_seq_len, host, tier, profile)
+                return
+        # 按时间段截取：只对 [start, end] 片段（两侧保留少量上下文）做超分
+        sr_input_path = input_path
+        if end is not None:
+            sr_input_path = os.path.join(INPUT_DIR, f"clip_{task_id}.mp4")
+            with tracing.span('cut_video_range'):
+                head_frames, keep_frames = cut_video_range(input_path, sr_input_path, start, end)
         # 估算超分处理时间
-        cap = cv2.VideoCapture(input_path)
-        width  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        cap.release() 
-        estimated_time = estimate_sr_time(width, height, frame_count)
+        with tracing.span('probe'):
+            probe = probe_video(sr_input_path)
+            width, height = probe.width, probe.height
+        # 帧冗余检测：只对不重复的帧做超分，重复帧复用之前的输出
+        unique_folder = os.path.join(OUTPUT_DIR, f"unique_{task_id}")
+        with tracing.span('extract_unique_frames'):
+            index_map = extract_unique_frames(sr_input_path, unique_folder)
+        unique_count = index_map[-1] + 1
+        skipped_frames = len(index_map) - unique_count
+        # 降级档位：使用对应的推理后端，预估耗时按档位系数缩放
+        _, tier_backend, time_factor = get_tier(tier)
+        estimated_time = estimate_sr_time(width, height, unique_count) * time_factor
+        # 按内存模型选择窗口长度：未指定时自动选最大安全值，指定值超出安全范围时截断
+        with tracing.span('select_seq_len'):
+            max_seq_len, seq_len_clamped = memory_model.select_seq_len(get_backend(tier_backend), width, height, max_seq_len)
 
         # video_sr 推理
-        task_progress[task_id]["status"] = "sr_inference"
+        set_stage(task_id, "sr_inference")
         output_folder = os.path.join(OUTPUT_DIR, f"sr_{task_id}")
         os.makedirs(output_folder, exist_ok=True)
-        # 模拟推理进度函数
+        # 模拟推理进度函数（推理结束后通过 sim_stop 立即退出，不再等满预估时间）
+        sim_stop = threading.Event()
         def simulate_sr_progress(task_id, start=5, end=88, duration_estimate=30, interval=1):
-            steps = int(duration_estimate / interval)
+            steps = max(1, int(duration_estimate / interval))
             progress = start
             increment = (end - start) / steps
             for _ in range(steps):
-                time.sleep(interval)
+                if sim_stop.wait(interval):
+                    break
                 progress += increment
                 # 只更新比当前值更大的进度
                 task_progress[task_id]["progress"] = max(task_progress[task_id]["progress"], min(int(progress), end))
@@ -130,40 +269,70 @@ def process_video_task(task_id, input_path, max_seq_len=10, is_display=False, gt
         sim_thread = threading.Thread(target=simulate_sr_progress, args=(task_id,), kwargs={"duration_estimate": estimated_time})
         sim_thread.start()
         # 执行真实模型推理
-        video_sr(input_path, output_folder, max_seq_len=max_seq_len)
+        if skipped_frames > 0:
+            unique_sr_folder = os.path.join(OUTPUT_DIR, f"sr_unique_{task_id}")
+            with tracing.span('video_sr', max_seq_len=max_seq_len, frames=unique_count):
+                video_sr(unique_folder, unique_sr_folder, max_seq_len=max_seq_len, backend_name=tier_backend)
+            with tracing.span('expand_sr_frames'):
+                expand_sr_frames(unique_sr_folder, index_map, output_folder)
+            shutil.rmtree(unique_sr_folder, ignore_errors=True)
+        else:
+            with tracing.span('video_sr', max_seq_len=max_seq_len, frames=len(index_map)):
+                video_sr(sr_input_path, output_folder, max_seq_len=max_seq_len, backend_name=tier_backend)
+        shutil.rmtree(unique_folder, ignore_errors=True)
+        if end is not None:
+            # 去掉两侧上下文帧，只保留请求的时间段
+            with tracing.span('trim_frames'):
+                trim_frames(output_folder, head_frames, keep_frames)
+            os.remove(sr_input_path)
+        elif segment is not None:
+            # 去掉两侧的重叠帧，只保留本段负责的帧
+            with tracing.span('trim_frames'):
+                trim_frames(output_folder, segment["head"], segment["keep"])
         # 推理完成
         task_progress[task_id]["progress"] = 90
+        sim_stop.set()
         sim_thread.join()  # 确保模拟线程结束
 
         # frames_to_video 转码
-        task_progress[task_id]["status"] = "merging_video"
-        cap = cv2.VideoCapture(input_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        cap.release()
+        inference_time = set_stage(task_id, "merging_video")
+        FRAMES_PROCESSED.inc(len(index_map))
+        INFERENCE_FPS.set(len(index_map) / max(inference_time, 1e-6))
+        fps = segment["fps"] if segment is not None else probe_video(input_path).fps
         output_h264_path = os.path.join(OUTPUT_DIR, f"{task_id}_output.mp4")
-        frames_to_video(output_folder, output_h264_path, fps=fps)
+        with tracing.span('frames_to_video'):
+            frames_to_video(output_folder, output_h264_path, fps=fps)
         if is_display and gt_video_path:
             task_progress[task_id]["progress"] = 95
-            task_progress[task_id]["status"] = "calculating_psnr"
+            set_stage(task_id, "calculating_psnr")
         else:
             task_progress[task_id]["progress"] = 100
-            task_progress[task_id]["status"] = "done"
+            set_stage(task_id, "done")
 
         # 构造结果
         result = {
             "file_url": f"http://{host}/uploads/output/{os.path.basename(output_h264_path)}",
+            "skipped_frames": skipped_frames,
+            "tier": tier,
+            "max_seq_len": max_seq_len,
+            "max_seq_len_clamped": seq_len_clamped,
         }
+        if end is not None:
+            result["time_range"] = [start, end]
 
         # 如果是 upload_video_display，还返回视频信息和 PSNR
         if is_display and gt_video_path:
-            gt_info = get_video_info(gt_video_path)
-            low_res_info = get_video_info(input_path)
-            sr_info = get_video_info(output_h264_path) # 不是 output_folder
-            low_res_psnr = calculate_psnr(gt_video_path, input_path)
-            sr_psnr = calculate_psnr(gt_video_path, output_folder)
+            with tracing.span('get_video_info'):
+                gt_info = get_video_info(gt_video_path)
+                low_res_info = get_video_info(input_path)
+                sr_info = get_video_info(output_h264_path) # 不是 output_folder
+            with tracing.span('calculate_psnr', target='low_res'):
+                low_res_psnr = calculate_psnr(gt_video_path, input_path)
+            with tracing.span('calculate_psnr', target='sr'):
+                sr_psnr = calculate_psnr(gt_video_path, output_folder)
 
             task_progress[task_id]["progress"] = 100
-            task_progress[task_id]["status"] = "done"
+            set_stage(task_id, "done")
             result.update({
                 "gt_video_info": gt_info,
                 "low_res_video_info": low_res_info,
@@ -172,10 +341,79 @@ def process_video_task(task_id, input_path, max_seq_len=10, is_display=False, gt
                 "sr_psnr": sr_psnr
             })
 
+        if profile:
+            # 剖析产物在切换到 done 时已保存到输出目录
+            result["profile"] = {kind: f"http://{host}/uploads/output/{name}"
+                                 for kind, name in task_progress[task_id]["profiler"].files.items()}
+
         task_progress[task_id]["result"] = result
+        if segment is None:
+            TASKS_TOTAL.inc(tier=tier, outcome="done")
 
     except Exception as e:
         task_progress[task_id]["status"] = f"error: {str(e)}"
+        task_progress[task_id]["trace"].stage(None)
+        if task_progress[task_id].get("profiler") is not None:
+            task_progress[task_id]["profiler"].stage(None)
+        if segment is None:
+            TASKS_TOTAL.inc(tier=tier, outcome="error")
+
+def process_segmented_task(task_id, input_path, segments, max_seq_len, host, tier, profile):
+    """
+    长视频分段处理：逐段截取（关键帧对齐、不重编码）并作为子任务超分、合成，最后用 concat 拼接成一个输出
+    子任务 ID 为 <task_id>_seg<序号>，有各自的进度和 trace；父任务的进度按子任务进度汇总（见 /api/progress）
+    出错时抛出异常，由 process_video_task 统一记录
+    """
+    probe = probe_video(input_path)
+    subtasks = [f"{task_id}_seg{seg['index']:03d}" for seg in segments]
+    task_progress[task_id]["subtasks"] = subtasks
+    set_stage(task_id, "sr_inference")
+    segment_outputs = []
+    skipped_frames = 0
+    seq_lens = []
+    try:
+        for seg, sub_id in zip(segments, subtasks):
+            seg_path = os.path.join(INPUT_DIR, f"{sub_id}.mp4")
+            with tracing.span('cut_segment', index=seg["index"], frames=seg["cut_end"] - seg["cut_start"]):
+                cut_segment(input_path, seg_path, probe, seg)
+            register_task(sub_id, tier, subtask=True)
+            with tracing.span('segment', index=seg["index"], frames=seg["keep"]):
+                with tracing.activate(task_progress[sub_id]["trace"]):
+                    process_video_task(sub_id, seg_path, max_seq_len, host=host, tier=tier,
+                                       segment={"head": seg["head"], "keep": seg["keep"], "fps": probe.fps})
+            os.remove(seg_path)
+            sub = task_progress[sub_id]
+            if sub["status"] != "done":
+                raise RuntimeError(f"segment {seg['index']} failed: {sub['status']}")
+            segment_outputs.append(os.path.join(OUTPUT_DIR, f"{sub_id}_output.mp4"))
+            skipped_frames += sub["result"]["skipped_frames"]
+            seq_lens.append((sub["result"]["max_seq_len"], sub["result"]["max_seq_len_clamped"]))
+
+        task_progress[task_id]["progress"] = 90
+        set_stage(task_id, "merging_video")
+        output_h264_path = os.path.join(OUTPUT_DIR, f"{task_id}_output.mp4")
+        with tracing.span('concat_videos', segments=len(segment_outputs)):
+            concat_videos(segment_outputs, output_h264_path)
+    finally:
+        # 子任务的输出只是中间结果，对外只提供拼接后的视频
+        for path in segment_outputs:
+            os.remove(path)
+    task_progress[task_id]["progress"] = 100
+    set_stage(task_id, "done")
+
+    result = {
+        "file_url": f"http://{host}/uploads/output/{os.path.basename(output_h264_path)}",
+        "skipped_frames": skipped_frames,
+        "tier": tier,
+        "max_seq_len": min(seq_len for seq_len, _ in seq_lens),
+        "max_seq_len_clamped": any(clamped for _, clamped in seq_lens),
+        "segments": len(segments),
+    }
+    if profile:
+        result["profile"] = {kind: f"http://{host}/uploads/output/{name}"
+                             for kind, name in task_progress[task_id]["profiler"].files.items()}
+    task_progress[task_id]["result"] = result
+    TASKS_TOTAL.inc(tier=tier, outcome="done")
 
 # --- upload_video 接口 ---
 @app.route('/api/upload_video', methods=['POST'])
@@ -189,19 +427,85 @@ def upload_video():
         if not allowed_file(file.filename):
             return jsonify({"code": 400, "message": "Invalid file type, only MP4 is allowed"}), 400
 
-        max_seq_len = int(request.form.get('max_seq_len', 10))
+        params = request.form
+        try:
+            max_seq_len = parse_max_seq_len(params)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid max_seq_len: {str(e)}"}), 400
+        try:
+            start, end = parse_time_range(params)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid time range: {str(e)}"}), 400
+        try:
+            deadline, policy = parse_admission_params(params)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid admission parameters: {str(e)}"}), 400
+        task_id = str(uuid.uuid4())
+        # 文件名带上任务 ID，避免同一秒内的多个上传互相覆盖
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        input_filename = f"input_{timestamp}.mp4"
+        input_filename = f"input_{timestamp}_{task_id[:8]}.mp4"
         input_path = os.path.join(INPUT_DIR, input_filename)
         file.save(input_path)
+        UPLOADED_BYTES.inc(os.path.getsize(input_path))
+
+        # --- 准入检查后加入任务队列 ---
+        host = request.host  # 获取host在主线程中
+        try:
+            tier, predicted = submit_task(task_id, (input_path, max_seq_len),
+                                          {"host": host, "start": start, "end": end, "profile": parse_profile(params)},
+                                          estimate_task_time(input_path, start, end), deadline, policy)
+        except Overloaded as e:
+            os.remove(input_path)
+            return overloaded_response(e)
+
+        return jsonify({"code": 200, "task_id": task_id, "tier": tier, "estimated_time": round(predicted, 1),
+                        "message": "Upload successful, processing started"})
+
+    except Exception as e:
+        return jsonify({"code": 500, "message": f"Server error: {str(e)}"}), 500
 
-        # --- 启动后台线程 ---
+# --- process_path 接口：处理服务端本地视频（如挂载的 /workspace/data），可按时间段截取 ---
+@app.route('/api/process_path', methods=['POST'])
+def process_path():
+    try:
+        params = request.get_json(silent=True) or request.form
+        rel_path = params.get('path')
+        if not rel_path:
+            return jsonify({"code": 400, "message": "No path"}), 400
+        data_root = os.path.realpath(DATA_DIR)
+        input_path = os.path.realpath(os.path.join(data_root, rel_path))
+        if not input_path.startswith(data_root + os.sep):
+            return jsonify({"code": 400, "message": "Path is outside the data directory"}), 400
+        if not os.path.isfile(input_path):
+            return jsonify({"code": 404, "message": "File not found"}), 404
+        if not allowed_file(input_path):
+            return jsonify({"code": 400, "message": "Invalid file type, only MP4 is allowed"}), 400
+
+        try:
+            max_seq_len = parse_max_seq_len(params)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid max_seq_len: {str(e)}"}), 400
+        try:
+            start, end = parse_time_range(params)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid time range: {str(e)}"}), 400
+        try:
+            deadline, policy = parse_admission_params(params)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid admission parameters: {str(e)}"}), 400
+
+        # --- 准入检查后加入任务队列 ---
         task_id = str(uuid.uuid4())
-        task_progress[task_id] = {"progress": 0, "status": "pending", "result": None}
         host = request.host  # 获取host在主线程中
-        threading.Thread(target=process_video_task, args=(task_id, input_path, max_seq_len), kwargs={"host": host}).start()
+        try:
+            tier, predicted = submit_task(task_id, (input_path, max_seq_len),
+                                          {"host": host, "start": start, "end": end, "profile": parse_profile(params)},
+                                          estimate_task_time(input_path, start, end), deadline, policy)
+        except Overloaded as e:
+            return overloaded_response(e)
 
-        return jsonify({"code": 200, "task_id": task_id, "message": "Upload successful, processing started"})
+        return jsonify({"code": 200, "task_id": task_id, "tier": tier, "estimated_time": round(predicted, 1),
+                        "message": "Processing started"})
 
     except Exception as e:
         return jsonify({"code": 500, "message": f"Server error: {str(e)}"}), 500
@@ -217,18 +521,22 @@ def upload_video_display():
         if gt_video.filename == '' or low_res_video.filename == '':
             return jsonify({"code": 400, "message": "No selected video"}), 400
 
-        max_seq_len = int(request.form.get('max_seq_len', 10))
+        try:
+            max_seq_len = parse_max_seq_len(request.form)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid max_seq_len: {str(e)}"}), 400
+        task_id = str(uuid.uuid4())
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        gt_video_path = os.path.join(INPUT_DIR, f"gt_{timestamp}.mp4")
-        low_res_video_path = os.path.join(INPUT_DIR, f"low_res_{timestamp}.mp4")
+        gt_video_path = os.path.join(INPUT_DIR, f"gt_{timestamp}_{task_id[:8]}.mp4")
+        low_res_video_path = os.path.join(INPUT_DIR, f"low_res_{timestamp}_{task_id[:8]}.mp4")
         gt_video.save(gt_video_path)
         low_res_video.save(low_res_video_path)
+        UPLOADED_BYTES.inc(os.path.getsize(gt_video_path) + os.path.getsize(low_res_video_path))
 
-        # --- 启动后台线程 ---
-        task_id = str(uuid.uuid4())
-        task_progress[task_id] = {"progress": 0, "status": "pending", "result": None}
+        # --- 加入任务队列（画质对比任务始终使用完整档位） ---
         host = request.host  # 获取host在主线程中
-        threading.Thread(target=process_video_task, args=(task_id, low_res_video_path, max_seq_len, True, gt_video_path), kwargs={"host": host}).start()
+        submit_task(task_id, (low_res_video_path, max_seq_len, True, gt_video_path), {"host": host},
+                    estimate_task_time(low_res_video_path))
 
         return jsonify({"code": 200, "task_id": task_id, "message": "Upload successful, processing started"})
 
@@ -240,6 +548,11 @@ def upload_video_display():
 def get_progress(task_id):
     if task_id not in task_progress:
         return jsonify({"code": 404, "message": "Task not found"}), 404
+    task = task_progress[task_id]
+    if task.get("subtasks") and task["status"] == "sr_inference":
+        # 分段任务：推理阶段的进度按各子任务的进度汇总（5% ~ 90%）
+        done = sum(task_progress[sub]["progress"] for sub in task["subtasks"] if sub in task_progress)
+        task["progress"] = max(task["progress"], 5 + 85 * done / (100 * len(task["subtasks"])))
     return jsonify({
         "code": 200,
         "progress": round(task_progress[task_id]["progress"], 2),
@@ -247,9 +560,120 @@ def get_progress(task_id):
         "result": task_progress[task_id].get("result")
     })
 
+# --- 任务耗时追踪接口（Chrome trace JSON） ---
+@app.route('/api/tasks/<task_id>/trace', methods=['GET'])
+def get_trace(task_id):
+    if task_id not in task_progress:
+        return jsonify({"code": 404, "message": "Task not found"}), 404
+    return jsonify(task_progress[task_id]["trace"].to_chrome())
+
 @app.route('/uploads/output/<path:filename>')
 def serve_output(filename):
-    return send_from_directory(OUTPUT_DIR, filename)
+    response = send_from_directory(OUTPUT_DIR, filename)
+    SERVED_BYTES.inc(response.content_length or 0)
+    return response
+
+# --- 直播流超分接口：拉流超分后以 HLS 发布 ---
+@app.route('/api/live/start', methods=['POST'])
+def start_live():
+    try:
+        params = request.get_json(silent=True) or request.form
+        source = params.get('source') or ''
+        path = params.get('path') or ''
+        if source:
+            if not is_stream_url(source):
+                return jsonify({"code": 400, "message": "Unsupported stream URL"}), 400
+            if not stream_url_allowed(source):
+                return jsonify({"code": 400, "message": "Stream scheme or host is not allowed"}), 400
+            realtime = False
+        elif path:
+            # 服务端本地文件按实时速度读取，当作直播源（用于测试和回放）
+            data_root = os.path.realpath(DATA_DIR)
+            source = os.path.realpath(os.path.join(data_root, path))
+            if not source.startswith(data_root + os.sep):
+                return jsonify({"code": 400, "message": "Path is outside the data directory"}), 400
+            if not os.path.isfile(source):
+                return jsonify({"code": 404, "message": "File not found"}), 404
+            realtime = True
+        else:
+            return jsonify({"code": 400, "message": "No source or path"}), 400
+
+        options = {}
+        try:
+            for key, cast in (('window', int), ('context', int), ('latency', float)):
+                if params.get(key) not in (None, ''):
+                    options[key] = cast(params.get(key))
+            if options.get('window', 1) < 1 or options.get('context', 0) < 0 or options.get('latency', 1) <= 0:
+                raise ValueError("window must be >= 1, context >= 0, latency > 0")
+            if params.get('policy'):
+                if params.get('policy') not in LIVE_POLICIES:
+                    raise ValueError(f"policy must be one of {', '.join(LIVE_POLICIES)}")
+                options['policy'] = params.get('policy')
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid live parameters: {str(e)}"}), 400
+
+        global live_starting
+        with live_lock:
+            if sum(s.state == "running" for s in live_sessions.values()) + live_starting >= LIVE_MAX_SESSIONS:
+                return jsonify({"code": 503, "message": "Too many live sessions"}), 503
+            live_starting += 1
+        session_id = str(uuid.uuid4())
+        output_dir = os.path.join(LIVE_DIR, session_id)
+        session = None
+        try:
+            session = LiveSession(session_id, source, output_dir, realtime=realtime, **options)
+        except (RuntimeError, OSError, ValueError) as e:  # 探测/打开流失败、启动编码器失败
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return jsonify({"code": 400, "message": f"Cannot open source: {str(e)}"}), 400
+        finally:
+            with live_lock:
+                live_starting -= 1
+                if session is not None:
+                    live_sessions[session_id] = session
+        print(f"📡 直播会话 {session_id} 开始: {source}")
+        return jsonify({"code": 200, "session_id": session_id,
+                        "playlist": f"http://{request.host}/live/{session_id}/index.m3u8",
+                        "message": "Live session started"})
+
+    except Exception as e:
+        return jsonify({"code": 500, "message": f"Server error: {str(e)}"}), 500
+
+@app.route('/api/live/<session_id>', methods=['GET'])
+def live_status(session_id):
+    if session_id not in live_sessions:
+        return jsonify({"code": 404, "message": "Session not found"}), 404
+    return jsonify(dict(live_sessions[session_id].status(), code=200))
+
+@app.route('/api/live/<session_id>/stop', methods=['POST'])
+def stop_live(session_id):
+    if session_id not in live_sessions:
+        return jsonify({"code": 404, "message": "Session not found"}), 404
+    live_sessions[session_id].stop()
+    return jsonify({"code": 200, "message": "Live session stopping"})
+
+@app.route('/live/<session_id>/<path:filename>')
+def serve_live(session_id, filename):
+    response = send_from_directory(os.path.join(LIVE_DIR, secure_filename(session_id)), filename)
+    response.headers['Cache-Control'] = 'no-cache'  # 播放列表持续更新
+    SERVED_BYTES.inc(response.content_length or 0)
+    return response
+
+# --- 存活/就绪探针 ---
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # 存活：HTTP 能响应且任务 worker 线程都在运行（模型是否加载完成不影响存活）
+    alive = all(worker.is_alive() for worker in workers)
+    return jsonify({"status": "alive" if alive else "worker_dead", "uptime": round(time.time() - STARTED_AT, 1)}), (200 if alive else 500)
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # 就绪：默认推理后端已加载，可以接收任务
+    return jsonify(readiness), (200 if readiness["ready"] else 503)
+
+# --- Prometheus 指标接口 ---
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=PORT)
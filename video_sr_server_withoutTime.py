@@ -2,13 +2,11 @@ from flask import Flask, request, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
 import os
 import datetime
-import torch
-from mmengine import mkdir_or_exist
-from mmagic.apis import MMagicInferencer
-import cv2
 import numpy as np
 import subprocess, tempfile, glob, shutil
 from psnr_calculator import calculate_psnr  # 导入PSNR计算函数
+from sr_backends import get_backend
+from video_io import get_video_info, probe_video
 
 
 app = Flask(__name__)
@@ -22,7 +20,7 @@ PORT = 6001
 
 # 确保目录存在
 for path in [UPLOAD_FOLDER, INPUT_DIR, OUTPUT_DIR]:
-    mkdir_or_exist(path)
+    os.makedirs(path, exist_ok=True)
 
 
 def allowed_file(filename):
@@ -75,25 +73,10 @@ def frames_to_video(frame_folder, output_path, fps=30, codec='libx264', crf=18,
 
 
 def video_sr(input_path, output_path, max_seq_len=10):
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"使用设备: {device}")
-
-    checkpoint_file = '/workspace/models/basicvsr_plusplus_c64n7_8x1_600k_reds4_20210217-db622b2f.pth'
-
-    editor = MMagicInferencer(
-        model_name='basicvsr_pp',
-        device=device,
-        model_ckpt=checkpoint_file
-    )
-    # 让推理器短序列工作，避免显存暴涨
-    editor.inferencer.inferencer.extra_parameters['max_seq_len'] = max_seq_len
-
-    # 2) 推理到临时目录
-    torch.cuda.empty_cache()
-    # 启用混合精度加速
-    with torch.autocast(device_type=device, dtype=torch.float16 if device == "cuda" else torch.float32):
-        editor.infer(video=input_path, result_out_dir=output_path)
-    torch.cuda.empty_cache()
+    # 推理后端由环境变量 VSR_BACKEND 选择（默认 mmagic），模型只在首次调用时加载
+    backend = get_backend()
+    print(f"推理后端: {backend.name}")
+    backend.process_video(input_path, output_path, max_seq_len=max_seq_len)
 
 
 @app.route('/api/upload_video', methods=['POST'])
@@ -124,8 +107,7 @@ def upload_video():
         # 执行超分辨率推理
         video_sr(input_path, output_path, max_seq_len=max_seq_len)
         # 然后进行转码，保持帧率不变
-        cap = cv2.VideoCapture(input_path)
-        frames_to_video(output_path, output_path_h264, fps = cap.get(cv2.CAP_PROP_FPS))
+        frames_to_video(output_path, output_path_h264, fps = probe_video(input_path).fps)
 
         # 返回结果
         file_url = f"http://{request.host}/uploads/output/{output_h264_filename}"
@@ -172,21 +154,6 @@ def upload_video_display():
         # 获取max_seq_len参数
         max_seq_len = int(request.form.get('max_seq_len', 10))
 
-        # 获取视频信息
-        def get_video_info(video_path):
-            cap = cv2.VideoCapture(video_path)
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            duration = frame_count / fps
-            cap.release()
-            return {
-                "size": os.path.getsize(video_path),
-                "duration": duration,
-                "resolution": f"{width}x{height}"
-            }
-
         # 获取GT视频和低清视频的信息
         print("获取视频信息...")
         gt_video_info = get_video_info(gt_video_path)
@@ -213,8 +180,7 @@ def upload_video_display():
         print(f"超分处理完成: {output_filename}")
 
         # 然后进行转码，保持帧率不变
-        cap = cv2.VideoCapture(low_res_video_path)
-        frames_to_video(output_path, output_path_h264, fps = cap.get(cv2.CAP_PROP_FPS))
+        frames_to_video(output_path, output_path_h264, fps = probe_video(low_res_video_path).fps)
         print(f"视频转码完成: {output_h264_filename}")
 
         # 计算超分辨率视频的信息和文件链接